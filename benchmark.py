@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+直播源检测工具 - 性能基准测试
+在本机启动模拟IPTV源站（可配置延迟、超时、404、慢速响应体、HLS播放列表、重定向链），
+生成1千~100万条的合成播放列表，测量播放列表解析速度，以及各检测方法的每秒检测数、
+p50/p99响应时间和峰值内存，便于用数字发现性能退化。
+
+用法：
+    python benchmark.py
+    python benchmark.py --parse-sizes 1000000 --probe-sizes 10000 --methods HEAD GET
+    python benchmark.py --json 基准.json --compare 上次基准.json
+每项测量在单独的进程中运行，峰值内存互不影响；模拟源站也在单独的进程中运行，不占用被测进程的CPU。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from stream_checker import CHECK_METHODS, PlaylistParser, ProbeEngine, open_playlist
+
+# 合成播放列表中各类地址的比例：正常、高延迟、404、超时、慢速响应体、重定向链、HLS
+DEFAULT_MIX = {'ok': 70, 'slow': 10, '404': 8, 'timeout': 2, 'drip': 3, 'redirect': 4, 'hls': 3}
+# 模拟的TS分片数据（188字节的TS包，以0x47同步字节开头）
+TS_PACKET = b'\x47' + b'\x00' * 187
+TS_BODY = TS_PACKET * 64
+REASONS = {200: 'OK', 302: 'Found', 404: 'Not Found'}
+
+
+# ==================== 模拟IPTV源站 ====================
+
+class FakeOrigin:
+    """模拟IPTV源站：HTTP/1.1 keep-alive，在多个端口上监听（每个端口相当于一个主机）
+
+    路径决定响应：
+    /ok/N            延迟latency毫秒后返回200和一段TS数据
+    /slow/N          延迟slow_latency毫秒后返回200
+    /404/N           返回404
+    /timeout/N       读取请求后不响应，直到客户端断开
+    /drip/N          立即返回响应头，响应体每drip_interval秒发送一个TS包
+    /redirect/K/N    K次302重定向后到达/ok/N
+    /hls/N/index.m3u8、/hls/N/media.m3u8、/hls/N/segK.ts  主播放列表、媒体播放列表和分片
+    """
+
+    def __init__(self, hosts=4, latency=20, slow_latency=800, drip_interval=0.5):
+        self.hosts = max(1, hosts)
+        self.latency = latency / 1000
+        self.slow_latency = slow_latency / 1000
+        self.drip_interval = drip_interval
+        self.servers = []
+        self.ports = []
+
+    async def start(self):
+        for _ in range(self.hosts):
+            server = await asyncio.start_server(self.handle, '127.0.0.1', 0, limit=65536)
+            self.servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        return self.ports
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target = line.decode('latin-1').split(' ', 2)[:2]
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                if not await self.respond(method, target.split('?', 1)[0], reader, writer):
+                    break
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            pass  # 客户端断开、请求格式错误，或源站关闭时取消了进行中的慢速响应
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write(writer, method, status, body=b'', content_type='video/mp2t', headers=()):
+        head = [f'HTTP/1.1 {status} {REASONS[status]}', f'Content-Type: {content_type}',
+                f'Content-Length: {len(body)}', 'Connection: keep-alive']
+        head.extend(headers)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(body)
+
+    async def respond(self, method, path, reader, writer):
+        """写出响应，返回连接能否继续复用"""
+        parts = path.strip('/').split('/')
+        kind = parts[0]
+        if kind in ('ok', 'slow'):
+            await asyncio.sleep(self.latency if kind == 'ok' else self.slow_latency)
+            self._write(writer, method, 200, TS_BODY)
+        elif kind == 'redirect' and len(parts) >= 3:
+            remaining = int(parts[1]) - 1
+            location = f'/redirect/{remaining}/{parts[2]}' if remaining > 0 else f'/ok/{parts[2]}'
+            self._write(writer, method, 302, headers=[f'Location: {location}'])
+        elif kind == 'hls' and len(parts) >= 3:
+            await asyncio.sleep(self.latency)
+            name = parts[2]
+            if name == 'index.m3u8':
+                body = b'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1280000\nmedia.m3u8\n'
+                self._write(writer, method, 200, body, 'application/vnd.apple.mpegurl')
+            elif name == 'media.m3u8':
+                segments = ''.join(f'#EXTINF:6.0,\nseg{i}.ts\n' for i in range(3))
+                body = f'#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:0\n{segments}'.encode()
+                self._write(writer, method, 200, body, 'application/vnd.apple.mpegurl')
+            else:
+                self._write(writer, method, 200, TS_BODY)
+        elif kind == 'timeout':
+            await reader.read()  # 不响应，等客户端超时后断开
+            return False
+        elif kind == 'drip':
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: video/mp2t\r\n'
+                         f'Content-Length: {len(TS_BODY)}\r\n\r\n'.encode('latin-1'))
+            if method == 'HEAD':
+                return True
+            for i in range(0, len(TS_BODY), len(TS_PACKET)):
+                writer.write(TS_BODY[i:i + len(TS_PACKET)])
+                await writer.drain()
+                await asyncio.sleep(self.drip_interval)
+        else:
+            self._write(writer, method, 404, b'not found', 'text/plain')
+        await writer.drain()
+        return True
+
+
+def _serve_origin(conn, options):
+    """模拟源站进程：启动后把端口列表发回主进程，收到任意消息后退出"""
+    async def serve():
+        origin = FakeOrigin(**options)
+        conn.send(await origin.start())
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, conn.recv)
+        await origin.close()
+
+    asyncio.run(serve())
+
+
+# ==================== 合成播放列表 ====================
+
+def generate_playlist(path, count, ports, mix=None, seed=0):
+    """生成count条频道的M3U播放列表，地址按mix比例分布在各端口（主机）上，每个地址都不相同"""
+    mix = mix or DEFAULT_MIX
+    kinds = random.Random(seed).choices(list(mix), weights=list(mix.values()), k=count)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U x-tvg-url="http://127.0.0.1/epg.xml"\n')
+        for i, kind in enumerate(kinds):
+            base = f'http://127.0.0.1:{ports[i % len(ports)]}'
+            if kind == 'redirect':
+                url = f'{base}/redirect/3/{i}'
+            elif kind == 'hls':
+                url = f'{base}/hls/{i}/index.m3u8'
+            else:
+                url = f'{base}/{kind}/{i}'
+            f.write(f'#EXTINF:-1 tvg-id="ch{i}" tvg-name="频道{i}" tvg-logo="http://127.0.0.1/logo/{i}.png" '
+                    f'group-title="分组{i % 50}",频道{i}\n{url}\n')
+
+
+# ==================== 测量 ====================
+
+def peak_rss():
+    """当前进程的峰值内存（MB），无法获取时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return _peak_rss_windows()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _peak_rss_windows():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def percentile(values, fraction):
+    """最近秩法百分位数，values为空时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def measure_parse(path):
+    """与界面的load_channels相同的方式解析播放列表，返回耗时和峰值内存"""
+    start = time.perf_counter()
+    with open_playlist(path) as f:
+        channels = list(PlaylistParser(f))
+    elapsed = time.perf_counter() - start
+    return {'kind': 'parse', 'size': len(channels), 'seconds': round(elapsed, 3),
+            'per_second': round(len(channels) / elapsed) if elapsed else None, 'peak_rss_mb': peak_rss()}
+
+
+def measure_probe(path, method, options):
+    """用ProbeEngine检测整个播放列表，返回每秒检测数、响应时间分位数、有效比例和峰值内存"""
+    with open_playlist(path) as f:
+        channels = list(PlaylistParser(f))
+    engine = ProbeEngine(method=method, **options)
+    response_times = []
+    counts = {'valid': 0, 'invalid': 0}
+
+    def on_result(result):
+        counts[result['status']] += 1
+        if result.get('response_time') is not None:
+            response_times.append(result['response_time'])
+
+    start = time.perf_counter()
+    asyncio.run(engine.run(channels, on_result))
+    elapsed = time.perf_counter() - start
+    total = counts['valid'] + counts['invalid']
+    return {'kind': 'probe', 'method': method, 'size': len(channels), 'seconds': round(elapsed, 3),
+            'per_second': round(total / elapsed, 1) if elapsed else None,
+            'p50_ms': percentile(response_times, 0.5), 'p99_ms': percentile(response_times, 0.99),
+            'valid': counts['valid'], 'invalid': counts['invalid'], 'peak_rss_mb': peak_rss()}
+
+
+def _in_subprocess(func, *args):
+    """在新的进程中运行一项测量，峰值内存只包含这一项"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+def _key(result):
+    return result['kind'], result.get('method', ''), result['size']
+
+
+def _format(result):
+    rss = f"{result['peak_rss_mb']}MB" if result['peak_rss_mb'] is not None else '-'
+    if result['kind'] == 'parse':
+        return (f"解析        {result['size']:>9,} 条  {result['seconds']:>8.3f}s  "
+                f"{result['per_second']:>10,} 条/秒  峰值内存 {rss}")
+    p50 = f"{result['p50_ms']}ms" if result['p50_ms'] is not None else '-'
+    p99 = f"{result['p99_ms']}ms" if result['p99_ms'] is not None else '-'
+    return (f"检测 {result['method']:<6} {result['size']:>9,} 条  {result['seconds']:>8.3f}s  "
+            f"{result['per_second']:>10,} 条/秒  p50 {p50}  p99 {p99}  "
+            f"有效 {result['valid']} 无效 {result['invalid']}  峰值内存 {rss}")
+
+
+def compare(results, baseline, threshold=10):
+    """与上次的基准结果对比，返回 (说明行列表, 是否有退化)；每秒处理数下降或峰值内存增长超过threshold%视为退化"""
+    previous = {_key(result): result for result in baseline.get('results', [])}
+    lines = []
+    regressed = False
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        changes = []
+        for field, label, higher_is_better in (('per_second', '速度', True), ('p99_ms', 'p99', False),
+                                               ('peak_rss_mb', '内存', False)):
+            if not old.get(field) or result.get(field) is None:
+                continue
+            delta = (result[field] - old[field]) / old[field] * 100
+            worse = delta < -threshold if higher_is_better else delta > threshold
+            regressed = regressed or (worse and field != 'p99_ms')
+            changes.append(f"{label} {delta:+.1f}%{' ⚠' if worse else ''}")
+        name = '解析' if result['kind'] == 'parse' else f"检测 {result['method']}"
+        lines.append(f"{name} {result['size']:,} 条: {'，'.join(changes)}")
+    return lines, regressed
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="直播源检测工具性能基准测试（本机模拟源站 + 合成播放列表）")
+    parser.add_argument('--parse-sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help="解析测试的播放列表规模，默认 1000 100000 1000000")
+    parser.add_argument('--probe-sizes', type=int, nargs='+', default=[1000, 10000],
+                        help="检测测试的播放列表规模，默认 1000 10000")
+    parser.add_argument('--methods', nargs='+', choices=CHECK_METHODS, default=["HEAD", "GET", "混合"],
+                        help="要测量的检测方法，默认 HEAD GET 混合")
+    parser.add_argument('--hosts', type=int, default=8, help="模拟源站的主机（端口）数，默认8")
+    parser.add_argument('--latency', type=int, default=20, help="正常地址的响应延迟(毫秒)，默认20")
+    parser.add_argument('--slow-latency', type=int, default=800, help="高延迟地址的响应延迟(毫秒)，默认800")
+    parser.add_argument('--drip-interval', type=float, default=0.5, help="慢速响应体每个TS包的间隔(秒)，默认0.5")
+    parser.add_argument('--mix', default=None,
+                        help="地址比例，如 ok=70,slow=10,404=8,timeout=2,drip=3,redirect=4,hls=3（默认值）")
+    parser.add_argument('-t', '--timeout', type=int, default=2, help="检测超时时间(秒)，默认2")
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help="并发数，默认200")
+    parser.add_argument('--per-host', type=int, default=50, help="单主机并发数，默认50")
+    parser.add_argument('--json', default=None, help="把结果保存为JSON文件")
+    parser.add_argument('--compare', default=None, help="与之前保存的JSON结果对比，有退化时返回码为1")
+    parser.add_argument('--threshold', type=float, default=10,
+                        help="对比时视为退化的变化幅度(%%)，默认10")
+    parser.add_argument('--keep', default=None, metavar='DIR', help="把生成的播放列表保存在该目录（默认用完删除）")
+    return parser
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f'未知的地址类型: {name}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    except ValueError as e:
+        print(f"--mix 格式错误: {str(e)}", file=sys.stderr)
+        return 2
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    origin = context.Process(target=_serve_origin, daemon=True, args=(child_conn, {
+        'hosts': args.hosts, 'latency': args.latency, 'slow_latency': args.slow_latency,
+        'drip_interval': args.drip_interval}))
+    origin.start()
+    ports = parent_conn.recv()
+    print(f"模拟源站已启动: 127.0.0.1 端口 {', '.join(map(str, ports))}", file=sys.stderr)
+
+    options = {'timeout': args.timeout, 'concurrency': args.concurrency, 'per_host_limit': args.per_host}
+    results = []
+    directory = args.keep or tempfile.mkdtemp(prefix='stream_checker_bench_')
+    os.makedirs(directory, exist_ok=True)
+    playlists = {}
+    try:
+        for size in sorted(set(args.parse_sizes) | set(args.probe_sizes)):
+            path = playlists[size] = os.path.join(directory, f'bench_{size}.m3u')
+            generate_playlist(path, size, ports, mix)
+        for size in args.parse_sizes:
+            results.append(_in_subprocess(measure_parse, playlists[size]))
+            print(_format(results[-1]))
+        for size in args.probe_sizes:
+            for method in args.methods:
+                results.append(_in_subprocess(measure_probe, playlists[size], method, options))
+                print(_format(results[-1]))
+    except KeyboardInterrupt:
+        print("\n基准测试被用户中断", file=sys.stderr)
+        return 1
+    finally:
+        parent_conn.send('stop')
+        origin.join(5)
+        if not args.keep:
+            for path in playlists.values():
+                os.remove(path)
+            os.rmdir(directory)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'hosts': args.hosts, 'latency_ms': args.latency, 'slow_latency_ms': args.slow_latency,
+                   'drip_interval': args.drip_interval, 'mix': mix, **options},
+        'results': results
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if baseline is not None:
+        lines, regressed = compare(results, baseline, args.threshold)
+        print("\n与基准对比:")
+        print('\n'.join(lines) or '没有可对比的项目')
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ echo.
 :: 检查Python是否安装
 python --version >nul 2>&1
 if errorlevel 1 (
-    echo 错误：未找到Python，请先安装Python 3.6+
+    echo 错误：未找到Python，请先安装Python 3.8+
     echo 下载地址：https://www.python.org/downloads/
     pause
     exit /b 1
@@ -40,17 +40,6 @@ call venv\Scripts\activate.bat
 :: 检查并安装依赖
 echo.
 echo 检查依赖包...
-python -c "import requests" 2>nul
-if errorlevel 1 (
-    echo 安装requests库...
-    pip install requests
-    if errorlevel 1 (
-        echo 错误：安装requests失败
-        pause
-        exit /b 1
-    )
-)
-
 python -c "import tkinter" 2>nul
 if errorlevel 1 (
     echo 错误：tkinter不可用，请重新安装Python并确保包含tkinter
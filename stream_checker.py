@@ -1,619 +1,4502 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
-"""
-直播源检测工具 - 中文GUI版本
-功能：检测M3U文件中的直播源可用性，支持多种格式
-"""
-
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-import requests
-import urllib.request
-import urllib.error
-import re
-import csv
-import json
-import threading
-import time
-from datetime import datetime
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import queue
-
-class StreamChecker:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("直播源检测工具 v2.0")
-        self.root.geometry("900x700")
-        self.root.minsize(800, 600)
-        
-        # 设置窗口图标和编码
-        try:
-            self.root.tk.call('encoding', 'system', 'utf-8')
-        except:
-            pass
-            
-        # 变量初始化
-        self.channels = []
-        self.valid_channels = []
-        self.invalid_channels = []
-        self.is_checking = False
-        self.check_thread = None
-        self.progress_queue = queue.Queue()
-        
-        # 设置样式
-        self.setup_styles()
-        
-        # 创建界面
-        self.create_widgets()
-        
-        # 启动进度更新
-        self.update_progress()
-        
-    def setup_styles(self):
-        """设置界面样式"""
-        style = ttk.Style()
-        style.theme_use('clam')
-        
-        # 配置样式
-        style.configure('Title.TLabel', font=('微软雅黑', 12, 'bold'))
-        style.configure('Header.TLabel', font=('微软雅黑', 10, 'bold'))
-        style.configure('Custom.TButton', font=('微软雅黑', 9))
-        
-    def create_widgets(self):
-        """创建界面组件"""
-        # 主标题
-        title_frame = ttk.Frame(self.root)
-        title_frame.pack(fill='x', padx=10, pady=5)
-        
-        title_label = ttk.Label(title_frame, text="直播源检测工具", style='Title.TLabel')
-        title_label.pack()
-        
-        # 文件选择区域
-        file_frame = ttk.LabelFrame(self.root, text="文件选择", padding=10)
-        file_frame.pack(fill='x', padx=10, pady=5)
-        
-        self.file_path_var = tk.StringVar()
-        file_entry = ttk.Entry(file_frame, textvariable=self.file_path_var, state='readonly')
-        file_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
-        
-        select_btn = ttk.Button(file_frame, text="选择M3U文件", command=self.select_file, style='Custom.TButton')
-        select_btn.pack(side='right')
-        
-        # 检测选项区域
-        options_frame = ttk.LabelFrame(self.root, text="检测选项", padding=10)
-        options_frame.pack(fill='x', padx=10, pady=5)
-        
-        # 第一行选项
-        options_row1 = ttk.Frame(options_frame)
-        options_row1.pack(fill='x', pady=(0, 5))
-        
-        ttk.Label(options_row1, text="超时时间(秒):").pack(side='left')
-        self.timeout_var = tk.StringVar(value="10")
-        timeout_spin = ttk.Spinbox(options_row1, from_=5, to=60, width=8, textvariable=self.timeout_var)
-        timeout_spin.pack(side='left', padx=(5, 20))
-        
-        ttk.Label(options_row1, text="并发数:").pack(side='left')
-        self.threads_var = tk.StringVar(value="20")
-        threads_spin = ttk.Spinbox(options_row1, from_=1, to=50, width=8, textvariable=self.threads_var)
-        threads_spin.pack(side='left', padx=(5, 20))
-        
-        # 第二行选项
-        options_row2 = ttk.Frame(options_frame)
-        options_row2.pack(fill='x')
-        
-        self.check_method_var = tk.StringVar(value="HEAD")
-        ttk.Label(options_row2, text="检测方法:").pack(side='left')
-        method_combo = ttk.Combobox(options_row2, textvariable=self.check_method_var, 
-                                   values=["HEAD", "GET", "混合"], width=10, state='readonly')
-        method_combo.pack(side='left', padx=(5, 20))
-        
-        self.retry_var = tk.BooleanVar(value=True)
-        retry_check = ttk.Checkbutton(options_row2, text="失败重试", variable=self.retry_var)
-        retry_check.pack(side='left', padx=(0, 20))
-        
-        self.detail_log_var = tk.BooleanVar(value=False)
-        detail_check = ttk.Checkbutton(options_row2, text="详细日志", variable=self.detail_log_var)
-        detail_check.pack(side='left')
-        
-        # 控制按钮区域
-        control_frame = ttk.Frame(self.root)
-        control_frame.pack(fill='x', padx=10, pady=5)
-        
-        self.start_btn = ttk.Button(control_frame, text="开始检测", command=self.start_check, style='Custom.TButton')
-        self.start_btn.pack(side='left', padx=(0, 10))
-        
-        self.stop_btn = ttk.Button(control_frame, text="停止检测", command=self.stop_check, 
-                                  style='Custom.TButton', state='disabled')
-        self.stop_btn.pack(side='left', padx=(0, 10))
-        
-        self.export_btn = ttk.Button(control_frame, text="导出结果", command=self.export_results, 
-                                    style='Custom.TButton', state='disabled')
-        self.export_btn.pack(side='left', padx=(0, 10))
-        
-        clear_btn = ttk.Button(control_frame, text="清空日志", command=self.clear_log, style='Custom.TButton')
-        clear_btn.pack(side='left')
-        
-        # 进度显示区域
-        progress_frame = ttk.LabelFrame(self.root, text="检测进度", padding=10)
-        progress_frame.pack(fill='x', padx=10, pady=5)
-        
-        self.progress_var = tk.DoubleVar()
-        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
-        self.progress_bar.pack(fill='x', pady=(0, 5))
-        
-        progress_info_frame = ttk.Frame(progress_frame)
-        progress_info_frame.pack(fill='x')
-        
-        self.progress_label = ttk.Label(progress_info_frame, text="准备就绪")
-        self.progress_label.pack(side='left')
-        
-        self.stats_label = ttk.Label(progress_info_frame, text="")
-        self.stats_label.pack(side='right')
-        
-        # 日志显示区域
-        log_frame = ttk.LabelFrame(self.root, text="检测日志", padding=5)
-        log_frame.pack(fill='both', expand=True, padx=10, pady=5)
-        
-        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, font=('Consolas', 9))
-        self.log_text.pack(fill='both', expand=True)
-        
-        # 添加欢迎信息
-        self.log_message("欢迎使用直播源检测工具！", "INFO")
-        self.log_message("请选择M3U文件开始检测", "INFO")
-        
-    def select_file(self):
-        """选择M3U文件"""
-        file_path = filedialog.askopenfilename(
-            title="选择直播源文件",
-            filetypes=[
-                ("所有支持格式", "*.m3u;*.txt;*.csv"), 
-                ("M3U文件", "*.m3u"), 
-                ("文本文件", "*.txt"), 
-                ("CSV文件", "*.csv"),
-                ("所有文件", "*.*")
-            ]
-        )
-        if file_path:
-            self.file_path_var.set(file_path)
-            self.load_channels(file_path)
-            
-    def load_channels(self, file_path):
-        """加载频道列表"""
-        try:
-            self.channels = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            lines = content.strip().split('\n')
-            current_channel = None
-            
-            # 检测文件格式
-            is_m3u = content.startswith('#EXTM3U') or any(line.startswith('#EXTINF:') for line in lines[:10])
-            is_csv = not is_m3u and any(',' in line and line.count(',') >= 1 for line in lines[:10])
-            
-            if is_m3u:
-                # 解析M3U文件
-                for line in lines:
-                    line = line.strip()
-                    if not line or line.startswith('#EXTM3U'):
-                        continue
-                        
-                    if line.startswith('#EXTINF:'):
-                        # 解析频道信息
-                        # 格式1: #EXTINF:-1 tvg-name="..." group-title="...",频道名称
-                        # 格式2: #EXTINF:-1,频道名称
-                        match = re.search(r'#EXTINF:.*?,(.+)$', line)
-                        if match:
-                            name = match.group(1).strip()
-                            current_channel = {'name': name, 'url': ''}
-                            
-                            # 尝试提取分组信息
-                            group_match = re.search(r'group-title="([^"]*)"', line)
-                            if group_match:
-                                current_channel['group'] = group_match.group(1)
-                            else:
-                                current_channel['group'] = '未分类'
-                                
-                    elif line.startswith('http') and current_channel:
-                        current_channel['url'] = line
-                        self.channels.append(current_channel)
-                        current_channel = None
-                    elif line.startswith('http'):
-                        # 没有EXTINF的URL
-                        self.channels.append({
-                            'name': f'频道_{len(self.channels)+1}',
-                            'url': line,
-                            'group': '未分类'
-                        })
-                        
-            elif is_csv:
-                # 解析CSV格式：频道名,URL
-                for line_num, line in enumerate(lines, 1):
-                    line = line.strip()
-                    if not line:
-                        continue
-                        
-                    # 处理逗号分隔的格式
-                    parts = line.split(',', 1)  # 只分割第一个逗号
-                    if len(parts) >= 2:
-                        name = parts[0].strip()
-                        url = parts[1].strip()
-                        
-                        if url.startswith('http'):
-                            self.channels.append({
-                                'name': name if name else f'频道_{line_num}',
-                                'url': url,
-                                'group': '未分类'
-                            })
-                    elif line.startswith('http'):
-                        # 只有URL的行
-                        self.channels.append({
-                            'name': f'频道_{line_num}',
-                            'url': line,
-                            'group': '未分类'
-                        })
-                        
-            else:
-                # 解析纯URL列表
-                for line_num, line in enumerate(lines, 1):
-                    line = line.strip()
-                    if line.startswith('http'):
-                        self.channels.append({
-                            'name': f'频道_{line_num}',
-                            'url': line,
-                            'group': '未分类'
-                        })
-                    
-            self.log_message(f"成功加载 {len(self.channels)} 个频道", "SUCCESS")
-            if is_csv:
-                self.log_message("检测到CSV格式文件", "INFO")
-            elif is_m3u:
-                self.log_message("检测到M3U格式文件", "INFO")
-            else:
-                self.log_message("检测到URL列表格式文件", "INFO")
-            
-        except Exception as e:
-            self.log_message(f"加载文件失败: {str(e)}", "ERROR")
-            messagebox.showerror("错误", f"加载文件失败:\n{str(e)}")
-            
-    def start_check(self):
-        """开始检测"""
-        if not self.channels:
-            messagebox.showwarning("警告", "请先选择并加载M3U文件")
-            return
-            
-        if self.is_checking:
-            return
-            
-        self.is_checking = True
-        self.valid_channels = []
-        self.invalid_channels = []
-        
-        # 更新按钮状态
-        self.start_btn.config(state='disabled')
-        self.stop_btn.config(state='normal')
-        self.export_btn.config(state='disabled')
-        
-        # 重置进度
-        self.progress_var.set(0)
-        self.progress_label.config(text="开始检测...")
-        
-        # 清空之前的结果
-        self.log_message("=" * 50, "INFO")
-        self.log_message("开始检测直播源...", "INFO")
-        self.log_message(f"总计 {len(self.channels)} 个频道", "INFO")
-        self.log_message(f"超时设置: {self.timeout_var.get()}秒", "INFO")
-        self.log_message(f"并发数: {self.threads_var.get()}", "INFO")
-        self.log_message(f"检测方法: {self.check_method_var.get()}", "INFO")
-        self.log_message("=" * 50, "INFO")
-        
-        # 启动检测线程
-        self.check_thread = threading.Thread(target=self.check_channels)
-        self.check_thread.daemon = True
-        self.check_thread.start()
-        
-    def stop_check(self):
-        """停止检测"""
-        self.is_checking = False
-        self.progress_queue.put(('status', '正在停止检测...'))
-        
-    def check_channels(self):
-        """检测频道可用性"""
-        timeout = int(self.timeout_var.get())
-        max_workers = int(self.threads_var.get())
-        method = self.check_method_var.get()
-        retry = self.retry_var.get()
-        
-        completed = 0
-        total = len(self.channels)
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_channel = {
-                executor.submit(self.check_single_channel, channel, timeout, method, retry): channel 
-                for channel in self.channels
-            }
-            
-            # 处理完成的任务
-            for future in as_completed(future_to_channel):
-                if not self.is_checking:
-                    break
-                    
-                channel = future_to_channel[future]
-                try:
-                    result = future.result()
-                    completed += 1
-                    
-                    if result['status'] == 'valid':
-                        self.valid_channels.append(result)
-                        self.progress_queue.put(('valid', result))
-                    else:
-                        self.invalid_channels.append(result)
-                        if self.detail_log_var.get():
-                            self.progress_queue.put(('invalid', result))
-                    
-                    # 更新进度
-                    progress = (completed / total) * 100
-                    self.progress_queue.put(('progress', {
-                        'progress': progress,
-                        'completed': completed,
-                        'total': total,
-                        'valid': len(self.valid_channels),
-                        'invalid': len(self.invalid_channels)
-                    }))
-                    
-                except Exception as e:
-                    completed += 1
-                    self.progress_queue.put(('error', f"检测频道 {channel['name']} 时出错: {str(e)}"))
-        
-        # 检测完成
-        self.progress_queue.put(('complete', None))
-        
-    def check_single_channel(self, channel, timeout, method, retry):
-        """检测单个频道"""
-        name = channel['name']
-        url = channel['url']
-        group = channel.get('group', '未分类')
-        
-        max_retries = 2 if retry else 1
-        
-        for attempt in range(max_retries):
-            try:
-                if method == "HEAD":
-                    response = requests.head(url, timeout=timeout, allow_redirects=True)
-                elif method == "GET":
-                    response = requests.get(url, timeout=timeout, stream=True)
-                    # 只读取少量数据
-                    for chunk in response.iter_content(chunk_size=1024):
-                        break
-                else:  # 混合方法
-                    try:
-                        response = requests.head(url, timeout=timeout//2, allow_redirects=True)
-                    except:
-                        response = requests.get(url, timeout=timeout, stream=True)
-                        for chunk in response.iter_content(chunk_size=1024):
-                            break
-                
-                if response.status_code == 200:
-                    return {
-                        'name': name,
-                        'url': url,
-                        'group': group,
-                        'status': 'valid',
-                        'status_code': response.status_code,
-                        'response_time': 0  # 可以添加响应时间测量
-                    }
-                else:
-                    if attempt == max_retries - 1:
-                        return {
-                            'name': name,
-                            'url': url,
-                            'group': group,
-                            'status': 'invalid',
-                            'error': f"HTTP {response.status_code}",
-                            'status_code': response.status_code
-                        }
-                        
-            except requests.exceptions.Timeout:
-                if attempt == max_retries - 1:
-                    return {
-                        'name': name,
-                        'url': url,
-                        'group': group,
-                        'status': 'invalid',
-                        'error': '连接超时'
-                    }
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    return {
-                        'name': name,
-                        'url': url,
-                        'group': group,
-                        'status': 'invalid',
-                        'error': str(e)
-                    }
-                    
-        return {
-            'name': name,
-            'url': url,
-            'group': group,
-            'status': 'invalid',
-            'error': '未知错误'
-        }
-        
-    def update_progress(self):
-        """更新进度显示"""
-        try:
-            while True:
-                msg_type, data = self.progress_queue.get_nowait()
-                
-                if msg_type == 'progress':
-                    self.progress_var.set(data['progress'])
-                    self.progress_label.config(text=f"检测进度: {data['completed']}/{data['total']}")
-                    self.stats_label.config(text=f"有效: {data['valid']} | 无效: {data['invalid']}")
-                    
-                elif msg_type == 'valid':
-                    if self.detail_log_var.get():
-                        self.log_message(f"✓ {data['name']} - 可用", "SUCCESS")
-                    
-                elif msg_type == 'invalid':
-                    error = data.get('error', '未知错误')
-                    self.log_message(f"✗ {data['name']} - {error}", "ERROR")
-                    
-                elif msg_type == 'error':
-                    self.log_message(data, "ERROR")
-                    
-                elif msg_type == 'status':
-                    self.progress_label.config(text=data)
-                    
-                elif msg_type == 'complete':
-                    self.check_complete()
-                    break
-                    
-        except queue.Empty:
-            pass
-        
-        # 继续更新
-        self.root.after(100, self.update_progress)
-        
-    def check_complete(self):
-        """检测完成处理"""
-        self.is_checking = False
-        
-        # 更新按钮状态
-        self.start_btn.config(state='normal')
-        self.stop_btn.config(state='disabled')
-        self.export_btn.config(state='normal')
-        
-        # 显示结果
-        total = len(self.channels)
-        valid = len(self.valid_channels)
-        invalid = len(self.invalid_channels)
-        success_rate = (valid / total * 100) if total > 0 else 0
-        
-        self.progress_label.config(text="检测完成")
-        self.stats_label.config(text=f"有效: {valid} | 无效: {invalid} | 成功率: {success_rate:.1f}%")
-        
-        self.log_message("=" * 50, "INFO")
-        self.log_message("检测完成！", "SUCCESS")
-        self.log_message(f"总计检测: {total} 个频道", "INFO")
-        self.log_message(f"有效频道: {valid} 个", "SUCCESS")
-        self.log_message(f"无效频道: {invalid} 个", "ERROR")
-        self.log_message(f"成功率: {success_rate:.1f}%", "INFO")
-        self.log_message("=" * 50, "INFO")
-        
-        # 显示完成对话框
-        messagebox.showinfo("检测完成", 
-                           f"检测完成！\n\n"
-                           f"总计: {total} 个频道\n"
-                           f"有效: {valid} 个\n"
-                           f"无效: {invalid} 个\n"
-                           f"成功率: {success_rate:.1f}%")
-        
-    def export_results(self):
-        """导出结果"""
-        if not self.valid_channels and not self.invalid_channels:
-            messagebox.showwarning("警告", "没有检测结果可导出")
-            return
-            
-        export_dir = filedialog.askdirectory(title="选择导出目录")
-        if not export_dir:
-            return
-            
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # 导出有效频道 (CSV)
-            if self.valid_channels:
-                valid_file = os.path.join(export_dir, f"有效频道_{timestamp}.csv")
-                with open(valid_file, 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['频道名称', 'URL', '分组'])
-                    for channel in self.valid_channels:
-                        writer.writerow([channel['name'], channel['url'], channel.get('group', '未分类')])
-                
-                # 同时导出M3U格式
-                valid_m3u = os.path.join(export_dir, f"有效频道_{timestamp}.m3u")
-                with open(valid_m3u, 'w', encoding='utf-8') as f:
-                    f.write("#EXTM3U\n")
-                    for channel in self.valid_channels:
-                        group = channel.get('group', '未分类')
-                        f.write(f'#EXTINF:-1 group-title="{group}",{channel["name"]}\n')
-                        f.write(f'{channel["url"]}\n')
-            
-            # 导出无效频道 (CSV)
-            if self.invalid_channels:
-                invalid_file = os.path.join(export_dir, f"无效频道_{timestamp}.csv")
-                with open(invalid_file, 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['频道名称', 'URL', '分组', '错误信息'])
-                    for channel in self.invalid_channels:
-                        writer.writerow([
-                            channel['name'], 
-                            channel['url'], 
-                            channel.get('group', '未分类'),
-                            channel.get('error', '未知错误')
-                        ])
-            
-            # 导出详细报告 (JSON)
-            report_file = os.path.join(export_dir, f"检测报告_{timestamp}.json")
-            report = {
-                'timestamp': datetime.now().isoformat(),
-                'total_channels': len(self.channels),
-                'valid_channels': len(self.valid_channels),
-                'invalid_channels': len(self.invalid_channels),
-                'success_rate': len(self.valid_channels) / len(self.channels) * 100 if self.channels else 0,
-                'valid_list': self.valid_channels,
-                'invalid_list': self.invalid_channels
-            }
-            
-            with open(report_file, 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2)
-            
-            self.log_message(f"结果已导出到: {export_dir}", "SUCCESS")
-            messagebox.showinfo("导出完成", f"结果已成功导出到:\n{export_dir}")
-            
-        except Exception as e:
-            self.log_message(f"导出失败: {str(e)}", "ERROR")
-            messagebox.showerror("导出失败", f"导出失败:\n{str(e)}")
-            
-    def clear_log(self):
-        """清空日志"""
-        self.log_text.delete(1.0, tk.END)
-        self.log_message("日志已清空", "INFO")
-        
-    def log_message(self, message, level="INFO"):
-        """添加日志消息"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # 设置颜色
-        colors = {
-            "INFO": "black",
-            "SUCCESS": "green",
-            "ERROR": "red",
-            "WARNING": "orange"
-        }
-        
-        color = colors.get(level, "black")
-        
-        # 插入消息
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        
-        # 设置颜色 (简化版本，tkinter的文本着色比较复杂)
-        self.log_text.see(tk.END)
-
-def main():
-    """主函数"""
-    root = tk.Tk()
-    app = StreamChecker(root)
-    
-    try:
-        root.mainloop()
-    except KeyboardInterrupt:
-        print("\n程序被用户中断")
-    except Exception as e:
-        print(f"程序出错: {str(e)}")
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+直播源检测工具 - 中文GUI版本
+功能：检测M3U文件中的直播源可用性，支持多种格式
+"""
+
+import argparse
+import asyncio
+import base64
+import bisect
+import collections
+import ipaddress
+import re
+import csv
+import gzip
+import io
+import itertools
+import multiprocessing
+import signal
+import sqlite3
+import json
+import ssl
+import threading
+import time
+from datetime import datetime
+import os
+import queue
+import socket
+import sys
+import zlib
+from multiprocessing.managers import BaseManager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urljoin, quote, unquote
+from urllib.request import getproxies_environment, proxy_bypass_environment
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext
+except ImportError:  # 无图形界面的服务器上仍可使用检测引擎
+    tk = None
+
+
+# ==================== 异步检测引擎（不依赖GUI） ====================
+
+DEFAULT_GROUP = '未分类'
+HLS_METHOD = "HLS深度"
+CHECK_METHODS = ["HEAD", "GET", "混合", HLS_METHOD]
+USER_AGENT = 'Mozilla/5.0 (compatible; IPTV-Stream-Checker/2.0)'
+MAX_REDIRECTS = 10
+# HLS深度检测：先读取的字节数（判断是否为m3u8）、播放列表最大字节数、分片采样字节数
+HLS_SNIFF_SIZE = 4096
+HLS_PLAYLIST_LIMIT = 1024 * 1024
+HLS_SEGMENT_SAMPLE = 188 * 16
+# 变体播放列表校验结果的缓存时间（秒），同一CDN路径的频道共用
+HLS_CACHE_TTL = 30
+# 开启测速时每个频道最多下载的字节数
+SPEED_TEST_BYTES = 256 * 1024
+# 检测结果库（增量检测用）的默认路径，以及增量检测时结果的有效期（秒）
+RESULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '检测记录.db')
+INCREMENTAL_MAX_AGE = 6 * 3600
+# 断点续检的进度日志（已完成的检测结果，NDJSON）默认路径
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '检测进度.ndjson')
+# 远程直播源的本地缓存（ETag/Last-Modified和内容，用于条件请求）、下载超时（秒）和最大字节数
+SOURCE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '直播源缓存.db')
+SOURCE_TIMEOUT = 60
+SOURCE_SIZE_LIMIT = 64 * 1024 * 1024
+# 分片检测：工作进程每批回传的结果数和最长间隔（秒），协调器认证密钥的环境变量
+SHARD_RESULT_BATCH = 200
+SHARD_FLUSH_INTERVAL = 0.2
+SHARD_AUTHKEY_ENV = 'STREAM_CHECKER_AUTHKEY'
+# 运行指标：Prometheus指标名前缀、耗时直方图的桶（秒）、计数器 {名称: (说明, 标签名)} 和耗时阶段
+METRIC_PREFIX = 'stream_checker_'
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_COUNTERS = {
+    'results_total': ('检测结果数（含沿用和去重复制的结果）', 'status'),
+    'errors_total': ('检测失败的原因', 'kind'),
+    'retries_total': ('第二轮重新检测的频道数', None),
+    'cached_total': ('增量检测沿用上次结果的频道数', None),
+    'duplicates_total': ('地址重复、复制其他频道结果的频道数', None),
+    'ui_messages_total': ('界面线程处理的进度消息数', None),
+}
+METRIC_PHASES = {
+    'queue_wait': '等待并发名额',
+    'host_wait': '等待主机名额',
+    'dns': 'DNS解析',
+    'connect': 'TCP连接',
+    'tls': 'TLS握手',
+    'ttfb': '首字节',
+    'body': '读取数据',
+    'probe': '单个检测',
+    'ui_drain': '界面刷新',
+}
+# 每次请求的timings中记录的阶段，以及完成时输出摘要的阶段
+REQUEST_PHASES = ('host_wait', 'dns', 'connect', 'tls', 'ttfb', 'body')
+METRIC_BRIEF = ('queue_wait', 'dns', 'connect', 'tls', 'ttfb', 'body', 'probe')
+# 常见的鉴权/防盗链查询参数，开启"忽略鉴权参数"时去重不区分这些参数的值
+TOKEN_QUERY_PARAMS = ('token', 'auth_key', 'authkey', 'sign', 'wssecret', 'wstime',
+                      'txsecret', 'txtime', 'expires', 'timestamp')
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+# 自适应并发时视为拥塞（需要降低并发）的HTTP状态码
+CONGESTION_CODES = (429, 503)
+# 失败重试：第一轮用短超时检测全部频道，超时和暂时性失败（连接错误、5xx/429、被熔断）
+# 在第一轮结束RETRY_DELAY秒后用完整超时再检测一轮
+TRANSIENT_ERRORS = ('timeout', 'connection', 'server', 'breaker')
+RETRY_DELAY = 2
+HLS_TIMEOUT_ERROR = 'HLS子请求超时'
+# 常驻监控：默认每个周期的秒数、错开检测时每批的间隔（秒）
+MONITOR_INTERVAL = 3600
+MONITOR_SLICE_SECONDS = 10
+# 检测调度：流式输入时按主机轮转最多预读的频道数；按上次状态排序时各状态的优先级（小的先检测，None为没有记录）
+SCHEDULE_WINDOW = 20000
+PRIOR_STATUS_RANK = {'valid': 0, None: 1, 'invalid': 2}
+# 去重：保留最近检测完的地址结果数（超出后最久未被引用的地址再次出现时重新检测，内存占用不随输入增长）
+DEDUP_WINDOW = 10000
+# 支持检测的流地址：HTTP(S)，以及用原生协议探测的RTSP、RTMP和UDP/RTP（组播）
+STREAM_URL_PREFIXES = ('http://', 'https://', 'rtsp://', 'rtmp://', 'udp://', 'rtp://')
+# HTTP客户端（连接池、重定向）只接受HTTP_PORTS中的协议，RTSP/RTMP只经native_request用原生协议连接
+HTTP_PORTS = {'http': 80, 'https': 443}
+NATIVE_PORTS = {'rtsp': 554, 'rtmp': 1935}
+DEFAULT_PORTS = {**HTTP_PORTS, **NATIVE_PORTS}
+RTMP_HANDSHAKE_SIZE = 1536
+# RTSP的DESCRIBE返回这些状态码时改用OPTIONS确认服务器可用
+RTSP_OPTIONS_FALLBACK_CODES = (401, 403, 405)
+DATAGRAM_SIZE = 65536
+# 与requests的requote_uri保持一致，已编码的字符不会被重复编码
+URL_SAFE_CHARS = "!#$%&'()*+,/:;=?@[]~"
+
+_ssl_context = None
+_proxies = None
+
+
+def get_ssl_context():
+    """获取共享的SSL上下文（创建代价较高，只创建一次）"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class HttpResponse:
+    """最简HTTP/1.1响应：只解析状态行和响应头，响应体按需读取"""
+
+    def __init__(self, url, method, status_code, headers, reader, writer,
+                 keep_alive=False, pool=None, pool_key=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.pool = pool
+        self.pool_key = pool_key
+        self._closed = False
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self._chunk_left = 0
+        self._remaining = None
+        self._eof = method == 'HEAD' or status_code in (204, 304) or 100 <= status_code < 200
+        if not self.chunked and 'content-length' in headers:
+            try:
+                self._remaining = int(headers['content-length'])
+            except ValueError:
+                self._remaining = None
+            if self._remaining == 0:
+                self._eof = True
+
+    async def read(self, size=-1):
+        """读取最多size字节的响应体（size<0时读到结束），自动处理chunked编码"""
+        data = bytearray()
+        while not self._eof and (size < 0 or len(data) < size):
+            want = 65536 if size < 0 else size - len(data)
+            if self.chunked:
+                if self._chunk_left == 0:
+                    line = await self.reader.readline()
+                    if not line:
+                        self._eof = True
+                        break
+                    try:
+                        self._chunk_left = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                    except ValueError:
+                        raise ValueError('无效的chunked响应')
+                    if self._chunk_left == 0:
+                        # 跳过trailer直到空行，使连接可以继续复用
+                        while line not in (b'\r\n', b'\n', b''):
+                            line = await self.reader.readline()
+                        self._eof = True
+                        break
+                chunk = await self.reader.read(min(want, self._chunk_left))
+                if not chunk:
+                    self._eof = True
+                    break
+                self._chunk_left -= len(chunk)
+                if self._chunk_left == 0:
+                    await self.reader.readline()  # 跳过块末尾的CRLF
+            elif self._remaining is not None:
+                chunk = await self.reader.read(min(want, self._remaining))
+                if not chunk:
+                    self._eof = True
+                    break
+                self._remaining -= len(chunk)
+                if self._remaining == 0:
+                    self._eof = True
+            else:
+                chunk = await self.reader.read(want)
+                if not chunk:
+                    self._eof = True
+                    break
+            data += chunk
+        return bytes(data)
+
+    def close(self):
+        """结束本次请求：响应体已读完且服务器允许keep-alive时归还连接池，否则关闭连接"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.pool is not None:
+            if self.keep_alive and self._eof:
+                self.pool.put_idle(self.pool_key, self.reader, self.writer)
+            else:
+                self.writer.close()
+            self.pool.release_slot(self.pool_key)
+        else:
+            self.writer.close()
+
+
+class AdaptiveLimit:
+    """AIMD自适应并发上限，用法与asyncio.Semaphore相同（acquire/release），上限在运行中调整
+
+    每完成一个窗口（当前上限个请求，至少min_window个）评估一次：窗口内超时、限流等拥塞信号的比例
+    超过error_threshold，或平均延迟超过基线（最低的窗口平均延迟）的latency_factor倍时，上限乘以decrease；
+    否则慢启动阶段翻倍，第一次降低之后每个窗口加increase。上限的变化记录在history中。
+    """
+
+    def __init__(self, initial, max_limit, min_limit=1, increase=1, decrease=0.7,
+                 latency_factor=2.0, error_threshold=0.1, min_window=8):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = min(max(int(initial), self.min_limit), self.max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.error_threshold = error_threshold
+        self.min_window = min_window
+        self.in_use = 0
+        self.baseline = None
+        self.decreases = 0
+        self.lowest = self.highest = self.limit
+        self._waiters = collections.deque()
+        self._slow_start = True
+        self._start = time.monotonic()
+        self.history = [(0.0, self.limit)]
+        self._reset_window()
+
+    def _reset_window(self):
+        self._completed = 0
+        self._congested = 0
+        self._latency_sum = 0.0
+        self._latency_count = 0
+
+    async def acquire(self):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分到名额但随即被取消，归还名额
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def release(self):
+        self.in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_use < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+    def record(self, latency=None, congested=False):
+        """记录一个请求的结果：latency为耗时（秒），congested表示超时、限流等拥塞信号"""
+        self._completed += 1
+        if congested:
+            self._congested += 1
+        elif latency is not None:
+            self._latency_sum += latency
+            self._latency_count += 1
+        if self._completed < max(self.limit, self.min_window):
+            return
+
+        error_rate = self._congested / self._completed
+        average = self._latency_sum / self._latency_count if self._latency_count else None
+        self._reset_window()
+        if average is not None:
+            # 基线缓慢上浮，避免个别很快的窗口让之后的窗口一直被判为延迟过高
+            self.baseline = average if self.baseline is None else min(average, self.baseline * 1.05)
+        if error_rate > self.error_threshold or \
+                (average is not None and average > self.baseline * self.latency_factor):
+            self._slow_start = False
+            self.decreases += 1
+            self._set(max(self.min_limit, int(self.limit * self.decrease)))
+        elif self._slow_start:
+            self._set(min(self.max_limit, self.limit * 2))
+        else:
+            self._set(min(self.max_limit, self.limit + self.increase))
+
+    def _set(self, limit):
+        if limit == self.limit:
+            return
+        self.limit = limit
+        self.lowest = min(self.lowest, limit)
+        self.highest = max(self.highest, limit)
+        self.history.append((round(time.monotonic() - self._start, 1), limit))
+        self._wake()
+
+    def summary(self, trajectory=False):
+        """最终上限、运行中的最低/最高上限和降低次数，trajectory为True时附带变化轨迹 [[秒, 上限], ...]"""
+        summary = {'limit': self.limit, 'min': self.lowest, 'max': self.highest, 'decreases': self.decreases}
+        if trajectory:
+            summary['trajectory'] = [list(point) for point in self.history]
+        return summary
+
+
+class ConnectionPool:
+    """按主机复用的HTTP连接池
+
+    同一主机(协议, 主机, 端口)的请求共用keep-alive连接，只需一次TCP/TLS握手；
+    每个主机同时最多 per_host_limit 个请求，避免大量频道同时压向同一个源站。
+    adaptive为True时每个主机的并发上限由AdaptiveLimit根据该主机的延迟和超时/限流自动调整，
+    per_host_limit为上限的最大值。
+    连接池绑定创建它的事件循环，只能在该循环内使用。
+    """
+
+    def __init__(self, per_host_limit=10, idle_timeout=15, dns=None, health=None, adaptive=False):
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.idle_timeout = idle_timeout
+        self.dns = dns
+        self.health = health
+        self.adaptive = adaptive
+        self._slots = {}
+        self._idle = {}
+
+    async def acquire_slot(self, key):
+        """等待该主机的并发名额"""
+        semaphore = self._slots.get(key)
+        if semaphore is None:
+            if self.adaptive:
+                semaphore = AdaptiveLimit(2, self.per_host_limit, min_window=4)
+            else:
+                semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._slots[key] = semaphore
+        await semaphore.acquire()
+
+    def release_slot(self, key):
+        """归还该主机的并发名额"""
+        self._slots[key].release()
+
+    def record(self, key, latency=None, congested=False):
+        """自适应并发时记录该主机一次请求的耗时（秒）或拥塞信号"""
+        if self.adaptive:
+            self._slots[key].record(latency, congested)
+
+    def responded(self, key):
+        """自适应并发时该主机是否成功响应过（从未响应的主机超时说明主机不可达，而不是拥塞）"""
+        limit = self._slots.get(key)
+        return isinstance(limit, AdaptiveLimit) and limit.baseline is not None
+
+    def adaptive_summary(self):
+        """自适应并发时各主机的并发上限统计 {'主机:端口': {...}}"""
+        if not self.adaptive:
+            return {}
+        return {f'{host}:{port}': limit.summary() for (scheme, host, port), limit in self._slots.items()}
+
+    def get_idle(self, key):
+        """取出一个仍然可用的空闲连接，没有则返回None"""
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            reader, writer, since = idle.pop()
+            if now - since < self.idle_timeout and not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    def put_idle(self, key, reader, writer):
+        """把连接放回空闲列表"""
+        if writer.is_closing():
+            return
+        self._idle.setdefault(key, []).append((reader, writer, time.monotonic()))
+
+    def close(self):
+        """关闭所有空闲连接"""
+        for idle in self._idle.values():
+            for reader, writer, since in idle:
+                writer.close()
+        self._idle.clear()
+
+
+def host_key(parts, ports=HTTP_PORTS):
+    """由urlsplit的结果得到 (协议, 主机, 端口)，用于连接池和熔断器
+
+    ports为允许的协议及其默认端口，默认只允许HTTP(S)；原生协议用NATIVE_PORTS，不区分协议时用DEFAULT_PORTS。
+    """
+    scheme = parts.scheme.lower()
+    if scheme not in ports:
+        raise ValueError(f'不支持的协议: {scheme}')
+    host = parts.hostname
+    if not host:
+        raise ValueError(f'无效的URL: {parts.geturl()}')
+    return scheme, host, parts.port or ports[scheme]
+
+
+def _remove_dot_segments(path):
+    """去掉路径中的 . 和 .. 段（RFC 3986 5.2.4）"""
+    segments = []
+    parts = path.split('/')
+    for segment in parts:
+        if segment == '..':
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+    if parts[-1] in ('.', '..'):
+        segments.append('')
+    return '/'.join(segments)
+
+
+def normalize_url(url, strip_params=()):
+    """规范化URL（协议和主机小写、去掉默认端口、.和..路径段以及#片段），用作结果缓存和去重的键
+
+    strip_params 为需要去掉的查询参数名（不区分大小写），如鉴权token，
+    去掉后只有这些参数不同的地址视为同一个流。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.rsplit('@', 1)
+    host = netloc[-1].lower()
+    default_port = f':{DEFAULT_PORTS[scheme]}' if scheme in DEFAULT_PORTS else None
+    if default_port and host.endswith(default_port):
+        host = host[:-len(default_port)]
+    netloc = host if len(netloc) == 1 else f'{netloc[0]}@{host}'
+    path = parts.path or '/'
+    if '/.' in path:
+        path = _remove_dot_segments(path)
+    query = parts.query
+    if query and strip_params:
+        query = '&'.join(param for param in query.split('&')
+                         if param and param.split('=', 1)[0].lower() not in strip_params)
+    return f"{scheme}://{netloc}{path}" + (f'?{query}' if query else '')
+
+
+class HostResolutionError(OSError):
+    """域名无法解析"""
+
+
+class DnsCache:
+    """DNS解析缓存
+
+    同一主机只解析一次，并发请求同一主机时共用同一次解析；成功和失败的结果都按TTL缓存，
+    无法解析的主机上的其他频道可以直接判定失败，不再占用并发名额和超时时间。
+    系统解析器不返回记录的TTL，这里使用固定的缓存时间。
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, max_workers=64):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self._entries = {}
+        self._pending = {}
+        self._executor = None
+
+    def cached_error(self, host):
+        """若该主机在缓存中被记为无法解析，返回对应的异常，否则返回None"""
+        entry = self._entries.get(host)
+        if entry is not None and entry[0] > time.monotonic() and isinstance(entry[1], Exception):
+            return entry[1]
+        return None
+
+    async def resolve(self, host):
+        """解析主机名，返回IP地址列表；无法解析时抛出HostResolutionError"""
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        entry = self._entries.get(host)
+        if entry is not None and entry[0] > time.monotonic():
+            if isinstance(entry[1], Exception):
+                raise entry[1]
+            return entry[1]
+
+        future = self._pending.get(host)
+        if future is None:
+            future = asyncio.ensure_future(self._lookup(host))
+            self._pending[host] = future
+            future.add_done_callback(lambda f: self._pending.pop(host, None))
+        return await asyncio.shield(future)
+
+    async def prefetch(self, hosts):
+        """并发预解析一批主机，返回无法解析的主机集合"""
+        hosts = set(hosts)
+        results = await asyncio.gather(*(self.resolve(host) for host in hosts), return_exceptions=True)
+        return {host for host, result in zip(hosts, results) if isinstance(result, HostResolutionError)}
+
+    async def _lookup(self, host):
+        """调用系统解析器并写入缓存"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.run_in_executor(
+                self._executor, socket.getaddrinfo, host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            error = HostResolutionError(f'域名解析失败: {e}')
+            self._entries[host] = (time.monotonic() + self.negative_ttl, error)
+            raise error
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._entries[host] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def close(self):
+        """关闭解析线程池（缓存保留，下次使用时自动重建线程池）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class HostUnreachableError(ConnectionError):
+    """主机已被熔断"""
+
+
+class HostHealth:
+    """主机熔断器
+
+    同一主机连续 threshold 次连接失败或超时后熔断：该主机上剩余的频道直接判定失败，
+    不再逐个等待超时。熔断 cooldown 秒后放行一个探测请求，成功则恢复，失败则继续熔断。
+    收到任何HTTP响应（无论状态码）都说明主机可达，会清零失败计数。
+    """
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._opened = {}
+        self._probing = set()
+
+    @property
+    def open_hosts(self):
+        """当前处于熔断状态的主机"""
+        return list(self._opened)
+
+    def is_open(self, key):
+        """主机已熔断且不能放行探测请求"""
+        opened = self._opened.get(key)
+        if opened is None:
+            return False
+        return key in self._probing or time.monotonic() - opened < self.cooldown
+
+    def allow(self, key):
+        """是否允许向该主机发出请求；熔断冷却结束后只放行一个探测请求"""
+        if key not in self._opened:
+            return True
+        if self.is_open(key):
+            return False
+        self._probing.add(key)
+        return True
+
+    def record_success(self, key):
+        self._failures.pop(key, None)
+        self._opened.pop(key, None)
+        self._probing.discard(key)
+
+    def record_failure(self, key):
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        if key in self._probing:
+            self._probing.discard(key)
+            self._opened[key] = time.monotonic()
+        elif failures >= self.threshold and key not in self._opened:
+            self._opened[key] = time.monotonic()
+
+    def release_probe(self, key):
+        """探测请求因其他原因（如被取消）结束，允许再次探测"""
+        self._probing.discard(key)
+
+    def unreachable_error(self, key):
+        scheme, host, port = key
+        return HostUnreachableError(
+            f'主机不可达: {host}:{port} 连续{self.threshold}次以上连接失败，已跳过')
+
+
+def _add_timing(timings, phase, start):
+    """累加某阶段耗时（秒）"""
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0) + time.monotonic() - start
+
+
+def get_proxies():
+    """获取环境变量 HTTP_PROXY/HTTPS_PROXY/NO_PROXY 中的代理设置（只读取一次）"""
+    global _proxies
+    if _proxies is None:
+        _proxies = getproxies_environment()
+    return _proxies
+
+
+def proxy_for(scheme, host):
+    """该地址应使用的代理（与requests相同，按NO_PROXY排除），返回代理地址的urlsplit结果，不使用代理时返回None"""
+    proxies = get_proxies()
+    proxy = proxies.get(scheme)
+    if not proxy or proxy_bypass_environment(host, proxies):
+        return None
+    parts = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+    if parts.scheme.lower() != 'http' or not parts.hostname:
+        raise ValueError(f'不支持的代理地址: {proxy}')
+    return parts
+
+
+def _basic_auth(username, password):
+    """Basic认证头的值，用户名和密码取自URL（需要先解码%转义）"""
+    credentials = f'{unquote(username)}:{unquote(password or "")}'.encode('utf-8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+async def _proxy_tunnel(reader, writer, host, port, proxy):
+    """通过HTTP代理的CONNECT方法建立到目标主机的隧道（用于https）"""
+    lines = [f'CONNECT {host}:{port} HTTP/1.1', f'Host: {host}:{port}', f'User-Agent: {USER_AGENT}']
+    if proxy.username:
+        lines.append('Proxy-Authorization: ' + _basic_auth(proxy.username, proxy.password))
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+    await writer.drain()
+    fields = (await reader.readline()).decode('latin-1').split(None, 2)
+    if len(fields) < 2 or not fields[0].startswith('HTTP/'):
+        raise ConnectionError('代理返回了无效的响应')
+    await _read_headers(reader)
+    if fields[1] != '200':
+        raise ConnectionError(f'代理拒绝建立隧道: HTTP {fields[1]}')
+
+
+async def _open_connection(scheme, host, port, dns=None, timings=None, proxy=None):
+    """建立TCP连接（https时完成TLS握手），有DNS缓存时依次尝试解析出的各个地址
+
+    Python 3.11起先建立TCP连接再升级为TLS，TLS握手耗时单独记为'tls'；更早的版本中计入'connect'。
+    proxy为代理地址（proxy_for的结果）时连接代理，https通过CONNECT隧道（需要Python 3.11或更高版本）。
+    """
+    if scheme not in HTTP_PORTS:
+        raise ValueError(f'不支持的协议: {scheme}')
+    tunnel = proxy is not None and scheme == 'https'
+    if tunnel and not hasattr(asyncio.StreamWriter, 'start_tls'):
+        raise ConnectionError('通过代理访问https需要Python 3.11或更高版本')
+    connect_host, connect_port = (proxy.hostname, proxy.port or 80) if proxy is not None else (host, port)
+    start = time.monotonic()
+    addresses = await dns.resolve(connect_host) if dns is not None else [connect_host]
+    _add_timing(timings, 'dns', start)
+
+    start = time.monotonic()
+    last_error = None
+    for address in addresses:
+        try:
+            if scheme == 'https' and not hasattr(asyncio.StreamWriter, 'start_tls'):
+                connection = await asyncio.open_connection(
+                    address, port, ssl=get_ssl_context(), server_hostname=host)
+                _add_timing(timings, 'connect', start)
+                return connection
+            reader, writer = await asyncio.open_connection(address, connect_port)
+            _add_timing(timings, 'connect', start)
+            if tunnel:
+                try:
+                    await _proxy_tunnel(reader, writer, host, port, proxy)
+                except BaseException:
+                    writer.close()
+                    raise
+            if scheme == 'https':
+                handshake = time.monotonic()
+                try:
+                    await writer.start_tls(get_ssl_context(), server_hostname=host)
+                except BaseException:
+                    writer.close()
+                    raise
+                _add_timing(timings, 'tls', handshake)
+            return reader, writer
+        except OSError as e:
+            last_error = e
+    raise last_error
+
+
+async def _open_tcp(host, port, dns=None, timings=None):
+    """建立普通TCP连接（RTSP/RTMP），有DNS缓存时依次尝试解析出的各个地址"""
+    start = time.monotonic()
+    addresses = await dns.resolve(host) if dns is not None else [host]
+    _add_timing(timings, 'dns', start)
+
+    start = time.monotonic()
+    last_error = None
+    for address in addresses:
+        try:
+            connection = await asyncio.open_connection(address, port)
+        except OSError as e:
+            last_error = e
+        else:
+            _add_timing(timings, 'connect', start)
+            return connection
+    raise last_error
+
+
+async def _read_headers(reader):
+    """读取状态行之后的响应头，返回 {小写名称: 值}"""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, sep, value = line.decode('latin-1').partition(':')
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+async def _roundtrip(reader, writer, request, method, url):
+    """在已建立的连接上发送请求并读取状态行和响应头，返回 (状态码, 响应头, 是否可keep-alive)"""
+    writer.write(request)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('服务器关闭了连接')
+    fields = status_line.decode('latin-1').split(None, 2)
+    if len(fields) < 2 or not fields[0].startswith('HTTP/'):
+        raise ValueError('无效的HTTP响应')
+    status_code = int(fields[1])
+    headers = await _read_headers(reader)
+
+    connection = headers.get('connection', '').lower()
+    if fields[0] == 'HTTP/1.0':
+        keep_alive = 'keep-alive' in connection
+    else:
+        keep_alive = 'close' not in connection
+    return status_code, headers, keep_alive
+
+
+async def _exchange(method, url, parts, key, pool, timings=None, headers=None):
+    """完成一次请求/响应头交换：优先复用连接池中的空闲连接，headers为附加的请求头"""
+    scheme, host, port = key
+    proxy = proxy_for(scheme, host)
+    target = quote(parts.path or '/', safe=URL_SAFE_CHARS)
+    if parts.query:
+        target += '?' + quote(parts.query, safe=URL_SAFE_CHARS)
+    host_header = parts.netloc.rsplit('@', 1)[-1]
+    if proxy is not None and scheme == 'http':
+        # 经代理的http请求使用完整URL
+        target = f'http://{host_header}{target}'
+    lines = [
+        f'{method} {target} HTTP/1.1',
+        f'Host: {host_header}',
+        f'User-Agent: {USER_AGENT}',
+        'Accept: */*',
+        'Connection: keep-alive' if pool is not None else 'Connection: close',
+    ]
+    if parts.username:
+        lines.append('Authorization: ' + _basic_auth(parts.username, parts.password))
+    if proxy is not None and scheme == 'http' and proxy.username:
+        lines.append('Proxy-Authorization: ' + _basic_auth(proxy.username, proxy.password))
+    if headers:
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+    if pool is not None:
+        conn = pool.get_idle(key)
+        if conn is not None:
+            reader, writer = conn
+            try:
+                status_code, headers, keep_alive = await _roundtrip(reader, writer, request, method, url)
+                return HttpResponse(url, method, status_code, headers, reader, writer,
+                                    keep_alive, pool, key)
+            except (ConnectionError, OSError):
+                # 空闲连接已被服务器关闭，改用新连接
+                writer.close()
+            except BaseException:
+                writer.close()
+                raise
+
+    reader, writer = await _open_connection(
+        scheme, host, port, pool.dns if pool is not None else None, timings, proxy)
+    try:
+        status_code, headers, keep_alive = await _roundtrip(reader, writer, request, method, url)
+    except BaseException:
+        writer.close()
+        raise
+    return HttpResponse(url, method, status_code, headers, reader, writer,
+                        keep_alive and pool is not None, pool, key)
+
+
+async def _send_request(method, url, pool=None, timeout=None, timings=None, headers=None):
+    """发送一次HTTP请求，返回解析了响应头的HttpResponse
+
+    timeout只计算网络耗时，不包括等待主机并发名额的时间。
+    """
+    parts = urlsplit(url)
+    key = host_key(parts)
+
+    if pool is None:
+        return await asyncio.wait_for(_exchange(method, url, parts, key, None, timings, headers), timeout)
+
+    health = pool.health
+    if health is not None and health.is_open(key):
+        raise health.unreachable_error(key)
+    start = time.monotonic()
+    await pool.acquire_slot(key)
+    _add_timing(timings, 'host_wait', start)
+    # 等待名额期间主机可能已被熔断
+    if health is not None and not health.allow(key):
+        pool.release_slot(key)
+        raise health.unreachable_error(key)
+    start = time.monotonic()
+    try:
+        response = await asyncio.wait_for(_exchange(method, url, parts, key, pool, timings, headers), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        if health is not None:
+            health.record_failure(key)
+        pool.record(key, congested=isinstance(e, (asyncio.TimeoutError, ConnectionResetError)))
+        pool.release_slot(key)
+        raise
+    except BaseException:
+        if health is not None:
+            health.release_probe(key)
+        pool.release_slot(key)
+        raise
+    if health is not None:
+        health.record_success(key)
+    pool.record(key, time.monotonic() - start, response.status_code in CONGESTION_CODES)
+    return response
+
+
+async def http_request(method, url, pool=None, timeout=None, allow_redirects=True, timings=None,
+                       headers=None):
+    """发送HTTP请求，按需跟随重定向；每一跳的超时单独计算
+
+    timings不为None时，累加各跳的DNS解析('dns')和建立连接('connect')耗时（秒）。
+    headers为附加的请求头（如条件请求的If-None-Match），每一跳都会带上。
+    重定向到HTTP(S)以外的协议（如rtsp://）时抛出ValueError，不会用HTTP请求连接其他协议的端口。
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        response = await _send_request(method, url, pool, timeout, timings, headers)
+        location = response.headers.get('location')
+        if not allow_redirects or response.status_code not in REDIRECT_CODES or not location:
+            return response
+        response.close()
+        url = urljoin(url, location)
+        scheme = urlsplit(url).scheme.lower()
+        if scheme not in HTTP_PORTS:
+            raise ValueError(f'重定向到不支持的协议: {scheme}')
+    raise ConnectionError(f'重定向次数超过{MAX_REDIRECTS}次')
+
+
+class StreamValidationError(Exception):
+    """流内容校验失败"""
+
+
+def is_stream_url(text):
+    """是否为支持检测的流地址（http(s)/rtsp/rtmp/udp/rtp）"""
+    return text[:8].lower().startswith(STREAM_URL_PREFIXES)
+
+
+async def native_request(url, pool, timeout, timings, exchange):
+    """连接RTSP/RTMP服务器并用 exchange(reader, writer, parts) 完成协议交互，返回它的结果
+
+    与HTTP请求共用连接池的单主机名额、DNS缓存和主机熔断（连接不复用）；timeout不包括等待主机名额的时间。
+    """
+    parts = urlsplit(url)
+    key = host_key(parts, NATIVE_PORTS)
+    health = pool.health if pool is not None else None
+    if health is not None and health.is_open(key):
+        raise health.unreachable_error(key)
+
+    async def session():
+        reader, writer = await _open_tcp(key[1], key[2], pool.dns if pool is not None else None, timings)
+        try:
+            return await exchange(reader, writer, parts)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError('服务器关闭了连接') from None
+        finally:
+            writer.close()
+
+    if pool is not None:
+        start = time.monotonic()
+        await pool.acquire_slot(key)
+        _add_timing(timings, 'host_wait', start)
+    try:
+        if health is not None and not health.allow(key):
+            raise health.unreachable_error(key)
+        try:
+            result = await asyncio.wait_for(session(), timeout)
+        except (OSError, asyncio.TimeoutError):
+            if health is not None:
+                health.record_failure(key)
+            raise
+        except BaseException:
+            if health is not None:
+                health.release_probe(key)
+            raise
+        if health is not None:
+            health.record_success(key)
+        return result
+    finally:
+        if pool is not None:
+            pool.release_slot(key)
+
+
+async def _rtsp_request(reader, writer, parts, method, *headers):
+    """发送一个RTSP请求，返回 (状态码, 响应头)"""
+    netloc = parts.netloc.rsplit('@', 1)[-1]
+    target = f"rtsp://{netloc}{parts.path or '/'}" + (f'?{parts.query}' if parts.query else '')
+    lines = [f'{method} {target} RTSP/1.0', 'CSeq: 1', f'User-Agent: {USER_AGENT}', *headers]
+    if parts.username:
+        lines.append('Authorization: ' + _basic_auth(parts.username, parts.password))
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+    await writer.drain()
+
+    fields = (await reader.readline()).decode('latin-1').split(None, 2)
+    if len(fields) < 2 or not fields[0].startswith('RTSP/'):
+        raise ValueError('无效的RTSP响应')
+    return int(fields[1]), await _read_headers(reader)
+
+
+async def rtsp_describe(reader, writer, parts):
+    """发送RTSP DESCRIBE请求，返回 (状态码, SDP描述)"""
+    status_code, headers = await _rtsp_request(reader, writer, parts, 'DESCRIBE', 'Accept: application/sdp')
+    length = min(int(headers.get('content-length') or 0), HLS_PLAYLIST_LIMIT)
+    sdp = await reader.readexactly(length) if status_code == 200 and length > 0 else b''
+    return status_code, sdp
+
+
+async def rtsp_options(reader, writer, parts):
+    """发送RTSP OPTIONS请求，返回状态码"""
+    return (await _rtsp_request(reader, writer, parts, 'OPTIONS'))[0]
+
+
+async def rtmp_handshake(reader, writer, parts):
+    """完成RTMP握手（C0/C1 -> S0/S1/S2 -> C2），服务器的协议版本不是3时抛出StreamValidationError"""
+    writer.write(b'\x03' + bytes(8) + os.urandom(RTMP_HANDSHAKE_SIZE - 8))
+    await writer.drain()
+    s0s1 = await reader.readexactly(1 + RTMP_HANDSHAKE_SIZE)
+    if s0s1[0] != 3:
+        raise StreamValidationError(f'RTMP握手失败: 服务器版本 {s0s1[0]}')
+    writer.write(s0s1[1:])
+    await writer.drain()
+    await reader.readexactly(RTMP_HANDSHAKE_SIZE)
+
+
+def rtp_payload(data):
+    """去掉RTP头（含CSRC和扩展头），不是RTP数据包时返回None"""
+    if len(data) < 12 or data[0] >> 6 != 2:
+        return None
+    offset = 12 + 4 * (data[0] & 0x0f)
+    if data[0] & 0x10 and len(data) >= offset + 4:
+        offset += 4 + 4 * int.from_bytes(data[offset + 2:offset + 4], 'big')
+    return data[offset:] if len(data) > offset else None
+
+
+async def receive_datagram(url, timeout):
+    """udp://、rtp:// 地址：加入组播组（单播地址时监听该端口），在timeout秒内等待第一个数据包
+
+    只在本机网络已接入组播源时才能收到数据。Linux上绑定到组播地址，只收该组的数据；
+    Windows不能绑定组播地址，同一端口的多个组同时检测时可能收到其他组的数据。
+    单播地址是本机地址时只在该地址上接收，否则（多为发送端的地址）在本机所有地址上监听该端口。
+    端口无法监听或无法加入组播组时抛出ValueError（重试也不会成功，不作为暂时性失败）。
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if not parts.port:
+        raise ValueError(f'缺少端口: {url}')
+    try:
+        multicast = ipaddress.IPv4Address(host).is_multicast if host else False
+    except ValueError:
+        raise ValueError(f'只支持IPv4地址: {url}') from None
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setblocking(False)
+        try:
+            try:
+                sock.bind((host, parts.port))
+            except OSError:
+                sock.bind(('', parts.port))
+        except OSError as e:
+            raise ValueError(f'无法监听端口 {parts.port}: {e.strerror or e}') from None
+        if multicast:
+            membership = socket.inet_aton(host) + socket.inet_aton('0.0.0.0')
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            except OSError as e:
+                raise ValueError(f'无法加入组播组 {host}: {e.strerror or e}') from None
+        return await asyncio.wait_for(asyncio.get_running_loop().sock_recv(sock, DATAGRAM_SIZE), timeout)
+    finally:
+        sock.close()
+
+
+_HLS_ATTR_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_hls_playlist(text, base_url):
+    """解析HLS播放列表
+
+    返回 {'variants': [(带宽, URL)], 'segment': 第一个分片URL, 'encrypted': 是否加密}，
+    主播放列表只有variants，媒体播放列表只有segment。
+    """
+    variants = []
+    segment = None
+    encrypted = False
+    stream_inf = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attrs = dict(_HLS_ATTR_PATTERN.findall(line[18:]))
+            try:
+                stream_inf = int(attrs.get('BANDWIDTH', '0'))
+            except ValueError:
+                stream_inf = 0
+        elif line.startswith('#EXT-X-KEY:'):
+            attrs = dict(_HLS_ATTR_PATTERN.findall(line[11:]))
+            encrypted = attrs.get('METHOD', 'NONE') != 'NONE'
+        elif line.startswith('#'):
+            continue
+        elif stream_inf is not None:
+            variants.append((stream_inf, urljoin(base_url, line)))
+            stream_inf = None
+        elif segment is None:
+            segment = urljoin(base_url, line)
+    return {'variants': variants, 'segment': segment, 'encrypted': encrypted}
+
+
+def sniff_media(data):
+    """根据开头的字节判断媒体格式，无法识别时返回None"""
+    if data.startswith(b'ID3') and len(data) >= 10:
+        # 跳过ID3标签（HLS打包音频常见）
+        size = ((data[6] & 0x7f) << 21) | ((data[7] & 0x7f) << 14) | ((data[8] & 0x7f) << 7) | (data[9] & 0x7f)
+        data = data[10 + size:]
+        if not data:
+            return 'id3'
+    if data[:1] == b'\x47' and (len(data) <= 188 or data[188:189] == b'\x47'):
+        return 'ts'
+    if data[4:8] in (b'ftyp', b'styp', b'moof', b'sidx', b'moov'):
+        return 'mp4'
+    if data.startswith(b'FLV'):
+        return 'flv'
+    if len(data) >= 2 and data[0] == 0xff and (data[1] & 0xf6) == 0xf0:
+        return 'aac'
+    return None
+
+
+class Histogram:
+    """固定桶的耗时直方图（秒），与Prometheus的histogram相同：counts[i]为落在第i个桶（<= METRIC_BUCKETS[i]）的次数，
+    最后一个为超出全部桶的次数"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶线性插值估算分位数（秒），没有数据时返回None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = METRIC_BUCKETS[i - 1] if i > 0 else 0.0
+                if i == len(METRIC_BUCKETS):
+                    return lower  # 超出最大的桶，只知道下限
+                return lower + (METRIC_BUCKETS[i] - lower) * (rank - seen) / count
+            seen += count
+        return METRIC_BUCKETS[-1]
+
+
+class Metrics:
+    """检测过程的计数器和分阶段耗时直方图，可导出为Prometheus文本格式，或汇总到检测报告
+
+    计数器见METRIC_COUNTERS，耗时阶段见METRIC_PHASES。检测引擎、界面线程和导出线程都会访问，用锁保护。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = collections.Counter()  # (名称, 标签值) -> 计数，无标签时标签值为''
+        self.histograms = {}
+
+    def inc(self, name, label='', amount=1):
+        with self._lock:
+            self.counters[name, label] += amount
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_timings(self, timings):
+        """记录一次请求timings中的各阶段耗时"""
+        for phase in REQUEST_PHASES:
+            if phase in timings:
+                self.observe(phase, timings[phase])
+
+    def state(self, exclude=()):
+        """可序列化的原始数据，用于把工作进程的指标合并到主进程；exclude为不包括的计数器"""
+        with self._lock:
+            return {'counters': [(key, value) for key, value in self.counters.items() if key[0] not in exclude],
+                    'histograms': {phase: (h.counts[:], h.sum, h.count) for phase, h in self.histograms.items()}}
+
+    def merge(self, state):
+        with self._lock:
+            for key, value in state['counters']:
+                self.counters[tuple(key)] += value
+            for phase, (counts, total, count) in state['histograms'].items():
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    histogram = self.histograms[phase] = Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def render(self):
+        """Prometheus文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            for name, (description, label_name) in METRIC_COUNTERS.items():
+                values = sorted((label, value) for (counter, label), value in self.counters.items() if counter == name)
+                lines.append(f'# HELP {METRIC_PREFIX}{name} {description}')
+                lines.append(f'# TYPE {METRIC_PREFIX}{name} counter')
+                if not label_name:
+                    lines.append(f'{METRIC_PREFIX}{name} {sum(value for label, value in values)}')
+                for label, value in values if label_name else ():
+                    lines.append(f'{METRIC_PREFIX}{name}{{{label_name}="{label}"}} {value}')
+            name = f'{METRIC_PREFIX}phase_seconds'
+            lines.append(f'# HELP {name} 各阶段耗时（秒）: ' +
+                         '，'.join(f'{phase}={description}' for phase, description in METRIC_PHASES.items()))
+            lines.append(f'# TYPE {name} histogram')
+            for phase in METRIC_PHASES:
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    continue
+                cumulative = 0
+                for bound, count in zip(METRIC_BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{phase="{phase}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """检测报告中的指标汇总：计数器，以及各阶段的次数、平均值和按桶估算的p50/p90/p99（毫秒）"""
+        with self._lock:
+            counters = {}
+            for (name, label), value in sorted(self.counters.items()):
+                if label:
+                    counters.setdefault(name, {})[label] = value
+                else:
+                    counters[name] = value
+            phases = {}
+            for phase in METRIC_PHASES:
+                histogram = self.histograms.get(phase)
+                if histogram is None or not histogram.count:
+                    continue
+                phases[phase] = {'count': histogram.count,
+                                 'avg_ms': round(histogram.sum / histogram.count * 1000, 1)}
+                for q in (0.5, 0.9, 0.99):
+                    phases[phase][f'p{int(q * 100)}_ms'] = round(histogram.quantile(q) * 1000, 1)
+        return {'counters': counters, 'phases': phases}
+
+    def describe(self):
+        """一行中文摘要：主要阶段的p50/p99"""
+        phases = self.summary()['phases']
+        parts = [f"{METRIC_PHASES[phase]} {stats['p50_ms']}/{stats['p99_ms']}ms"
+                 for phase, stats in phases.items() if phase in METRIC_BRIEF]
+        return '耗时(p50/p99): ' + '，'.join(parts) if parts else ''
+
+
+class MetricsExporter:
+    """检测过程中导出指标：port不为None时在该端口提供 /metrics（Prometheus文本格式）；
+    path不为None时每interval秒把指标写入该文件（先写临时文件再替换，可供node_exporter的textfile采集器读取），
+    close()时再写一次最终结果"""
+
+    def __init__(self, metrics, port=None, host='127.0.0.1', path=None, interval=10):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.path = path
+        self.interval = interval
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.port is not None:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # 不在标准错误中输出访问日志
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+        if self.path is not None:
+            self._threads.append(threading.Thread(target=self._write_periodically, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass  # 下一次再写
+
+    def write(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(1)
+        if self.path is not None:
+            self.write()
+
+
+class HostScheduler:
+    """检测调度器：按主机轮转出频道，同一主机进行中的检测达到per_host_limit时先调度其他主机
+
+    直播源通常按来源分段，按文件顺序检测时几百个连续的频道落在同一主机上，
+    占满全局并发却都在等待该主机的名额，其他主机闲置。
+    priority(channel)返回可比较的优先级时小的先检测，同一优先级内仍按主机轮转。
+    channels为列表时全部参与调度，其他迭代器最多预读window个频道。
+    取出的频道开始检测时调用started(channel)，检测结束时调用done(channel)。
+    """
+
+    def __init__(self, channels, per_host_limit=None, priority=None, interleave=True, window=SCHEDULE_WINDOW):
+        self._source = iter(channels)
+        self.window = None if isinstance(channels, (list, tuple)) else window
+        self.per_host_limit = per_host_limit
+        self.priority = priority
+        self.interleave = interleave
+        self._levels = {}  # 优先级 -> {主机: 待检测频道}，dict的插入顺序即轮转顺序
+        self._parked = {}  # 进行中的检测达到上限的主机 -> {优先级: 待检测频道}
+        self._active = {}  # 主机 -> 进行中的检测数
+        self._buffered = 0
+        self._exhausted = False
+        self._wakeup = None
+
+    def _host(self, channel):
+        if not self.interleave:
+            return ''
+        host = channel.get('host')
+        return host if host is not None else url_host(channel['url'])
+
+    def _add(self, channel):
+        host = self._host(channel)
+        level = self.priority(channel) if self.priority is not None else 0
+        if host in self._parked:
+            queues, key = self._parked[host], level
+        else:
+            queues, key = self._levels.setdefault(level, {}), host
+        waiting = queues.get(key)
+        if waiting is None:
+            waiting = queues[key] = collections.deque()
+        waiting.append(channel)
+        self._buffered += 1
+
+    def _fill(self):
+        while not self._exhausted and (self.window is None or self._buffered < self.window):
+            try:
+                channel = next(self._source)
+            except StopIteration:
+                self._exhausted = True
+            else:
+                self._add(channel)
+
+    async def next(self):
+        """下一个要检测的频道，全部取完时返回None；所有待检测主机都达到并发上限时等待"""
+        while True:
+            self._fill()
+            if self._levels:
+                level = min(self._levels)
+                hosts = self._levels[level]
+                host = next(iter(hosts))
+                waiting = hosts.pop(host)
+                channel = waiting.popleft()
+                if waiting:
+                    hosts[host] = waiting  # 移到队尾，下次轮到其他主机
+                elif not hosts:
+                    del self._levels[level]
+                self._buffered -= 1
+                return channel
+            if self._exhausted and not self._parked:
+                return None
+            self._wakeup = asyncio.Event()
+            await self._wakeup.wait()
+
+    def started(self, channel):
+        if self.per_host_limit is None:
+            return
+        host = self._host(channel)
+        active = self._active[host] = self._active.get(host, 0) + 1
+        if active >= self.per_host_limit and host not in self._parked:
+            parked = self._parked[host] = {}
+            for level in list(self._levels):
+                hosts = self._levels[level]
+                waiting = hosts.pop(host, None)
+                if waiting is not None:
+                    parked[level] = waiting
+                    if not hosts:
+                        del self._levels[level]
+
+    def done(self, channel):
+        if self.per_host_limit is None:
+            return
+        host = self._host(channel)
+        active = self._active[host] - 1
+        if active:
+            self._active[host] = active
+        else:
+            del self._active[host]
+        if active < self.per_host_limit and host in self._parked:
+            for level, waiting in self._parked.pop(host).items():
+                self._levels.setdefault(level, {})[host] = waiting
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+
+class ProbeEngine:
+    """异步检测引擎：单个事件循环内用信号量控制并发，GUI和命令行共用
+
+    检测结果与原来的check_single_channel保持一致：
+    有效频道 {'name', 'url', 'group', 'status': 'valid', 'status_code', 'response_time',
+              'dns_time', 'connect_time', 'ttfb', 'throughput'}
+    无效频道 {'name', 'url', 'group', 'status': 'invalid', 'error', ['status_code']}
+    另有 'channel' 引用原始频道记录（用于无损导出M3U），输出JSON前用result_record()去掉。
+    时间单位为毫秒；throughput为下载速度(字节/秒)，只在开启测速(sample_size>0)时测量，否则为None。
+
+    开启去重(dedup)时，规范化后相同的地址只检测一次，结果分发给引用该地址的每个频道，
+    去重统计见 dedup_stats。已完成的结果只保留最近引用的dedup_window个地址，
+    更早的重复地址（与上次出现相隔很远）会再检测一次。
+    开启自适应并发(adaptive)时，concurrency和per_host_limit是并发上限的最大值，实际上限根据延迟、
+    超时和限流(429/503)按AIMD自动调整，调整过程见 concurrency_stats。
+    设置了metrics（Metrics）时记录各阶段耗时、重试次数和失败原因。
+    开启失败重试(retry)时分两轮检测：第一轮用first_pass_timeout（默认为timeout的三分之一，至少2秒）检测全部频道，
+    超时和暂时性失败的频道等第一轮全部结束、再过retry_delay秒后用完整的timeout重新检测。
+    每个结果的 'tier' 为决定该结果的轮次（1或2），两轮的统计见 tier_stats。
+    检测顺序由HostScheduler决定：默认(interleave)按主机轮转，同一主机同时只发出per_host_limit个检测；
+    priority_groups中的分组按列出的顺序优先检测；prefer_valid时按上次的状态排序（上次有效的最先、没有记录的其次），
+    上次的状态取自prior_status（{规范化URL: 状态}）或结果库(store)。
+    """
+
+    def __init__(self, timeout=10, method="HEAD", retry=True, concurrency=200, per_host_limit=10,
+                 prefetch_dns=True, breaker_threshold=5, hls_concurrency=50,
+                 sample_size=0, sample_seconds=2, store=None, dedup=True, strip_params=(),
+                 adaptive=False, journal=None, metrics=None, first_pass_timeout=None,
+                 retry_delay=RETRY_DELAY, interleave=True, priority_groups=(), prefer_valid=False,
+                 prior_status=None, dedup_window=DEDUP_WINDOW):
+        if method not in CHECK_METHODS:
+            raise ValueError(f'不支持的检测方法: {method}')
+        self.timeout = timeout
+        self.method = method
+        self.retry = retry
+        if first_pass_timeout is None:
+            first_pass_timeout = min(timeout, max(2, timeout // 3))
+        self.first_pass_timeout = first_pass_timeout
+        self.retry_delay = retry_delay
+        self.tier_stats = {'first_pass': 0, 'deferred': 0, 'second_pass': 0, 'recovered': 0}
+        self._timeout = timeout
+        self.concurrency = max(1, int(concurrency))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.prefetch_dns = prefetch_dns
+        self.breaker_threshold = breaker_threshold
+        self.hls_concurrency = max(1, int(hls_concurrency))
+        self.sample_size = max(0, int(sample_size))
+        self.sample_seconds = sample_seconds
+        self.store = store
+        self.journal = journal
+        self.metrics = metrics
+        self.dedup = dedup
+        self.dedup_window = max(0, int(dedup_window))
+        self.strip_params = frozenset(name.lower() for name in strip_params)
+        self.dedup_stats = {'total': 0, 'unique': 0, 'duplicates': 0}
+        self.adaptive = adaptive
+        self.interleave = interleave
+        self.priority_groups = tuple(priority_groups)
+        self.prefer_valid = prefer_valid
+        self.prior_status = prior_status
+        self.concurrency_stats = None
+        self._loop = None
+        self._main_task = None
+        self._tasks = set()
+        self.cancelled = 0
+        self.dns = DnsCache()
+        self.health = None
+        self._hls_semaphore = None
+        self._hls_cache = {}
+        self.pool = None
+        self.stopped = False
+
+    def stop(self):
+        """停止检测（可从其他线程调用）：不再发出新的检测，进行中的检测立即取消并关闭连接"""
+        self.stopped = True
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._cancel)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+
+    def _cancel(self):
+        """在事件循环中取消进行中的检测和主流程（DNS预解析、等待并发名额等）"""
+        self.cancelled = len(self._tasks)
+        for task in list(self._tasks):
+            task.cancel()
+        if self._main_task is not None:
+            self._main_task.cancel()
+
+    async def run(self, channels, on_result, on_status=None):
+        """并发检测所有频道，每完成一个就调用一次on_result(result)
+
+        on_status(message) 用于报告预解析等阶段性信息，可为None。
+        设置了结果库(store)时，每个检测结果都会写入结果库；结果库开启了增量检测时，
+        近期检测过且状态稳定的频道直接使用上次的结果（带 'cached': True），不再检测。
+        同时进行的检测不超过并发上限，channels可以是任意迭代器（边读边检测）；
+        其他线程调用stop()后，进行中的检测被取消（没有结果），run随即返回。
+        设置了进度日志(journal)时，每个结果都会追加到日志中，日志中已有结果的频道直接输出记录的结果。
+        """
+        store = self.store
+        journal = self.journal
+        metrics = self.metrics
+        report = on_result
+        if metrics is not None:
+            counted = report
+
+            def report(result):
+                metrics.inc('results_total', result['status'])
+                counted(result)
+
+        if journal is not None:
+            pending_channels = journal.pending(channels, report)
+            if isinstance(channels, (list, tuple)):
+                channels = list(pending_channels)
+                if on_status and journal.resumed:
+                    on_status(f"断点续检: {journal.resumed} 个频道上次已完成，只检测剩余的 {len(channels)} 个")
+            else:
+                channels = pending_channels
+
+            output = report
+
+            def report(result):
+                journal.record(result)
+                output(result)
+
+        # 去重：规范化地址 -> 等待结果的重复频道（检测中）或已完成的检测字段
+        # （只保留检测字段、不引用频道，流式检测时已输出的频道可以释放；按最近引用淘汰，最多dedup_window个）
+        pending = {}
+        finished = collections.OrderedDict()
+        dedup_window = self.dedup_window
+        stats = self.dedup_stats = {'total': 0, 'unique': 0, 'duplicates': 0}
+
+        def on_result(result, key=None):
+            if store is not None:
+                store.record(result)
+            report(result)
+            if key is not None:
+                outcome = self._outcome(result)
+                for duplicate in pending.pop(key):
+                    fan_out(duplicate, outcome)
+                if dedup_window:
+                    finished[key] = outcome
+                    if len(finished) > dedup_window:
+                        finished.popitem(last=False)
+
+        def fan_out(channel, outcome):
+            source_url, status, fields = outcome
+            result = make_result(channel, status, **fields)
+            if store is not None and self.strip_params and normalize_url(channel['url']) != normalize_url(source_url):
+                # 只有鉴权参数不同的地址在结果库中是不同的键，也要记录
+                store.record(result)
+            report(result)
+
+        if store is not None:
+            if store.max_age > 0:
+                fresh = store.fresh_results(channels, report)
+                if isinstance(channels, (list, tuple)):
+                    channels = list(fresh)
+                    if on_status:
+                        on_status(f"增量检测: {store.skipped} 个频道近期状态稳定，沿用上次结果")
+                else:
+                    channels = fresh
+
+        self.stopped = False
+        # 熔断状态跨多次run保留：同一引擎反复检测时（常驻监控），不可达的主机在冷却期内继续跳过
+        if self.breaker_threshold <= 0:
+            self.health = None
+        elif self.health is None:
+            self.health = HostHealth(self.breaker_threshold)
+        self.pool = ConnectionPool(self.per_host_limit, dns=self.dns, health=self.health,
+                                   adaptive=self.adaptive)
+        self._hls_semaphore = asyncio.Semaphore(self.hls_concurrency)
+        self._hls_cache = {}
+        if self.adaptive:
+            semaphore = AdaptiveLimit(min(16, self.concurrency), self.concurrency, latency_factor=3.0)
+        else:
+            semaphore = asyncio.Semaphore(self.concurrency)
+        self.concurrency_stats = None
+        tasks = self._tasks = set()
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        self.cancelled = 0
+        # 两轮检测：第一轮暂时性失败的频道 (频道, 去重键) 留到第二轮
+        two_pass = self.retry
+        self._timeout = min(self.first_pass_timeout, self.timeout) if two_pass else self.timeout
+        deferred = []
+        tier_stats = self.tier_stats = {'first_pass': 0, 'deferred': 0, 'second_pass': 0, 'recovered': 0}
+
+        def finish(result, kind, key, tier):
+            if kind is not None:
+                self._record_error(kind)
+            result['tier'] = tier
+            if tier == 1:
+                tier_stats['first_pass'] += 1
+            else:
+                tier_stats['second_pass'] += 1
+                if kind is None:
+                    tier_stats['recovered'] += 1
+            on_result(result, key)
+
+        async def worker(channel, key, tier, scheduler):
+            try:
+                result, kind = await self._attempt(channel)
+            finally:
+                semaphore.release()
+                scheduler.done(channel)
+            if self.adaptive:
+                congested = result.get('status_code') in CONGESTION_CODES or \
+                    (kind == 'timeout' and self._host_responded(channel))
+                response_time = result.get('response_time')
+                semaphore.record(response_time / 1000 if response_time is not None else None, congested)
+            if two_pass and tier == 1 and kind in TRANSIENT_ERRORS:
+                deferred.append((channel, key))
+            else:
+                finish(result, kind, key, tier)
+
+        async def submit(channel, key, tier, scheduler):
+            """提交一个频道的检测，返回False表示已停止"""
+            error = self._fast_fail(channel)
+            if error is not None:
+                if two_pass and tier == 1 and isinstance(error, HostUnreachableError):
+                    # 熔断的主机可能只是暂时过载，第二轮换新的熔断状态再试
+                    deferred.append((channel, key))
+                else:
+                    finish(make_result(channel, 'invalid', error=str(error)),
+                           'dns' if isinstance(error, HostResolutionError) else 'breaker', key, tier)
+                return True
+            wait_start = time.monotonic()
+            await semaphore.acquire()
+            if metrics is not None:
+                metrics.observe('queue_wait', time.monotonic() - wait_start)
+            if self.stopped:
+                semaphore.release()
+                return False
+            scheduler.started(channel)
+            task = asyncio.ensure_future(worker(channel, key, tier, scheduler))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return True
+
+        try:
+            if self.prefetch_dns and isinstance(channels, (list, tuple)) and channels:
+                # 预解析：每个主机只解析一次，无法解析的主机上的频道直接判定失败
+                # 经代理访问的主机由代理解析，不预解析
+                hosts = set()
+                for channel in channels:
+                    try:
+                        parts = urlsplit(channel['url'])
+                        if parts.hostname and proxy_for(parts.scheme.lower(), parts.hostname) is None:
+                            hosts.add(parts.hostname)
+                    except ValueError:
+                        continue
+                failed = await self.dns.prefetch(hosts)
+                if on_status:
+                    on_status(f"DNS预解析完成: {len(hosts)} 个主机，其中 {len(failed)} 个无法解析")
+
+            scheduler = self._scheduler(channels)
+            while True:
+                channel = await scheduler.next()
+                if channel is None:
+                    break
+                stats['total'] += 1
+                key = self._dedup_key(channel)
+                if key is not None:
+                    outcome = finished.get(key)
+                    if outcome is not None:
+                        finished.move_to_end(key)
+                        stats['duplicates'] += 1
+                        if metrics is not None:
+                            metrics.inc('duplicates_total')
+                        fan_out(channel, outcome)
+                        continue
+                    if key in pending:
+                        stats['duplicates'] += 1
+                        if metrics is not None:
+                            metrics.inc('duplicates_total')
+                        pending[key].append(channel)
+                        continue
+                stats['unique'] += 1
+                if key is not None:
+                    pending[key] = []
+                if not await submit(channel, key, 1, scheduler):
+                    break
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+            if deferred and not self.stopped:
+                tier_stats['deferred'] = len(deferred)
+                if on_status:
+                    on_status(f"第一轮检测完成，{len(deferred)} 个频道超时或暂时失败，"
+                              f"{self.retry_delay} 秒后用 {self.timeout} 秒超时重新检测")
+                await asyncio.sleep(self.retry_delay)
+                # 第二轮：完整超时，熔断状态和HLS缓存重新开始（第一轮的失败多半是超时太短造成的）
+                self._timeout = self.timeout
+                if self.health is not None:
+                    self.health = self.pool.health = HostHealth(self.breaker_threshold)
+                self._hls_cache = {}
+                keys = {id(channel): key for channel, key in deferred}
+                scheduler = self._scheduler([channel for channel, key in deferred])
+                deferred.clear()
+                while True:
+                    channel = await scheduler.next()
+                    if channel is None:
+                        break
+                    if metrics is not None:
+                        metrics.inc('retries_total')
+                    if not await submit(channel, keys[id(channel)], 2, scheduler):
+                        break
+                if tasks:
+                    await asyncio.gather(*tasks)
+                if on_status and not self.stopped:
+                    on_status(f"第二轮检测完成: {tier_stats['recovered']}/{tier_stats['deferred']} 个频道恢复正常")
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+            # stop()取消了进行中的检测（这些频道没有结果），等它们关闭各自的连接
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if on_status:
+                on_status(f"检测已停止，取消了 {self.cancelled} 个进行中的检测")
+        else:
+            if stats['duplicates'] and on_status:
+                on_status(f"去重: {stats['duplicates']} 个频道与其他频道地址相同，"
+                          f"实际检测 {stats['unique']} 个地址")
+            if self.health is not None and self.health.open_hosts and on_status:
+                on_status(f"已熔断 {len(self.health.open_hosts)} 个不可达主机")
+        finally:
+            if self.adaptive:
+                self.concurrency_stats = {'global': semaphore.summary(trajectory=True),
+                                          'hosts': self.pool.adaptive_summary()}
+                if on_status:
+                    on_status(f"自适应并发: 最终 {semaphore.limit}（运行中 {semaphore.lowest}~{semaphore.highest}，"
+                              f"降低 {semaphore.decreases} 次）")
+            self._loop = None
+            self._main_task = None
+            self._tasks = set()
+            self.pool.close()
+            self.pool = None
+            self.dns.close()
+            self._hls_semaphore = None
+            self._hls_cache = {}
+            if store is not None:
+                store.flush()
+                if metrics is not None and store.max_age > 0:
+                    metrics.inc('cached_total', amount=store.skipped)
+            if journal is not None:
+                journal.flush()
+
+    def _scheduler(self, channels):
+        """按主机轮转和优先级排列channels的调度器"""
+        return HostScheduler(channels, self.per_host_limit if self.interleave else None,
+                             priority=self._priority(), interleave=self.interleave)
+
+    def _priority(self):
+        """调度优先级函数（返回值小的先检测），不需要排序时返回None"""
+        groups = {group: rank for rank, group in enumerate(self.priority_groups)}
+        last_status = None
+        if self.prefer_valid:
+            if self.prior_status is not None:
+                last_status = self.prior_status.get
+            elif self.store is not None:
+                last_status = self.store.last_status
+        if not groups and last_status is None:
+            return None
+
+        def priority(channel):
+            group_rank = groups.get(channel.get('group', DEFAULT_GROUP), len(groups))
+            if last_status is None:
+                return group_rank, 0
+            try:
+                status = last_status(normalize_url(channel['url']))
+            except ValueError:
+                status = None
+            return group_rank, PRIOR_STATUS_RANK.get(status, PRIOR_STATUS_RANK[None])
+
+        return priority
+
+    async def check_channel(self, channel):
+        """检测单个频道一次（不做第二轮重试），设置了metrics时记录总耗时和失败原因"""
+        result, kind = await self._attempt(channel)
+        if kind is not None:
+            self._record_error(kind)
+        return result
+
+    async def _attempt(self, channel):
+        """检测一次，返回 (结果, 失败类型)，设置了metrics时记录总耗时"""
+        if self.metrics is None:
+            return await self._check_channel(channel)
+        start = time.monotonic()
+        try:
+            return await self._check_channel(channel)
+        finally:
+            self.metrics.observe('probe', time.monotonic() - start)
+
+    def _record_error(self, kind):
+        if self.metrics is not None:
+            self.metrics.inc('errors_total', kind)
+
+    async def _check_channel(self, channel):
+        """用当前轮次的超时检测一次，返回 (结果, 失败类型)
+
+        失败类型为None表示检测通过，否则是 'timeout'、'connection'、'server'（5xx/429）、'breaker'、
+        'dns'、'http'、'stream' 或 'other'，其中TRANSIENT_ERRORS中的类型在第二轮重新检测。
+        """
+        url = channel['url']
+        timings = {}
+        try:
+            start = time.monotonic()
+            try:
+                status_code = await self._probe(url, timings)
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe_timings(timings)
+            total_time = time.monotonic() - start
+
+            if status_code != 200:
+                kind = 'server' if status_code >= 500 or status_code == 429 else 'http'
+                protocol = 'RTSP' if url[:5].lower() == 'rtsp:' else 'HTTP'
+                return make_result(channel, 'invalid', error=f"{protocol} {status_code}",
+                                   status_code=status_code), kind
+            if self.sample_size and 'throughput' not in timings and self.method != HLS_METHOD and \
+                    url[:4].lower() == 'http':
+                await self._measure_throughput(url, timings)
+            throughput = timings.get('throughput')
+            return make_result(
+                channel, 'valid',
+                status_code=status_code,
+                response_time=round(total_time * 1000, 1),
+                dns_time=round(timings.get('dns', 0) * 1000, 1),
+                connect_time=round(timings.get('connect', 0) * 1000, 1),
+                ttfb=round(timings.get('ttfb', total_time) * 1000, 1),
+                throughput=int(throughput) if throughput is not None else None), None
+
+        except HostResolutionError as e:
+            return make_result(channel, 'invalid', error=str(e)), 'dns'
+        except HostUnreachableError as e:
+            return make_result(channel, 'invalid', error=str(e)), 'breaker'
+        except asyncio.TimeoutError:
+            return make_result(channel, 'invalid', error='连接超时'), 'timeout'
+        except StreamValidationError as e:
+            return make_result(channel, 'invalid', error=str(e)), \
+                'timeout' if str(e) == HLS_TIMEOUT_ERROR else 'stream'
+        except Exception as e:
+            return make_result(channel, 'invalid', error=str(e)), 'connection' if isinstance(e, OSError) else 'other'
+
+    def _host_responded(self, channel):
+        try:
+            return self.pool.responded(host_key(urlsplit(channel['url']), DEFAULT_PORTS))
+        except ValueError:
+            return False
+
+    def _dedup_key(self, channel):
+        """去重用的规范化地址，不去重或地址无法解析时返回None"""
+        if not self.dedup:
+            return None
+        try:
+            return normalize_url(channel['url'], self.strip_params)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _outcome(result):
+        """检测结果中与频道无关的部分 (检测的URL, status, 检测字段)，用于分发给引用同一地址的其他频道"""
+        fields = {k: v for k, v in result.items() if k != 'status' and k not in CHANNEL_FIELDS}
+        return result['url'], result['status'], fields
+
+    def _fast_fail(self, channel):
+        """无需发出请求即可判定失败时返回对应的异常（域名无法解析或主机已熔断）"""
+        try:
+            parts = urlsplit(channel['url'])
+            error = self.dns.cached_error(parts.hostname)
+            if error is not None or self.health is None:
+                return error
+            key = host_key(parts, DEFAULT_PORTS)
+        except ValueError:
+            return None  # 地址格式错误，由检测判定为无效
+        if self.health.is_open(key):
+            return self.health.unreachable_error(key)
+        return None
+
+    async def _probe(self, url, timings):
+        """按检测方法发出请求，返回HTTP状态码，各阶段耗时写入timings
+
+        RTSP/RTMP/UDP/RTP地址不论检测方法都用对应协议的原生探测，RTSP返回RTSP状态码，其他成功时返回200。
+        """
+        scheme = url[:5].lower()
+        if scheme == 'rtsp:':
+            return await self._probe_rtsp(url, timings)
+        elif scheme == 'rtmp:':
+            return await self._probe_rtmp(url, timings)
+        elif scheme in ('udp:/', 'rtp:/'):
+            return await self._probe_datagram(url, timings)
+        elif self.method == "HEAD":
+            return await self._fetch_status('HEAD', url, self._timeout, timings=timings)
+        elif self.method == "GET":
+            # 只读取少量数据
+            return await self._fetch_status('GET', url, self._timeout, read_size=1024, timings=timings)
+        elif self.method == HLS_METHOD:
+            return await self._probe_hls(url, timings)
+        else:  # 混合方法
+            try:
+                return await self._fetch_status('HEAD', url, self._timeout // 2, timings=timings)
+            except Exception:
+                timings.clear()
+                return await self._fetch_status('GET', url, self._timeout, read_size=1024, timings=timings)
+
+    async def _probe_rtsp(self, url, timings):
+        """RTSP：发送DESCRIBE，要求返回的SDP描述中有媒体流
+
+        DESCRIBE需要认证或被拒绝（401/403/405，部分摄像头和服务器不带认证时如此）时改发OPTIONS，
+        服务器正常应答即认为可用（此时只确认了服务器在线，无法确认流本身）。
+        """
+        start = time.monotonic()
+        status_code, sdp = await native_request(url, self.pool, self._timeout, timings, rtsp_describe)
+        timings['ttfb'] = time.monotonic() - start - timings.get('host_wait', 0)
+        if status_code in RTSP_OPTIONS_FALLBACK_CODES:
+            if await native_request(url, self.pool, self._timeout, {}, rtsp_options) == 200:
+                return 200
+        if status_code == 200 and b'm=' not in sdp:
+            raise StreamValidationError('RTSP描述中没有媒体流')
+        return status_code
+
+    async def _probe_rtmp(self, url, timings):
+        """RTMP：完成握手即认为服务器可用（不发送connect/play命令）"""
+        start = time.monotonic()
+        await native_request(url, self.pool, self._timeout, timings, rtmp_handshake)
+        timings['ttfb'] = time.monotonic() - start - timings.get('host_wait', 0)
+        return 200
+
+    async def _probe_datagram(self, url, timings):
+        """UDP/RTP组播：限时等待第一个数据包，校验是MPEG-TS（可以带RTP头）"""
+        start = time.monotonic()
+        data = await receive_datagram(url, self._timeout)
+        timings['ttfb'] = time.monotonic() - start
+        payload = rtp_payload(data)
+        if url[:4].lower() == 'rtp:':
+            if payload is None:
+                raise StreamValidationError('收到的不是RTP数据包')
+        elif not sniff_media(data) and not (payload and sniff_media(payload)):
+            raise StreamValidationError('收到的数据不是MPEG-TS流')
+        return 200
+
+    async def _probe_hls(self, url, timings):
+        """HLS深度检测：主播放列表 -> 变体播放列表 -> 第一个媒体分片，并校验分片数据
+
+        不是m3u8的直链（如TS/FLV流）直接校验返回的数据。
+        """
+        start = time.monotonic()
+        response = await http_request('GET', url, self.pool, self._timeout, timings=timings)
+        timings['ttfb'] = time.monotonic() - start - timings.get('host_wait', 0)
+        try:
+            if response.status_code != 200:
+                return response.status_code
+            start = time.monotonic()
+            head = await asyncio.wait_for(response.read(HLS_SNIFF_SIZE), self._timeout)
+            if not head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U'):
+                self._validate_stream_bytes(head, response.headers.get('content-type', ''))
+                if self.sample_size:
+                    await self._read_sample(response, head, timings)
+                _add_timing(timings, 'body', start)
+                return response.status_code
+            rest = await asyncio.wait_for(response.read(HLS_PLAYLIST_LIMIT - len(head)), self._timeout)
+            _add_timing(timings, 'body', start)
+            playlist_url = response.url
+        finally:
+            response.close()
+
+        playlist = parse_hls_playlist((head + rest).decode('utf-8', 'replace'), playlist_url)
+        if playlist['variants']:
+            # 选择码率最低的变体，数据量最小
+            variant_url = min(playlist['variants'])[1]
+            error, throughput = await self._check_media_playlist_cached(variant_url)
+        else:
+            error, throughput = await self._check_media_playlist_cached(playlist_url, playlist)
+        if error:
+            raise StreamValidationError(error)
+        if throughput is not None:
+            timings['throughput'] = throughput
+        return 200
+
+    @staticmethod
+    def _validate_stream_bytes(data, content_type=''):
+        """校验直链返回的数据确实是媒体流"""
+        if not data:
+            raise StreamValidationError('返回的数据为空')
+        if sniff_media(data):
+            return
+        if 'html' in content_type.lower() or data.lstrip()[:1] == b'<':
+            raise StreamValidationError('返回的不是媒体流')
+
+    async def _check_media_playlist_cached(self, url, playlist=None):
+        """校验媒体播放列表（带缓存），返回 (错误信息, 分片下载速度)，成功时错误信息为None
+
+        同一变体播放列表的校验结果在HLS_CACHE_TTL秒内被所有频道共用，
+        并发检测同一路径时也只发出一次请求。
+        """
+        now = time.monotonic()
+        entry = self._hls_cache.get(url)
+        if entry is None or entry[0] <= now:
+            if len(self._hls_cache) >= 10000:
+                self._hls_cache = {k: v for k, v in self._hls_cache.items() if v[0] > now}
+            future = asyncio.ensure_future(self._check_media_playlist(url, playlist))
+            entry = self._hls_cache[url] = (now + HLS_CACHE_TTL, future)
+        return await asyncio.shield(entry[1])
+
+    async def _check_media_playlist(self, url, playlist=None, depth=0):
+        """取回媒体播放列表和第一个分片并校验，返回 (错误信息, 分片下载速度)"""
+        try:
+            if playlist is None:
+                status_code, data, url, _ = await self._fetch_nested(url, HLS_PLAYLIST_LIMIT)
+                if status_code != 200:
+                    return f"HLS播放列表 HTTP {status_code}", None
+                playlist = parse_hls_playlist(data.decode('utf-8', 'replace'), url)
+            if playlist['variants'] and depth == 0:
+                return await self._check_media_playlist(min(playlist['variants'])[1], depth=1)
+            if not playlist['segment']:
+                return 'HLS播放列表中没有分片', None
+
+            status_code, data, _, throughput = await self._fetch_nested(
+                playlist['segment'], HLS_SEGMENT_SAMPLE, sample=True)
+            if status_code not in (200, 206):
+                return f"HLS分片 HTTP {status_code}", None
+            if not data:
+                return 'HLS分片数据为空', None
+            # 加密分片无法识别格式，只要求能取到数据
+            if not playlist['encrypted'] and not sniff_media(data):
+                return 'HLS分片数据格式无法识别', None
+            return None, throughput
+        except asyncio.TimeoutError:
+            return HLS_TIMEOUT_ERROR, None
+        except Exception as e:
+            return str(e), None
+
+    async def _fetch_nested(self, url, limit, sample=False):
+        """HLS子请求（受hls_concurrency限制），返回 (状态码, 数据, 最终URL, 下载速度)"""
+        if self._hls_semaphore is None:
+            self._hls_semaphore = asyncio.Semaphore(self.hls_concurrency)
+        async with self._hls_semaphore:
+            response = await http_request('GET', url, self.pool, self._timeout)
+            try:
+                if response.status_code not in (200, 206):
+                    return response.status_code, b'', response.url, None
+                data = await asyncio.wait_for(response.read(limit), self._timeout)
+                timings = {}
+                if sample and self.sample_size and data:
+                    await self._read_sample(response, data, timings)
+                return response.status_code, data, response.url, timings.get('throughput')
+            finally:
+                response.close()
+
+    async def _fetch_status(self, method, url, timeout, read_size=0, timings=None):
+        """完成一次请求（含重定向），返回状态码；连接和每次读取都受timeout限制"""
+        start = time.monotonic()
+        waited = timings.get('host_wait', 0) if timings is not None else 0
+        response = await http_request(method, url, self.pool, timeout, timings=timings)
+        if timings is not None:
+            # 等待主机并发名额的时间不计入首字节
+            timings['ttfb'] = time.monotonic() - start - (timings.get('host_wait', 0) - waited)
+        try:
+            if read_size:
+                start = time.monotonic()
+                data = await asyncio.wait_for(response.read(read_size), timeout)
+                if self.sample_size and data:
+                    await self._read_sample(response, data, timings)
+                _add_timing(timings, 'body', start)
+            return response.status_code
+        finally:
+            response.close()
+
+    async def _read_sample(self, response, first_chunk, timings):
+        """测速：在已读到首块数据后继续读取，直到sample_size字节或sample_seconds秒，计算下载速度(字节/秒)"""
+        start = time.monotonic()
+        received = len(first_chunk)
+        deadline = start + self.sample_seconds
+        while received < self.sample_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(
+                    response.read(min(65536, self.sample_size - received)), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            received += len(chunk)
+        elapsed = time.monotonic() - start
+        # 首块数据的到达时间计入TTFB，这里只统计其后的数据
+        if timings is not None and received > len(first_chunk) and elapsed > 0:
+            timings['throughput'] = (received - len(first_chunk)) / elapsed
+
+    async def _measure_throughput(self, url, timings):
+        """HEAD检测成功后额外发一个GET请求测速，失败不影响检测结果"""
+        try:
+            response = await http_request('GET', url, self.pool, self._timeout)
+            try:
+                if response.status_code == 200:
+                    data = await asyncio.wait_for(response.read(1024), self._timeout)
+                    if data:
+                        await self._read_sample(response, data, timings)
+            finally:
+                response.close()
+        except Exception:
+            pass
+
+
+def shard_of(channel, shards):
+    """频道所属的分片编号：按主机名哈希（crc32，各进程一致），同一主机的频道总在同一个分片，
+    单主机并发、主机熔断和地址去重在分片内完成，与单进程检测的结果一致"""
+    try:
+        host = urlsplit(channel['url']).hostname or ''
+    except ValueError:
+        host = ''
+    return zlib.crc32(host.encode('utf-8', 'surrogatepass')) % shards
+
+
+_shard_queues = {}
+
+
+def _get_shard_queue(name):
+    """协调器进程中的任务队列('jobs')和结果队列('results')"""
+    if name not in _shard_queues:
+        _shard_queues[name] = queue.Queue()
+    return _shard_queues[name]
+
+
+class ShardManager(BaseManager):
+    """分片检测的协调器：在独立进程中提供任务队列和结果队列，本机和其他机器上的工作进程通过网络领取分片、回传结果"""
+
+
+ShardManager.register('get_queue', callable=_get_shard_queue)
+
+
+def parse_address(text):
+    """把 '主机:端口' 解析为 (主机, 端口)，主机为空时监听全部地址"""
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f'地址格式应为 主机:端口: {text}')
+    return host.strip('[]'), int(port)
+
+
+async def _check_shard(shard, channels, options, results):
+    """在工作进程中检测一个分片，结果去掉频道记录后以 (在分片中的序号, 结果) 分批放入结果队列"""
+    options = dict(options, metrics=Metrics() if options.get('metrics') else None)
+    engine = ProbeEngine(**options)
+    index = {id(channel): i for i, channel in enumerate(channels)}
+    batch = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal last_flush
+        last_flush = time.monotonic()
+        if batch:
+            results.put(('results', shard, batch[:]))
+            batch.clear()
+
+    def on_result(result):
+        batch.append((index[id(result.pop('channel'))], result))
+        if len(batch) >= SHARD_RESULT_BATCH:
+            flush()
+
+    def on_status(message):
+        results.put(('status', shard, message))
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(SHARD_FLUSH_INTERVAL)
+            if time.monotonic() - last_flush >= SHARD_FLUSH_INTERVAL:
+                flush()
+
+    flusher = asyncio.ensure_future(flush_periodically())
+    try:
+        await engine.run(channels, on_result, on_status)
+    finally:
+        flusher.cancel()
+    flush()
+    results.put(('done', shard, {'dedup_stats': engine.dedup_stats,
+                                 'tier_stats': engine.tier_stats,
+                                 'concurrency_stats': engine.concurrency_stats,
+                                 # 结果数由主进程统计
+                                 'metrics': engine.metrics.state(exclude=('results_total',))
+                                 if engine.metrics is not None else None}))
+
+
+def _shard_worker(jobs, results, ignore_interrupt=True):
+    """工作进程主循环：从任务队列领取分片检测，取到None或协调器关闭时退出"""
+    if ignore_interrupt:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C由主进程处理，主进程负责结束工作进程
+    while True:
+        try:
+            job = jobs.get(timeout=1)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            return  # 协调器已关闭
+        if job is None:
+            return
+        shard, channels, options = job
+        try:
+            asyncio.run(_check_shard(shard, channels, options, results))
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            results.put(('error', shard, str(e)))
+
+
+def run_shard_worker(address, authkey, ignore_interrupt=False):
+    """连接协调器并检测它分发的分片，直到协调器关闭（其他机器上用 --worker 主机:端口 启动）"""
+    manager = ShardManager(address=address, authkey=authkey)
+    manager.connect()
+    _shard_worker(manager.get_queue('jobs'), manager.get_queue('results'), ignore_interrupt)
+
+
+class ShardedProbeEngine:
+    """多进程分片检测：按主机把频道分成多个分片，由多个工作进程各自运行ProbeEngine检测，结果汇总到主进程
+
+    用法与ProbeEngine相同（run/stop、dedup_stats、tier_stats、concurrency_stats），参数也相同，另有：
+    workers为本机工作进程数；shards为分片数，默认等于工作进程数，有其他机器参与时可以更多，由空闲的进程领取。
+    concurrency为本机合计的并发上限，平均分给同时运行的分片（工作进程数与分片数中较小的一个，
+    只有其他机器的工作进程时按分片数）；per_host_limit不变（同一主机只在一个分片中）。
+    coordinator为 (主机, 端口) 时启动协调器，其他机器上用 --worker 连接的工作进程也会领取分片，需要authkey；
+    否则直接用本机的进程队列代替协调器。
+    结果库和进度日志只在主进程中读写，工作进程只负责检测。channels会先全部读入再分片。
+    设置了metrics时，各工作进程分别统计，每完成一个分片合并到metrics中。
+    """
+
+    def __init__(self, workers=2, shards=None, coordinator=None, authkey=None, store=None, journal=None,
+                 metrics=None, **options):
+        method = options.get('method', 'HEAD')
+        if method not in CHECK_METHODS:
+            raise ValueError(f'不支持的检测方法: {method}')
+        self.workers = max(0, int(workers))
+        self.shards = max(1, int(shards or self.workers or 1))
+        if coordinator is None and self.workers == 0:
+            raise ValueError('不启动协调器时至少需要一个本机工作进程')
+        if coordinator is not None and not authkey:
+            raise ValueError(f'启动协调器需要设置认证密钥（--authkey 或环境变量 {SHARD_AUTHKEY_ENV}）')
+        self.coordinator = coordinator
+        self.authkey = authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+        self.store = store
+        self.journal = journal
+        self.metrics = metrics
+        self.dedup = options.get('dedup', True)
+        self.options = dict(options, metrics=metrics is not None)
+        running = min(self.workers, self.shards) or self.shards
+        self.options['concurrency'] = max(1, -(-int(options.get('concurrency', 200)) // running))
+        self.dedup_stats = {'total': 0, 'unique': 0, 'duplicates': 0}
+        self.tier_stats = {'first_pass': 0, 'deferred': 0, 'second_pass': 0, 'recovered': 0}
+        self.concurrency_stats = None
+        self.cancelled = 0
+        self.stopped = False
+        self._loop = None
+        self._main_task = None
+
+    def stop(self):
+        """停止检测（可从其他线程调用）：结束全部本机工作进程，未完成的频道没有结果"""
+        self.stopped = True
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._cancel)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+
+    def _cancel(self):
+        if self._main_task is not None:
+            self._main_task.cancel()
+
+    async def run(self, channels, on_result, on_status=None):
+        """分片并发检测所有频道，每完成一个就调用一次on_result(result)，与ProbeEngine.run相同"""
+        store = self.store
+        journal = self.journal
+        metrics = self.metrics
+        report = on_result
+        channels = list(channels)
+        if metrics is not None:
+            counted = report
+
+            def report(result):
+                metrics.inc('results_total', result['status'])
+                counted(result)
+
+        if journal is not None:
+            channels = list(journal.pending(channels, report))
+            if on_status and journal.resumed:
+                on_status(f"断点续检: {journal.resumed} 个频道上次已完成，只检测剩余的 {len(channels)} 个")
+            output = report
+
+            def report(result):
+                journal.record(result)
+                output(result)
+
+        # 与单进程检测一致：去重后同一规范化地址的结果只写入结果库一次
+        recorded = set()
+
+        def deliver(result):
+            if store is not None:
+                try:
+                    key = normalize_url(result['url']) if self.dedup else None
+                except ValueError:
+                    key = None
+                if key is None or key not in recorded:
+                    if key is not None:
+                        recorded.add(key)
+                    store.record(result)
+            report(result)
+
+        if store is not None and store.max_age > 0:
+            channels = list(store.fresh_results(channels, report))
+            if metrics is not None:
+                metrics.inc('cached_total', amount=store.skipped)
+            if on_status:
+                on_status(f"增量检测: {store.skipped} 个频道近期状态稳定，沿用上次结果")
+
+        shards = [[] for _ in range(self.shards)]
+        for channel in channels:
+            shards[shard_of(channel, self.shards)].append(channel)
+        pending = {shard: shard_channels for shard, shard_channels in enumerate(shards) if shard_channels}
+
+        self.stopped = False
+        self.dedup_stats = {'total': 0, 'unique': 0, 'duplicates': 0}
+        self.tier_stats = {'first_pass': 0, 'deferred': 0, 'second_pass': 0, 'recovered': 0}
+        self.concurrency_stats = None
+        self.cancelled = 0
+        shard_concurrency = {}
+        loop = self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        context = multiprocessing.get_context('spawn')
+        manager = None
+        jobs = results = None
+        processes = []
+        try:
+            if self.coordinator is not None:
+                manager = ShardManager(address=self.coordinator, authkey=self.authkey, ctx=context)
+                await loop.run_in_executor(None, manager.start)
+                jobs, results = manager.get_queue('jobs'), manager.get_queue('results')
+                host, port = manager.address
+                if on_status:
+                    on_status(f"协调器已启动: {host}:{port}，其他机器可用 --worker 主机:{port} 加入")
+                local_host = '127.0.0.1' if host in ('', '0.0.0.0') else host
+                target, args = run_shard_worker, ((local_host, port), self.authkey, True)
+            else:
+                jobs, results = context.Queue(), context.Queue()
+                target, args = _shard_worker, (jobs, results)
+
+            for shard, shard_channels in pending.items():
+                options = self.options
+                if options.get('prefer_valid') and store is not None:
+                    # 工作进程不读结果库，上次的状态随分片一起发送
+                    options = dict(options, prior_status=self._prior_status(store, shard_channels))
+                jobs.put((shard, shard_channels, options))
+            processes = [context.Process(target=target, args=args, daemon=True)
+                         for _ in range(min(self.workers, len(pending)))]
+            if manager is None:
+                for _ in processes:
+                    jobs.put(None)
+            for process in processes:
+                process.start()
+            if on_status:
+                on_status(f"分片检测: {len(channels)} 个频道分为 {len(pending)} 个分片，本机 {len(processes)} 个工作进程")
+
+            while pending:
+                try:
+                    kind, shard, payload = await loop.run_in_executor(None, results.get, True, SHARD_FLUSH_INTERVAL)
+                except queue.Empty:
+                    if manager is None and not any(process.is_alive() for process in processes):
+                        raise RuntimeError(f'工作进程意外退出，{len(pending)} 个分片没有完成')
+                    continue
+                if kind == 'results':
+                    shard_channels = pending[shard]
+                    for index, result in payload:
+                        result['channel'] = shard_channels[index]
+                        deliver(result)
+                elif kind == 'status':
+                    if on_status:
+                        on_status(f"[分片{shard + 1}] {payload}")
+                elif kind == 'done':
+                    del pending[shard]
+                    for name, count in payload['dedup_stats'].items():
+                        self.dedup_stats[name] += count
+                    for name, count in payload['tier_stats'].items():
+                        self.tier_stats[name] += count
+                    if payload['concurrency_stats']:
+                        shard_concurrency[shard] = payload['concurrency_stats']
+                    if metrics is not None and payload['metrics']:
+                        metrics.merge(payload['metrics'])
+                else:
+                    del pending[shard]
+                    if on_status:
+                        on_status(f"[分片{shard + 1}] 检测出错: {payload}")
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+            self.cancelled = sum(len(shard_channels) for shard_channels in pending.values())
+            if on_status:
+                on_status(f"检测已停止，{len(pending)} 个分片没有完成")
+        finally:
+            self._loop = None
+            self._main_task = None
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join(1)
+            if manager is not None:
+                manager.shutdown()
+            elif jobs is not None:
+                for shard_queue in (jobs, results):
+                    shard_queue.cancel_join_thread()
+                    shard_queue.close()
+            if shard_concurrency:
+                self.concurrency_stats = self._merge_concurrency(shard_concurrency)
+            if store is not None:
+                store.flush()
+            if journal is not None:
+                journal.flush()
+
+    @staticmethod
+    def _prior_status(store, channels):
+        """分片中各频道在结果库中上次的状态 {规范化URL: 状态}"""
+        prior = {}
+        for channel in channels:
+            try:
+                key = normalize_url(channel['url'])
+            except ValueError:
+                continue
+            status = store.last_status(key)
+            if status is not None:
+                prior[key] = status
+        return prior
+
+    @staticmethod
+    def _merge_concurrency(shard_concurrency):
+        """合并各分片的自适应并发统计：shards为各分片自己的统计和调整轨迹，hosts合并
+
+        各分片的最低/最高上限出现在不同时刻，相加没有意义，global只给出各分片最终上限之和与降低次数之和。
+        """
+        shards = [dict(stats['global'], shard=shard + 1) for shard, stats in sorted(shard_concurrency.items())]
+        merged = {'final_limit_sum': sum(stats['limit'] for stats in shards),
+                  'decreases_sum': sum(stats['decreases'] for stats in shards)}
+        hosts = {}
+        for stats in shard_concurrency.values():
+            hosts.update(stats['hosts'])
+        return {'global': merged, 'shards': shards, 'hosts': hosts}
+
+
+class ResultStore:
+    """SQLite持久化的检测结果库，以规范化URL为键
+
+    results表保存每个URL最近一次的结果、检测时间和最近若干次的状态序列（用于判断是否稳定/反复），
+    history表保存每次检测的历史记录。max_age>0时开启增量检测：
+    在max_age秒内检测过、最近stable_runs次状态一致且没有反复变化的URL直接沿用上次结果。
+    sqlite3连接只能在创建它的线程中使用。
+    """
+
+    RECENT_LENGTH = 10
+
+    def __init__(self, path, max_age=0, stable_runs=3, history_limit=20, batch_size=500):
+        self.path = path
+        self.max_age = max_age
+        self.stable_runs = stable_runs
+        self.history_limit = history_limit
+        self.batch_size = batch_size
+        self.skipped = 0
+        self._pending = []
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS results (
+                url_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                recent TEXT NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS history (
+                url_key TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                response_time REAL
+            );
+            CREATE INDEX IF NOT EXISTS history_url_key ON history (url_key, checked_at);
+        ''')
+
+    def _is_stable(self, recent):
+        """最近stable_runs次状态一致，且最近的记录中状态变化不超过1次"""
+        if len(recent) < self.stable_runs or len(set(recent[-self.stable_runs:])) != 1:
+            return False
+        changes = sum(1 for a, b in zip(recent, recent[1:]) if a != b)
+        return changes <= 1
+
+    def fresh_results(self, channels, on_cached):
+        """逐个过滤频道：可沿用上次结果的频道通过on_cached(result)直接输出，其余的频道依次产出
+
+        地址无法规范化的频道不查结果库，照常产出（由检测判定为无效）。
+        """
+        self.skipped = 0
+        now = time.time()
+        for channel in channels:
+            try:
+                key = normalize_url(channel['url'])
+            except ValueError:
+                yield channel
+                continue
+            row = self.conn.execute(
+                'SELECT checked_at, recent, result FROM results WHERE url_key = ?', (key,)).fetchone()
+            if row is None or now - row[0] > self.max_age or not self._is_stable(row[1]):
+                yield channel
+                continue
+            stored = json.loads(row[2])
+            result = make_result(channel, stored.pop('status'), **stored)
+            result['cached'] = True
+            result['checked_at'] = datetime.fromtimestamp(row[0]).isoformat(timespec='seconds')
+            self.skipped += 1
+            on_cached(result)
+
+    def last_status(self, url_key):
+        """规范化URL最近一次检测的状态，没有记录时返回None"""
+        row = self.conn.execute('SELECT status FROM results WHERE url_key = ?', (url_key,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, result):
+        """记录一次检测结果（批量写入）"""
+        if result.get('cached'):
+            return
+        self._pending.append(result)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的结果写入数据库（地址无法规范化的结果没有键，不保存）"""
+        if not self._pending:
+            return
+        now = time.time()
+        rows = []
+        history = []
+        batch_recent = {}
+        with self.conn:
+            for result in self._pending:
+                try:
+                    key = normalize_url(result['url'])
+                except ValueError:
+                    continue
+                recent = batch_recent.get(key)
+                if recent is None:
+                    row = self.conn.execute('SELECT recent FROM results WHERE url_key = ?', (key,)).fetchone()
+                    recent = row[0] if row else ''
+                recent = batch_recent[key] = (recent + result['status'][0])[-self.RECENT_LENGTH:]
+                stored = {k: v for k, v in result.items() if k not in CHANNEL_FIELDS}
+                rows.append((key, result['url'], result['status'], now, recent,
+                             json.dumps(stored, ensure_ascii=False)))
+                history.append((key, now, result['status'], result.get('error'), result.get('response_time')))
+            self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.conn.executemany('INSERT INTO history VALUES (?, ?, ?, ?, ?)', history)
+        self._pending = []
+
+    def close(self):
+        """写入剩余结果、清理过多的历史记录并关闭数据库"""
+        self.flush()
+        with self.conn:
+            self.conn.execute('''
+                DELETE FROM history WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (PARTITION BY url_key ORDER BY checked_at DESC) AS n
+                        FROM history)
+                    WHERE n > ?)
+            ''', (self.history_limit,))
+        self.conn.close()
+
+
+class ResultJournal:
+    """断点续检的进度日志：已完成的检测结果逐行追加写入（NDJSON，与命令行输出格式相同）
+
+    每batch_size个结果或每interval秒写入并同步到磁盘一次，程序被关闭或机器重启时最多丢失最后一批。
+    续检时load()读回已完成的结果，pending()只产出还没有结果的频道。
+    频道以 (URL, 名称) 识别，同名同地址的重复条目各自对应一条记录。
+    """
+
+    def __init__(self, path, batch_size=200, interval=5):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.resumed = 0
+        self._completed = {}
+        self._pending = []
+        self._file = None
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _key(item):
+        return f"{item['url']}\n{item['name']}"
+
+    def load(self):
+        """读取日志中已完成的结果，返回条数；末尾写了一半的行被截掉"""
+        self._completed = {}
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, 'rb+') as f:
+            valid_end = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._completed.setdefault(self._key(record), []).append(record)
+                count += 1
+                valid_end += len(line)
+            f.truncate(valid_end)
+        return count
+
+    def matching(self, channels):
+        """channels中已有结果的频道数"""
+        return sum(1 for channel in channels if self._key(channel) in self._completed)
+
+    def reset(self):
+        """清空日志，重新开始"""
+        self.close()
+        self._completed = {}
+        open(self.path, 'w').close()
+
+    def pending(self, channels, on_done):
+        """逐个过滤频道：已有结果的通过on_done(result)直接输出，其余的频道依次产出"""
+        self.resumed = 0
+        for channel in channels:
+            records = self._completed.get(self._key(channel))
+            if not records:
+                yield channel
+                continue
+            record = records.pop()
+            fields = {k: v for k, v in record.items() if k != 'status' and k not in CHANNEL_FIELDS}
+            self.resumed += 1
+            on_done(make_result(channel, record['status'], **fields))
+
+    def record(self, result):
+        """追加一个检测结果（批量写入）"""
+        self._pending.append(json.dumps(result_record(result), ensure_ascii=False) + '\n')
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的结果写入文件并同步到磁盘"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(''.join(self._pending))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = []
+
+    def close(self):
+        """写入剩余结果并关闭文件（保留日志，用于下次续检）"""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """检测全部完成后删除日志"""
+        self._pending = []
+        self.close()
+        self._completed = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+TIMING_FIELDS = ('response_time', 'dns_time', 'connect_time', 'ttfb', 'throughput')
+# 检测结果中来自频道记录（而不是检测本身）的字段
+CHANNEL_FIELDS = ('name', 'url', 'group', 'sources', 'channel')
+
+
+def result_host(result):
+    """检测结果所属的主机（含端口）"""
+    channel = result.get('channel')
+    if isinstance(channel, Channel):
+        return channel.host
+    return url_host(result['url'])
+
+
+def result_group(result):
+    """检测结果所属的分组"""
+    return result.get('group', DEFAULT_GROUP)
+
+
+class ResultStats:
+    """按主机或分组累计检测结果：数量、成功率以及各项耗时和下载速度的平均值
+
+    边检测边累计，不保留结果本身。
+    """
+
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self._stats = {}
+        self._sums = {}
+
+    def add(self, result):
+        key = self.key_func(result)
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = {'total': 0, 'valid': 0, 'invalid': 0}
+            self._sums[key] = {field: [0, 0] for field in TIMING_FIELDS}
+        entry['total'] += 1
+        entry[result['status']] += 1
+        for field in TIMING_FIELDS:
+            value = result.get(field)
+            if value is not None:
+                acc = self._sums[key][field]
+                acc[0] += value
+                acc[1] += 1
+
+    def summary(self):
+        stats = {}
+        for key, counts in self._stats.items():
+            entry = stats[key] = dict(counts)
+            entry['success_rate'] = round(entry['valid'] / entry['total'] * 100, 1)
+            for field, (total, count) in self._sums[key].items():
+                entry[f'avg_{field}'] = round(total / count, 1) if count else None
+        return stats
+
+
+def aggregate_results(results, key_func):
+    """按主机或分组汇总检测结果"""
+    stats = ResultStats(key_func)
+    for result in results:
+        stats.add(result)
+    return stats.summary()
+
+
+VALID_CSV_HEADER = ['频道名称', 'URL', '分组', '响应时间(ms)', '首字节(ms)', '下载速度(KB/s)']
+INVALID_CSV_HEADER = ['频道名称', 'URL', '分组', '错误信息']
+
+
+def valid_csv_row(result):
+    """有效频道CSV中的一行"""
+    throughput = result.get('throughput')
+    return [result['name'], result['url'], result.get('group', DEFAULT_GROUP),
+            result.get('response_time', ''), result.get('ttfb', ''),
+            round(throughput / 1024, 1) if throughput is not None else '']
+
+
+def invalid_csv_row(result):
+    """无效频道CSV中的一行"""
+    return [result['name'], result['url'], result.get('group', DEFAULT_GROUP), result.get('error', '未知错误')]
+
+
+def timing_attrs(result):
+    """导出M3U时追加到#EXTINF的响应时间和下载速度属性"""
+    extra = {}
+    if result.get('response_time') is not None:
+        extra['response-time'] = result['response_time']
+    if result.get('throughput') is not None:
+        extra['throughput'] = result['throughput']
+    return extra
+
+
+class ResultExporter:
+    """边检测边导出结果：有效频道CSV/M3U、无效频道CSV和全部结果NDJSON
+
+    结果到达时逐条写入临时文件（.part，定期刷新到磁盘），检测中断时已写入的结果仍在临时文件中；
+    finalize()时把临时文件原子替换为正式文件，并生成检测报告（JSON，compress为True时gzip压缩）。
+    报告中的有效/无效频道列表从NDJSON文件逐条读出写入，不需要把全部结果留在内存中。
+    """
+
+    def __init__(self, directory, timestamp=None, header=None, compress=False, flush_interval=5):
+        self.directory = directory
+        self.timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.header = header
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.counts = {'valid': 0, 'invalid': 0}
+        self.host_stats = ResultStats(result_host)
+        self.group_stats = ResultStats(result_group)
+        self.paths = []
+        self._files = {}
+        self._last_flush = time.monotonic()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}_{self.timestamp}")
+
+    def _open(self, kind):
+        """按需创建临时文件，返回 (文件, csv.writer或None)"""
+        opened = self._files.get(kind)
+        if opened is not None:
+            return opened
+        path = {'valid_csv': self._path('有效频道') + '.csv',
+                'valid_m3u': self._path('有效频道') + '.m3u',
+                'invalid_csv': self._path('无效频道') + '.csv',
+                'ndjson': self._path('检测结果') + '.ndjson'}[kind]
+        if kind.endswith('csv'):
+            f = open(path + '.part', 'w', newline='', encoding='utf-8-sig')
+            writer = csv.writer(f)
+            writer.writerow(VALID_CSV_HEADER if kind == 'valid_csv' else INVALID_CSV_HEADER)
+        else:
+            f = open(path + '.part', 'w', encoding='utf-8')
+            writer = None
+            if kind == 'valid_m3u':
+                f.write(f"{self.header or '#EXTM3U'}\n")
+        opened = self._files[kind] = (path, f, writer)
+        return opened
+
+    def add(self, result):
+        """写入一个检测结果"""
+        status = result['status']
+        self.counts[status] += 1
+        self.host_stats.add(result)
+        self.group_stats.add(result)
+        if status == 'valid':
+            self._open('valid_csv')[2].writerow(valid_csv_row(result))
+            self._open('valid_m3u')[1].write(m3u_entry(result, timing_attrs(result)))
+        else:
+            self._open('invalid_csv')[2].writerow(invalid_csv_row(result))
+        self._open('ndjson')[1].write(json.dumps(result_record(result), ensure_ascii=False) + '\n')
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把已写入的结果刷新到磁盘"""
+        self._last_flush = time.monotonic()
+        for path, f, writer in self._files.values():
+            f.flush()
+
+    def finalize(self, summary=None):
+        """关闭临时文件并原子替换为正式文件，再生成检测报告；返回生成的文件路径列表
+
+        summary为报告开头的字段（总数、成功率等），之后依次是按主机、按分组的统计和有效/无效频道列表。
+        """
+        for path, f, writer in self._files.values():
+            f.close()
+            os.replace(path + '.part', path)
+            self.paths.append(path)
+        ndjson = self._files.get('ndjson')
+        self._files = {}
+
+        report = dict(summary or {})
+        report['host_stats'] = self.host_stats.summary()
+        report['group_stats'] = self.group_stats.summary()
+        report_path = self._path('检测报告') + ('.json.gz' if self.compress else '.json')
+        opener = gzip.open if self.compress else open
+        with opener(report_path + '.part', 'wt', encoding='utf-8') as f:
+            # 与json.dump(report, indent=2)的格式相同，列表逐条写出
+            f.write(json.dumps(report, ensure_ascii=False, indent=2)[:-2])
+            for key, status in (('valid_list', 'valid'), ('invalid_list', 'invalid')):
+                f.write(f',\n  "{key}": [')
+                written = 0
+                if ndjson is not None:
+                    with open(ndjson[0], encoding='utf-8') as records:
+                        for line in records:
+                            record = json.loads(line)
+                            if record['status'] != status:
+                                continue
+                            item = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+                            f.write(f'{"," if written else ""}\n    {item}')
+                            written += 1
+                f.write('\n  ]' if written else ']')
+            f.write('\n}')
+        os.replace(report_path + '.part', report_path)
+        self.paths.append(report_path)
+        return self.paths
+
+    def abort(self):
+        """放弃导出：关闭并保留临时文件"""
+        for path, f, writer in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class ChannelMonitor:
+    """常驻监控：频道列表常驻内存，按interval秒一个周期持续重新检测，并通过本地HTTP接口提供当前结果
+
+    启动时先完整检测一轮，之后把频道按顺序轮流分成若干批（每批间隔约MONITOR_SLICE_SECONDS秒），
+    在整个周期内错开检测，检测负载和对各主机的请求均匀分布，每个频道每个周期检测一次。
+    每个频道的M3U条目、CSV行和JSON记录只在它的结果变化时重新生成，播放列表等在有变化后被请求时才重新拼接。
+    设置了export_dir时每批检测后把有变化的有效频道M3U/CSV原子替换写入该目录。
+    options为ProbeEngine的参数（不使用进度日志和增量检测），各批共用同一个检测引擎，DNS缓存和主机熔断状态跨批保留。
+    """
+
+    PATHS = {'/': 'm3u', '/playlist.m3u': 'm3u', '/valid.csv': 'csv', '/valid.json': 'json',
+             '/status.json': 'status'}
+    CONTENT_TYPES = {'m3u': 'audio/x-mpegurl; charset=utf-8', 'csv': 'text/csv; charset=utf-8',
+                     'json': 'application/json; charset=utf-8', 'status': 'application/json; charset=utf-8'}
+    EXPORT_NAMES = {'m3u': '有效频道.m3u', 'csv': '有效频道.csv'}
+
+    def __init__(self, channels, interval=MONITOR_INTERVAL, header=None, export_dir=None, **options):
+        self.channels = list(channels)
+        self.interval = interval
+        self.header = header or '#EXTM3U'
+        self.export_dir = export_dir
+        self.metrics = options.get('metrics')
+        self.round = 0
+        self.counts = {'valid': 0, 'invalid': 0}
+        self.changes = 0
+        self.started_at = None
+        self.engine = ProbeEngine(**options)
+        self.stopped = False
+        self._index = {id(channel): i for i, channel in enumerate(self.channels)}
+        self._status = [None] * len(self.channels)
+        # 每个频道的 {'m3u': M3U条目, 'csv': CSV行, 'json': JSON记录}，无效频道只有JSON记录
+        self._fragments = [None] * len(self.channels)
+        self._rendered = {}  # 接口 -> (版本号, 内容)，频道结果变化后删除对应接口
+        self._versions = dict.fromkeys(self.CONTENT_TYPES, 0)
+        self._exported = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._loop = None
+        self._main_task = None
+
+    def stop(self):
+        """停止监控（可从其他线程调用）"""
+        self.stopped = True
+        self.engine.stop()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._cancel)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+
+    def _cancel(self):
+        if self._main_task is not None:
+            self._main_task.cancel()
+
+    async def run(self, on_status=None):
+        """持续检测直到stop()，on_status(message)报告每一轮的结果"""
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        count = len(self.channels)
+        try:
+            await self._check(range(count), on_status)
+            self._report_round(on_status)
+            slices = max(1, min(count, int(self.interval // MONITOR_SLICE_SECONDS)))
+            step = self.interval / slices
+            due = time.monotonic()
+            while not self.stopped:
+                for start in range(slices):
+                    # 检测跟不上时不补偿（不会集中补检），从当前时间继续错开
+                    due = max(due + step, time.monotonic())
+                    await asyncio.sleep(due - time.monotonic())
+                    await self._check(range(start, count, slices))
+                self._report_round(on_status)
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+        finally:
+            self._loop = None
+            self._main_task = None
+
+    async def _check(self, indexes, on_status=None):
+        await self.engine.run([self.channels[i] for i in indexes], self.update, on_status)
+        if self.export_dir is not None:
+            try:
+                self.write_exports()
+            except OSError as e:
+                if on_status:
+                    on_status(f"写入导出文件失败: {str(e)}")
+
+    def _report_round(self, on_status):
+        self.round += 1
+        if on_status:
+            on_status(f"第 {self.round} 轮检测完成: 有效 {self.counts['valid']} | 无效 {self.counts['invalid']} | "
+                      f"状态变化 {self.changes} 个")
+        self.changes = 0
+
+    def update(self, result):
+        """记录一个频道的最新结果，只重新生成这个频道的条目"""
+        i = self._index[id(result['channel'])]
+        status = result['status']
+        record = result_record(result)
+        record['checked_at'] = datetime.now().isoformat(timespec='seconds')
+        fragments = {'json': json.dumps(record, ensure_ascii=False)}
+        if status == 'valid':
+            # 播放列表只在频道变为有效或无效时变化，不带每次都不同的响应时间
+            fragments['m3u'] = m3u_entry(result)
+            row = io.StringIO()
+            csv.writer(row).writerow(valid_csv_row(result))
+            fragments['csv'] = row.getvalue()
+        previous = self._status[i]
+        with self._lock:
+            if previous != status:
+                if previous is not None:
+                    self.counts[previous] -= 1
+                    self.changes += 1
+                self.counts[status] += 1
+                self._status[i] = status
+            old = self._fragments[i] or {}
+            self._fragments[i] = fragments
+            changed = {kind for kind in ('m3u', 'csv') if fragments.get(kind) != old.get(kind)}
+            if status == 'valid' or previous == 'valid':
+                changed.add('json')
+            changed.add('status')
+            for kind in changed:
+                self._versions[kind] += 1
+                self._rendered.pop(kind, None)
+
+    def render(self, kind):
+        """接口内容 (版本号, bytes)，有变化后第一次请求时重新拼接"""
+        with self._lock:
+            rendered = self._rendered.get(kind)
+            if rendered is None:
+                rendered = self._rendered[kind] = (self._versions[kind], self._build(kind).encode('utf-8'))
+            return rendered
+
+    def _build(self, kind):
+        fragments = self._fragments
+        if kind == 'm3u':
+            return f"{self.header}\n" + ''.join(f['m3u'] for f in fragments if f and 'm3u' in f)
+        if kind == 'csv':
+            header = io.StringIO()
+            csv.writer(header).writerow(VALID_CSV_HEADER)
+            return '\ufeff' + header.getvalue() + ''.join(f['csv'] for f in fragments if f and 'csv' in f)
+        if kind == 'json':
+            return '[' + ',\n'.join(f['json'] for f in fragments if f and 'm3u' in f) + ']'
+        summary = json.dumps({
+            'started_at': self.started_at,
+            'round': self.round,
+            'interval': self.interval,
+            'total_channels': len(self.channels),
+            'valid_channels': self.counts['valid'],
+            'invalid_channels': self.counts['invalid'],
+            'pending_channels': len(self.channels) - self.counts['valid'] - self.counts['invalid'],
+        }, ensure_ascii=False)
+        return summary[:-1] + ', "channels": [' + ',\n'.join(f['json'] for f in fragments if f) + ']}'
+
+    def write_exports(self):
+        """把有变化的有效频道M3U/CSV原子替换写入export_dir"""
+        for kind, name in self.EXPORT_NAMES.items():
+            version, body = self.render(kind)
+            if self._exported.get(kind) == version:
+                continue
+            path = os.path.join(self.export_dir, name)
+            with open(path + '.part', 'wb') as f:
+                f.write(body)
+            os.replace(path + '.part', path)
+            self._exported[kind] = version
+
+    def serve(self, host='127.0.0.1', port=0):
+        """在后台线程中启动HTTP接口，返回实际监听的端口"""
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics' and monitor.metrics is not None:
+                    body = monitor.metrics.render().encode('utf-8')
+                    content_type, etag = 'text/plain; version=0.0.4; charset=utf-8', None
+                elif path in monitor.PATHS:
+                    kind = monitor.PATHS[path]
+                    version, body = monitor.render(kind)
+                    content_type, etag = monitor.CONTENT_TYPES[kind], f'"{kind}-{version}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # 不在标准错误中输出访问日志
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self._server.server_address[1]
+
+    def close(self):
+        """关闭HTTP接口"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join(1)
+            self._server = None
+
+
+def url_host(url):
+    """快速取出URL中的主机（含端口，小写），不做完整的URL解析"""
+    netloc = url.partition('://')[2].split('/', 1)[0].split('?', 1)[0]
+    return netloc.rsplit('@', 1)[-1].lower()
+
+
+# #EXTINF属性：名="值" 或 名=值（值不含空白）
+_EXTINF_ATTR_PATTERN = re.compile(r'([\w-]+)=(?:"([^"]*)"|([^\s"]*))')
+# 同上，连同前面的空白一起匹配，用于删除属性
+_EXTINF_ATTR_SPAN = re.compile(r'\s*' + _EXTINF_ATTR_PATTERN.pattern)
+
+
+class Channel:
+    """频道记录
+
+    使用__slots__且分组和主机名字符串驻留共享，大列表下内存占用远小于dict。
+    保留#EXTINF的时长和全部属性（tvg-id、tvg-logo、catchup等）以及URL前的指令行
+    （#EXTVLCOPT、#KODIPROP、#EXTGRP等），导出M3U时原样写回。
+    属性保存为#EXTINF行中时长之后的原文（一个字符串，比逐个保存省内存），
+    引号和值都按读入时的样子写回，需要时再由attributes解析。
+    支持 channel['name'] / channel.get('group') 形式的访问，与原来的dict用法兼容。
+    sources为合并多个直播源时该频道所在的来源（文件路径或URL）。
+    """
+
+    __slots__ = ('name', 'url', 'group', 'host', 'duration', 'attrs', 'directives', 'sources')
+
+    def __init__(self, name, url, group=DEFAULT_GROUP, duration='-1', attrs='', directives=(), sources=()):
+        self.name = name
+        self.url = url
+        self.group = sys.intern(group)
+        self.host = sys.intern(url_host(url))
+        self.duration = duration
+        self.attrs = attrs
+        self.directives = directives
+        self.sources = sources
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return f'Channel({self.name!r}, {self.url!r}, group={self.group!r})'
+
+    @property
+    def attributes(self):
+        """#EXTINF属性列表 [(名, 值), ...]（值已去掉引号）"""
+        return parse_extinf_attrs(self.attrs)
+
+    def extinf(self, extra_attrs=None):
+        """生成#EXTINF行，extra_attrs中的属性覆盖或追加到原有属性之后"""
+        attrs = self.attrs
+        if extra_attrs:
+            attrs = _EXTINF_ATTR_SPAN.sub(
+                lambda m: '' if m.group(1) in extra_attrs else m.group(0), attrs).strip()
+            attrs = ' '.join(filter(None, [attrs] + [f'{k}="{v}"' for k, v in extra_attrs.items()]))
+        if self.group != DEFAULT_GROUP and not any(d.startswith('#EXTGRP:') for d in self.directives) and \
+                ('group-title=' not in attrs or all(k != 'group-title' for k, v in parse_extinf_attrs(attrs))):
+            attrs = f'group-title="{self.group}" {attrs}'.rstrip()
+        return f'#EXTINF:{self.duration} {attrs},{self.name}' if attrs else f'#EXTINF:{self.duration},{self.name}'
+
+    def to_m3u(self, extra_attrs=None):
+        """生成该频道在M3U文件中的全部行（#EXTINF、指令行、URL）"""
+        return '\n'.join((self.extinf(extra_attrs),) + self.directives + (self.url,)) + '\n'
+
+
+def parse_extinf_attrs(text):
+    """解析#EXTINF的属性文本，返回 [(名, 值), ...]"""
+    return [(m.group(1), m.group(2) if m.group(2) is not None else m.group(3))
+            for m in _EXTINF_ATTR_PATTERN.finditer(text)]
+
+
+def make_result(channel, status, **fields):
+    """构造检测结果：频道名称、URL、分组（合并多个来源时还有来源列表）加上检测字段，
+    'channel'引用原始频道记录（不复制属性）"""
+    result = {
+        'name': channel['name'],
+        'url': channel['url'],
+        'group': channel.get('group', DEFAULT_GROUP),
+    }
+    sources = channel.get('sources')
+    if sources:
+        result['sources'] = list(sources)
+    result['status'] = status
+    result.update(fields)
+    result['channel'] = channel
+    return result
+
+
+def result_record(result):
+    """去掉结果中的频道记录引用，得到可直接序列化为JSON的dict"""
+    return {k: v for k, v in result.items() if k != 'channel'}
+
+
+def m3u_entry(result, extra_attrs=None):
+    """生成检测结果对应的M3U条目，尽量保留原始的#EXTINF属性和指令行"""
+    channel = result.get('channel')
+    if isinstance(channel, Channel):
+        return channel.to_m3u(extra_attrs)
+    rendered = ''.join(f' {k}="{v}"' for k, v in (extra_attrs or {}).items())
+    group = result.get('group', DEFAULT_GROUP)
+    return f'#EXTINF:-1 group-title="{group}"{rendered},{result["name"]}\n{result["url"]}\n'
+
+
+FORMAT_NAMES = {'m3u': 'M3U', 'csv': 'CSV', 'urls': 'URL列表'}
+SOURCE_STATUS_NAMES = {'local': '本地文件', 'downloaded': '已下载', 'not-modified': '未更新，使用缓存'}
+
+
+class PlaylistParser:
+    """流式直播源解析器
+
+    逐行读取（文件对象或任意行迭代器），根据开头几行判断格式，边读边产出频道，
+    不需要把整个文件读入内存；解析出的频道数记录在count中。
+    format为 'm3u'/'csv'/'urls'。
+    """
+
+    HEAD_LINES = 10
+    # 标题前的第一个逗号不能在引号内（属性值里可能有逗号）
+    EXTINF_PATTERN = re.compile(r'#EXTINF:([^,"]*(?:"[^"]*"[^,"]*)*),(.*)$')
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        # 跳过开头的空行，读取前几行判断格式
+        self._head = []
+        for line in self._lines:
+            if self._head or line.strip():
+                self._head.append(line.rstrip('\r\n'))
+                if len(self._head) >= self.HEAD_LINES:
+                    break
+        self.count = 0
+        # M3U文件头（#EXTM3U行，含x-tvg-url等属性）一般在第一行，创建解析器后即可取得，
+        # 不在第一行时解析到它时才记录
+        self.header = self._head[0].strip() if self._head and self._head[0].startswith('#EXTM3U') else None
+
+        if (self._head and self._head[0].startswith('#EXTM3U')) or \
+                any(line.startswith('#EXTINF:') for line in self._head):
+            self.format = 'm3u'
+        elif any(',' in line for line in self._head):
+            self.format = 'csv'
+        else:
+            self.format = 'urls'
+
+    def __iter__(self):
+        lines = itertools.chain(self._head, self._lines)
+        if self.format == 'm3u':
+            return self._parse_m3u(lines)
+        elif self.format == 'csv':
+            return self._parse_csv(lines)
+        return self._parse_urls(lines)
+
+    def _channel(self, name, url, group=DEFAULT_GROUP, duration='-1', attrs='', directives=()):
+        self.count += 1
+        return Channel(name, url, group, duration, attrs, directives)
+
+    def _parse_extinf(self, line):
+        """解析#EXTINF行，返回 (名称, 时长, 属性原文, 分组)，无法解析时返回None
+
+        格式1: #EXTINF:-1 tvg-name="..." group-title="...",频道名称
+        格式2: #EXTINF:-1,频道名称
+        时长为第一个属性之前的文本（不是数字时也保留原文，保证导出时不丢信息），没有时为'-1'。
+        """
+        match = self.EXTINF_PATTERN.match(line)
+        if not match:
+            return None
+        params = match.group(1)
+        group = None
+        first = None
+        for m in _EXTINF_ATTR_PATTERN.finditer(params):
+            if first is None:
+                first = m.start()
+            if m.group(1) == 'group-title':
+                group = m.group(2) if m.group(2) is not None else m.group(3)
+                break
+        if first is None:
+            first = len(params)
+        duration = params[:first].strip() or '-1'
+        return match.group(2).strip(), sys.intern(duration), params[first:].strip(), group
+
+    def _parse_m3u(self, lines):
+        current_channel = None
+        directives = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#EXTM3U'):
+                if self.header is None:
+                    self.header = line
+                continue
+                
+            if line.startswith('#EXTINF:'):
+                # 解析频道信息
+                parsed = self._parse_extinf(line)
+                if parsed and parsed[0]:
+                    current_channel = parsed
+            elif line.startswith('#'):
+                # #EXTVLCOPT、#KODIPROP、#EXTGRP等指令行，跟随下一个频道
+                directives.append(line)
+            elif is_stream_url(line):
+                group = None
+                if current_channel:
+                    name, duration, attrs, group = current_channel
+                else:
+                    # 没有EXTINF的URL
+                    name, duration, attrs = f'频道_{self.count+1}', '-1', ''
+                if group is None:
+                    group = next((d[8:].strip() for d in directives if d.startswith('#EXTGRP:')), DEFAULT_GROUP)
+                yield self._channel(name, line, group or DEFAULT_GROUP, duration, attrs, tuple(directives))
+                current_channel = None
+                directives = []
+
+    def _parse_csv(self, lines):
+        # 解析CSV格式：频道名,URL
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+                
+            # 处理逗号分隔的格式
+            parts = line.split(',', 1)  # 只分割第一个逗号
+            if len(parts) >= 2:
+                name = parts[0].strip()
+                url = parts[1].strip()
+                
+                if is_stream_url(url):
+                    yield self._channel(name if name else f'频道_{line_num}', url)
+            elif is_stream_url(line):
+                # 只有URL的行
+                yield self._channel(f'频道_{line_num}', line)
+
+    def _parse_urls(self, lines):
+        # 解析纯URL列表
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if is_stream_url(line):
+                yield self._channel(f'频道_{line_num}', line)
+
+
+def open_playlist(path):
+    """以文本方式打开直播源文件，path为 '-' 时读取标准输入"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+    return open(path, 'r', encoding='utf-8-sig')
+
+
+def is_remote_source(source):
+    """直播源是否为http(s)地址（否则为本地文件）"""
+    return source.lower().startswith(('http://', 'https://'))
+
+
+class SourceCache:
+    """SQLite保存的远程直播源缓存：记录每个地址的ETag、Last-Modified和内容，
+    再次下载时发送条件请求，上游未更新(304)时直接使用缓存的内容。
+    sqlite3连接只能在创建它的线程中使用。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS sources (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                body BLOB NOT NULL
+            )
+        ''')
+
+    def get(self, url):
+        """返回 (etag, last_modified, body)，没有缓存时返回None"""
+        return self.conn.execute(
+            'SELECT etag, last_modified, body FROM sources WHERE url = ?', (url,)).fetchone()
+
+    def put(self, url, etag, last_modified, body):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)',
+                              (url, etag, last_modified, time.time(), body))
+
+    def close(self):
+        self.conn.close()
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def fetch_source(source, cache=None, timeout=SOURCE_TIMEOUT):
+    """读取一个直播源的原始内容，返回 (bytes, 状态)
+
+    状态为 'local'（本地文件）、'downloaded'（重新下载）或 'not-modified'（上游未更新，使用缓存）。
+    """
+    if not is_remote_source(source):
+        return await asyncio.get_running_loop().run_in_executor(None, _read_file, source), 'local'
+
+    cached = cache.get(source) if cache is not None else None
+    headers = {}
+    if cached is not None:
+        etag, last_modified, body = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    response = await http_request('GET', source, timeout=timeout, headers=headers)
+    try:
+        if response.status_code == 304 and cached is not None:
+            return cached[2], 'not-modified'
+        if response.status_code != 200:
+            raise ConnectionError(f"HTTP {response.status_code}")
+        body = await asyncio.wait_for(response.read(SOURCE_SIZE_LIMIT + 1), timeout)
+        if len(body) > SOURCE_SIZE_LIMIT:
+            raise ValueError(f"直播源超过 {SOURCE_SIZE_LIMIT // (1024 * 1024)}MB")
+    finally:
+        response.close()
+    if cache is not None:
+        cache.put(source, response.headers.get('etag'), response.headers.get('last-modified'), body)
+    return body, 'downloaded'
+
+
+async def load_sources(sources, cache=None, concurrency=8, timeout=SOURCE_TIMEOUT, strip_params=()):
+    """并发读取多个本地文件/远程地址的直播源，用与单个文件相同的解析器解析后按来源顺序合并
+
+    保留全部频道（包括地址相同的），每个频道的sources为它所在的来源；相同地址的去重和结果分发由检测引擎完成
+    （关闭去重时逐个检测）。返回 (频道列表, M3U文件头, 各来源的统计)，
+    统计为 {'source', 'status', 'format', 'count', 'added'}（added为规范化后在之前的来源中没有出现过的地址数），
+    读取失败时为 {'source', 'status': 'failed', 'error'}。
+    """
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+    strip_params = frozenset(name.lower() for name in strip_params)
+
+    async def load(source):
+        async with semaphore:
+            try:
+                data, status = await fetch_source(source, cache, timeout)
+            except asyncio.TimeoutError:
+                return {'source': source, 'status': 'failed', 'error': '连接超时'}, None
+            except Exception as e:
+                return {'source': source, 'status': 'failed', 'error': str(e)}, None
+        parser = PlaylistParser(data.decode('utf-8-sig', errors='replace').splitlines())
+        return {'source': source, 'status': status, 'format': parser.format}, parser
+
+    loaded = await asyncio.gather(*(load(source) for source in sources))
+
+    channels = []
+    seen = set()
+    header = None
+    for report, parser in loaded:
+        if parser is None:
+            continue
+        sources = (sys.intern(report['source']),)
+        added = 0
+        for channel in parser:
+            try:
+                key = normalize_url(channel.url, strip_params)
+            except ValueError:
+                key = channel.url
+            if key not in seen:
+                seen.add(key)
+                added += 1
+            channel.sources = sources
+            channels.append(channel)
+        report['count'] = parser.count
+        report['added'] = added
+        if header is None:
+            header = parser.header
+    return channels, header, [report for report, parser in loaded]
+
+
+class StreamChecker:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("直播源检测工具 v2.0")
+        self.root.geometry("900x700")
+        self.root.minsize(800, 600)
+        
+        # 设置窗口图标和编码
+        try:
+            self.root.tk.call('encoding', 'system', 'utf-8')
+        except:
+            pass
+            
+        # 变量初始化
+        self.channels = []
+        self.sources = []
+        self.playlist_header = None
+        self.valid_channels = []
+        self.invalid_channels = []
+        self.is_checking = False
+        self.check_thread = None
+        self.engine = None
+        self.journal = None
+        self.exporter = None
+        self.metrics = None
+        # 检测进行中时为发送进度快照的函数，界面定时器也调用它，结果稀疏时进度和日志不会停住
+        self.flush_progress = None
+        self.dedup_stats = None
+        self.tier_stats = None
+        self.concurrency_stats = None
+        self.interrupted = False
+        self.progress_queue = queue.Queue()
+        
+        # 设置样式
+        self.setup_styles()
+        
+        # 创建界面
+        self.create_widgets()
+        
+        # 启动进度更新
+        self.update_progress()
+        
+    def setup_styles(self):
+        """设置界面样式"""
+        style = ttk.Style()
+        style.theme_use('clam')
+        
+        # 配置样式
+        style.configure('Title.TLabel', font=('微软雅黑', 12, 'bold'))
+        style.configure('Header.TLabel', font=('微软雅黑', 10, 'bold'))
+        style.configure('Custom.TButton', font=('微软雅黑', 9))
+        
+    def create_widgets(self):
+        """创建界面组件"""
+        # 主标题
+        title_frame = ttk.Frame(self.root)
+        title_frame.pack(fill='x', padx=10, pady=5)
+        
+        title_label = ttk.Label(title_frame, text="直播源检测工具", style='Title.TLabel')
+        title_label.pack()
+        
+        # 文件选择区域
+        file_frame = ttk.LabelFrame(self.root, text="文件选择", padding=10)
+        file_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.file_path_var = tk.StringVar()
+        file_entry = ttk.Entry(file_frame, textvariable=self.file_path_var, state='readonly')
+        file_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        
+        sources_btn = ttk.Button(file_frame, text="多源合并", command=self.select_sources, style='Custom.TButton')
+        sources_btn.pack(side='right', padx=(10, 0))
+        
+        select_btn = ttk.Button(file_frame, text="选择M3U文件", command=self.select_file, style='Custom.TButton')
+        select_btn.pack(side='right')
+        
+        # 检测选项区域
+        options_frame = ttk.LabelFrame(self.root, text="检测选项", padding=10)
+        options_frame.pack(fill='x', padx=10, pady=5)
+        
+        # 第一行选项
+        options_row1 = ttk.Frame(options_frame)
+        options_row1.pack(fill='x', pady=(0, 5))
+        
+        ttk.Label(options_row1, text="超时时间(秒):").pack(side='left')
+        self.timeout_var = tk.StringVar(value="10")
+        timeout_spin = ttk.Spinbox(options_row1, from_=5, to=60, width=8, textvariable=self.timeout_var)
+        timeout_spin.pack(side='left', padx=(5, 20))
+        
+        ttk.Label(options_row1, text="并发数:").pack(side='left')
+        self.threads_var = tk.StringVar(value="20")
+        threads_spin = ttk.Spinbox(options_row1, from_=1, to=1000, width=8, textvariable=self.threads_var)
+        threads_spin.pack(side='left', padx=(5, 20))
+        
+        ttk.Label(options_row1, text="单主机并发:").pack(side='left')
+        self.per_host_var = tk.StringVar(value="10")
+        per_host_spin = ttk.Spinbox(options_row1, from_=1, to=100, width=8, textvariable=self.per_host_var)
+        per_host_spin.pack(side='left', padx=(5, 20))
+        
+        ttk.Label(options_row1, text="进程数:").pack(side='left')
+        self.workers_var = tk.StringVar(value="1")
+        workers_spin = ttk.Spinbox(options_row1, from_=1, to=max(1, os.cpu_count() or 1), width=5,
+                                   textvariable=self.workers_var)
+        workers_spin.pack(side='left', padx=(5, 20))
+        
+        self.adaptive_var = tk.BooleanVar(value=False)
+        adaptive_check = ttk.Checkbutton(options_row1, text="自适应并发", variable=self.adaptive_var)
+        adaptive_check.pack(side='left', padx=(0, 20))
+        
+        self.strip_tokens_var = tk.BooleanVar(value=False)
+        strip_tokens_check = ttk.Checkbutton(options_row1, text="去重时忽略鉴权参数", variable=self.strip_tokens_var)
+        strip_tokens_check.pack(side='left')
+        
+        # 第二行选项
+        options_row2 = ttk.Frame(options_frame)
+        options_row2.pack(fill='x')
+        
+        self.check_method_var = tk.StringVar(value="HEAD")
+        ttk.Label(options_row2, text="检测方法:").pack(side='left')
+        method_combo = ttk.Combobox(options_row2, textvariable=self.check_method_var, 
+                                   values=CHECK_METHODS, width=10, state='readonly')
+        method_combo.pack(side='left', padx=(5, 20))
+        
+        self.retry_var = tk.BooleanVar(value=True)
+        retry_check = ttk.Checkbutton(options_row2, text="失败重试", variable=self.retry_var)
+        retry_check.pack(side='left', padx=(0, 20))
+        
+        self.breaker_var = tk.BooleanVar(value=True)
+        breaker_check = ttk.Checkbutton(options_row2, text="主机熔断", variable=self.breaker_var)
+        breaker_check.pack(side='left', padx=(0, 20))
+        
+        self.speed_test_var = tk.BooleanVar(value=False)
+        speed_check = ttk.Checkbutton(options_row2, text="测速", variable=self.speed_test_var)
+        speed_check.pack(side='left', padx=(0, 20))
+        
+        self.incremental_var = tk.BooleanVar(value=False)
+        incremental_check = ttk.Checkbutton(options_row2, text="增量检测", variable=self.incremental_var)
+        incremental_check.pack(side='left', padx=(0, 20))
+        
+        self.prefer_valid_var = tk.BooleanVar(value=False)
+        prefer_valid_check = ttk.Checkbutton(options_row2, text="上次有效的优先", variable=self.prefer_valid_var)
+        prefer_valid_check.pack(side='left', padx=(0, 20))
+        
+        self.detail_log_var = tk.BooleanVar(value=False)
+        detail_check = ttk.Checkbutton(options_row2, text="详细日志", variable=self.detail_log_var)
+        detail_check.pack(side='left')
+        
+        # 第三行选项（导出）
+        options_row3 = ttk.Frame(options_frame)
+        options_row3.pack(fill='x', pady=(5, 0))
+        
+        self.stream_export_var = tk.BooleanVar(value=False)
+        stream_export_check = ttk.Checkbutton(options_row3, text="边检测边导出", variable=self.stream_export_var)
+        stream_export_check.pack(side='left', padx=(0, 20))
+        
+        self.compress_report_var = tk.BooleanVar(value=False)
+        compress_check = ttk.Checkbutton(options_row3, text="压缩检测报告(gzip)", variable=self.compress_report_var)
+        compress_check.pack(side='left')
+        
+        # 控制按钮区域
+        control_frame = ttk.Frame(self.root)
+        control_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.start_btn = ttk.Button(control_frame, text="开始检测", command=self.start_check, style='Custom.TButton')
+        self.start_btn.pack(side='left', padx=(0, 10))
+        
+        self.stop_btn = ttk.Button(control_frame, text="停止检测", command=self.stop_check, 
+                                  style='Custom.TButton', state='disabled')
+        self.stop_btn.pack(side='left', padx=(0, 10))
+        
+        self.export_btn = ttk.Button(control_frame, text="导出结果", command=self.export_results, 
+                                    style='Custom.TButton', state='disabled')
+        self.export_btn.pack(side='left', padx=(0, 10))
+        
+        clear_btn = ttk.Button(control_frame, text="清空日志", command=self.clear_log, style='Custom.TButton')
+        clear_btn.pack(side='left')
+        
+        # 进度显示区域
+        progress_frame = ttk.LabelFrame(self.root, text="检测进度", padding=10)
+        progress_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.pack(fill='x', pady=(0, 5))
+        
+        progress_info_frame = ttk.Frame(progress_frame)
+        progress_info_frame.pack(fill='x')
+        
+        self.progress_label = ttk.Label(progress_info_frame, text="准备就绪")
+        self.progress_label.pack(side='left')
+        
+        self.stats_label = ttk.Label(progress_info_frame, text="")
+        self.stats_label.pack(side='right')
+        
+        # 日志显示区域
+        log_frame = ttk.LabelFrame(self.root, text="检测日志", padding=5)
+        log_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, font=('Consolas', 9))
+        self.log_text.pack(fill='both', expand=True)
+        for level, color in (("INFO", "black"), ("SUCCESS", "green"), ("ERROR", "red"), ("WARNING", "orange")):
+            self.log_text.tag_configure(level, foreground=color)
+        
+        # 添加欢迎信息
+        self.log_message("欢迎使用直播源检测工具！", "INFO")
+        self.log_message("请选择M3U文件开始检测", "INFO")
+        
+    # 日志区最多保留的行数，以及检测中向界面发送进度快照的最小间隔（秒）
+    LOG_MAX_LINES = 5000
+    UPDATE_INTERVAL = 0.2
+    
+    PLAYLIST_FILETYPES = [
+        ("所有支持格式", "*.m3u;*.txt;*.csv"), 
+        ("M3U文件", "*.m3u"), 
+        ("文本文件", "*.txt"), 
+        ("CSV文件", "*.csv"),
+        ("所有文件", "*.*")
+    ]
+    
+    def select_file(self):
+        """选择M3U文件"""
+        file_path = filedialog.askopenfilename(
+            title="选择直播源文件",
+            filetypes=self.PLAYLIST_FILETYPES
+        )
+        if file_path:
+            self.file_path_var.set(file_path)
+            self.load_channels(file_path)
+            
+    def load_channels(self, file_path):
+        """加载频道列表"""
+        try:
+            with open_playlist(file_path) as f:
+                parser = PlaylistParser(f)
+                self.channels = list(parser)
+            self.playlist_header = parser.header
+                    
+            self.log_message(f"成功加载 {len(self.channels)} 个频道", "SUCCESS")
+            self.log_message(f"检测到{FORMAT_NAMES[parser.format]}格式文件", "INFO")
+            
+        except Exception as e:
+            self.log_message(f"加载文件失败: {str(e)}", "ERROR")
+            messagebox.showerror("错误", f"加载文件失败:\n{str(e)}")
+            
+    def select_sources(self):
+        """输入多个本地文件或远程地址，合并成一个频道列表"""
+        if self.is_checking:
+            return
+            
+        dialog = tk.Toplevel(self.root)
+        dialog.title("多源合并")
+        dialog.transient(self.root)
+        
+        ttk.Label(dialog, text="每行一个直播源（本地文件路径或http(s)地址），合并后保留全部频道，地址相同的只检测一次：").pack(
+            anchor='w', padx=10, pady=(10, 5))
+        text = scrolledtext.ScrolledText(dialog, width=80, height=12)
+        text.pack(fill='both', expand=True, padx=10)
+        text.insert('1.0', '\n'.join(self.sources))
+        
+        def add_files():
+            paths = filedialog.askopenfilenames(parent=dialog, title="选择直播源文件",
+                                                filetypes=self.PLAYLIST_FILETYPES)
+            for path in paths:
+                if text.get('1.0', 'end-1c').strip():
+                    text.insert(tk.END, '\n')
+                text.insert(tk.END, path)
+                
+        def confirm():
+            sources = [line.strip() for line in text.get('1.0', tk.END).splitlines() if line.strip()]
+            dialog.destroy()
+            if sources:
+                self.merge_sources(sources)
+                
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill='x', padx=10, pady=10)
+        ttk.Button(button_frame, text="添加本地文件", command=add_files).pack(side='left')
+        ttk.Button(button_frame, text="加载", command=confirm, style='Custom.TButton').pack(side='right')
+        
+    def merge_sources(self, sources):
+        """在后台线程中并发读取多个直播源并合并，完成后通过进度队列更新频道列表"""
+        self.sources = sources
+        self.file_path_var.set(f"{len(sources)} 个来源")
+        self.start_btn.config(state='disabled')
+        self.log_message(f"正在读取 {len(sources)} 个直播源...", "INFO")
+        
+        thread = threading.Thread(target=self.load_sources_worker, args=(sources,))
+        thread.daemon = True
+        thread.start()
+        
+    def load_sources_worker(self, sources):
+        """读取并合并多个直播源（在后台线程中运行）"""
+        cache = None
+        try:
+            cache = SourceCache(SOURCE_CACHE_PATH)
+        except Exception as e:
+            self.progress_queue.put(('error', f"打开直播源缓存失败，将完整下载: {str(e)}"))
+        try:
+            strip_params = TOKEN_QUERY_PARAMS if self.strip_tokens_var.get() else ()
+            merged = asyncio.run(load_sources(sources, cache, strip_params=strip_params))
+        except Exception as e:
+            self.progress_queue.put(('error', f"读取直播源失败: {str(e)}"))
+            merged = None
+        finally:
+            if cache is not None:
+                cache.close()
+        self.progress_queue.put(('sources', merged))
+        
+    def sources_loaded(self, merged):
+        """多源合并完成"""
+        self.start_btn.config(state='normal')
+        if merged is None:
+            return
+        channels, header, reports = merged
+        for report in reports:
+            if report['status'] == 'failed':
+                self.log_message(f"✗ {report['source']} - {report['error']}", "ERROR")
+            else:
+                self.log_message(f"✓ {report['source']} - {SOURCE_STATUS_NAMES[report['status']]}，"
+                                 f"{FORMAT_NAMES[report['format']]}格式 {report['count']} 个频道，"
+                                 f"其中新地址 {report['added']} 个", "INFO")
+        self.channels = channels
+        self.playlist_header = header
+        self.log_message(f"合并后共 {len(channels)} 个频道", "SUCCESS")
+        
+    def start_check(self):
+        """开始检测"""
+        if not self.channels:
+            messagebox.showwarning("警告", "请先选择并加载M3U文件")
+            return
+            
+        if self.is_checking:
+            return
+            
+        self.exporter = None
+        if self.stream_export_var.get():
+            export_dir = filedialog.askdirectory(title="选择实时导出目录")
+            if not export_dir:
+                return
+            self.exporter = ResultExporter(export_dir, header=self.playlist_header,
+                                           compress=self.compress_report_var.get())
+            
+        self.journal = self.open_journal()
+        
+        self.is_checking = True
+        self.valid_channels = []
+        self.invalid_channels = []
+        self.dedup_stats = None
+        self.tier_stats = None
+        self.concurrency_stats = None
+        self.interrupted = False
+        
+        # 更新按钮状态
+        self.start_btn.config(state='disabled')
+        self.stop_btn.config(state='normal')
+        self.export_btn.config(state='disabled')
+        
+        # 重置进度
+        self.progress_var.set(0)
+        self.progress_label.config(text="开始检测...")
+        
+        # 清空之前的结果
+        self.log_message("=" * 50, "INFO")
+        self.log_message("开始检测直播源...", "INFO")
+        self.log_message(f"总计 {len(self.channels)} 个频道", "INFO")
+        self.log_message(f"超时设置: {self.timeout_var.get()}秒", "INFO")
+        if self.adaptive_var.get():
+            self.log_message(f"并发数: 自适应，最多 {self.threads_var.get()}（单主机最多 {self.per_host_var.get()}）", "INFO")
+        else:
+            self.log_message(f"并发数: {self.threads_var.get()}（单主机 {self.per_host_var.get()}）", "INFO")
+        self.log_message(f"检测方法: {self.check_method_var.get()}", "INFO")
+        self.log_message("=" * 50, "INFO")
+        
+        # 启动检测线程
+        self.check_thread = threading.Thread(target=self.check_channels)
+        self.check_thread.daemon = True
+        self.check_thread.start()
+        
+    def open_journal(self):
+        """打开断点续检的进度日志：有上次未完成的检测时询问是否继续，否则清空日志"""
+        journal = ResultJournal(JOURNAL_PATH)
+        try:
+            done = journal.matching(self.channels) if journal.load() else 0
+            if done:
+                if messagebox.askyesno("断点续检",
+                                       f"发现上次未完成的检测（已完成 {done}/{len(self.channels)} 个频道）。\n\n"
+                                       f"是否继续上次的检测？选择\"否\"将重新开始。"):
+                    return journal
+            journal.reset()
+        except Exception as e:
+            self.log_message(f"进度日志不可用，中断后将无法续检: {str(e)}", "WARNING")
+            return None
+        return journal
+        
+    def stop_check(self):
+        """停止检测"""
+        self.is_checking = False
+        if self.engine:
+            self.engine.stop()
+        self.progress_queue.put(('status', '正在停止检测...'))
+        
+    def check_channels(self):
+        """检测频道可用性（在后台线程中运行异步检测引擎）"""
+        timeout = int(self.timeout_var.get())
+        max_workers = int(self.threads_var.get())
+        per_host = int(self.per_host_var.get())
+        method = self.check_method_var.get()
+        retry = self.retry_var.get()
+        workers = int(self.workers_var.get())
+        
+        completed = 0
+        total = len(self.channels)
+        detail_log = self.detail_log_var.get()
+        # 结果回调只累计计数和日志，最多每UPDATE_INTERVAL秒向界面发送一次进度快照和一批日志；
+        # 界面定时器(update_progress)也会触发发送，两个线程共用lock
+        pending_logs = collections.deque(maxlen=self.LOG_MAX_LINES)
+        queued_logs = 0
+        last_update = 0.0
+        published = -1
+        lock = threading.Lock()
+        exporter = self.exporter
+        store = None
+        prefer_valid = self.prefer_valid_var.get()
+        if self.incremental_var.get() or prefer_valid:
+            try:
+                store = ResultStore(RESULT_DB_PATH, max_age=INCREMENTAL_MAX_AGE if self.incremental_var.get() else 0)
+            except Exception as e:
+                self.progress_queue.put(('error', f"打开检测记录失败，将完整检测: {str(e)}"))
+        options = dict(timeout=timeout, method=method, retry=retry,
+                       concurrency=max_workers, per_host_limit=per_host,
+                       breaker_threshold=5 if self.breaker_var.get() else 0,
+                       sample_size=SPEED_TEST_BYTES if self.speed_test_var.get() else 0,
+                       store=store, prefer_valid=prefer_valid,
+                       strip_params=TOKEN_QUERY_PARAMS if self.strip_tokens_var.get() else (),
+                       adaptive=self.adaptive_var.get(), journal=self.journal, metrics=Metrics())
+        self.metrics = options['metrics']
+        if workers > 1:
+            engine = ShardedProbeEngine(workers=workers, **options)
+        else:
+            engine = ProbeEngine(**options)
+        self.engine = engine
+        
+        def on_result(result):
+            nonlocal completed, queued_logs
+            if not self.is_checking:
+                engine.stop()
+                return
+                
+            if exporter is not None:
+                exporter.add(result)
+            
+            with lock:
+                completed += 1
+                if result['status'] == 'valid':
+                    self.valid_channels.append(result)
+                    if detail_log:
+                        pending_logs.append((f"✓ {result['name']} - 可用 ({result.get('response_time', 0)}ms)", "SUCCESS"))
+                        queued_logs += 1
+                else:
+                    self.invalid_channels.append(result)
+                    if detail_log:
+                        pending_logs.append((f"✗ {result['name']} - {result.get('error', '未知错误')}", "ERROR"))
+                        queued_logs += 1
+            
+            publish_progress()
+        
+        def publish_progress(force=False):
+            nonlocal queued_logs, last_update, published
+            with lock:
+                now = time.monotonic()
+                if not force and (now - last_update < self.UPDATE_INTERVAL or
+                                  (completed == published and not pending_logs)):
+                    return
+                last_update = now
+                published = completed
+                if pending_logs:
+                    logs = list(pending_logs)
+                    if queued_logs > len(logs):
+                        logs.insert(0, (f"……省略 {queued_logs - len(logs)} 条日志", "WARNING"))
+                    self.progress_queue.put(('logs', logs))
+                    pending_logs.clear()
+                queued_logs = 0
+                self.progress_queue.put(('progress', {
+                    'progress': (completed / total) * 100 if total else 100,
+                    'completed': completed,
+                    'total': total,
+                    'valid': len(self.valid_channels),
+                    'invalid': len(self.invalid_channels)
+                }))
+        
+        def on_status(message):
+            self.progress_queue.put(('log', (message, "INFO")))
+        
+        finished = False
+        self.flush_progress = publish_progress
+        try:
+            asyncio.run(engine.run(self.channels, on_result, on_status))
+            finished = not engine.stopped
+        except Exception as e:
+            self.progress_queue.put(('error', f"检测过程出错: {str(e)}"))
+        finally:
+            self.flush_progress = None
+            if store is not None:
+                store.close()
+            if self.journal is not None:
+                # 全部检测完成后不再需要进度日志；中途停止或出错时保留，下次可继续
+                try:
+                    if finished:
+                        self.journal.discard()
+                    else:
+                        self.journal.close()
+                except Exception as e:
+                    self.progress_queue.put(('error', f"保存检测进度失败: {str(e)}"))
+        self.dedup_stats = engine.dedup_stats
+        self.tier_stats = engine.tier_stats
+        self.concurrency_stats = engine.concurrency_stats
+        self.interrupted = not finished
+        publish_progress(force=True)
+        brief = self.metrics.describe()
+        if brief:
+            self.progress_queue.put(('log', (brief, "INFO")))
+        
+        # 实时导出：检测结束（包括中途停止）时生成正式文件和检测报告
+        if exporter is not None:
+            try:
+                exporter.finalize(self.report_summary())
+                self.progress_queue.put(('log', (f"结果已导出到: {exporter.directory}", "SUCCESS")))
+            except Exception as e:
+                exporter.abort()
+                self.progress_queue.put(('error', f"导出失败: {str(e)}"))
+        
+        # 检测完成
+        self.progress_queue.put(('complete', None))
+        
+    def update_progress(self):
+        """更新进度显示：一次取出队列中的全部消息，日志合并成一次插入，进度只显示最新的快照"""
+        start = time.monotonic()
+        flush_progress = self.flush_progress
+        if flush_progress is not None:
+            # 结果稀疏（如大量频道在等待超时）时由定时器送出积压的进度和日志
+            flush_progress()
+        handled = 0
+        logs = []
+        progress = None
+        complete = False
+        try:
+            while True:
+                msg_type, data = self.progress_queue.get_nowait()
+                handled += 1
+                
+                if msg_type == 'progress':
+                    progress = data
+                    
+                elif msg_type == 'logs':
+                    logs.extend(data)
+                    
+                elif msg_type == 'error':
+                    logs.append((data, "ERROR"))
+                    
+                elif msg_type == 'log':
+                    logs.append(data)
+                    
+                elif msg_type == 'status':
+                    self.progress_label.config(text=data)
+                    
+                elif msg_type == 'sources':
+                    self.append_logs(logs)
+                    logs = []
+                    self.sources_loaded(data)
+                    
+                elif msg_type == 'complete':
+                    complete = True
+                    break
+                    
+        except queue.Empty:
+            pass
+        
+        if logs:
+            self.append_logs(logs)
+        if progress is not None:
+            self.progress_var.set(progress['progress'])
+            self.progress_label.config(text=f"检测进度: {progress['completed']}/{progress['total']}")
+            self.stats_label.config(text=f"有效: {progress['valid']} | 无效: {progress['invalid']}")
+        if handled and self.metrics is not None:
+            self.metrics.inc('ui_messages_total', amount=handled)
+            self.metrics.observe('ui_drain', time.monotonic() - start)
+        if complete:
+            self.check_complete()
+        
+        # 继续更新
+        self.root.after(100, self.update_progress)
+        
+    def check_complete(self):
+        """检测完成处理"""
+        self.is_checking = False
+        
+        # 更新按钮状态
+        self.start_btn.config(state='normal')
+        self.stop_btn.config(state='disabled')
+        self.export_btn.config(state='normal')
+        
+        # 显示结果
+        total = len(self.channels)
+        valid = len(self.valid_channels)
+        invalid = len(self.invalid_channels)
+        success_rate = (valid / total * 100) if total > 0 else 0
+        
+        self.progress_label.config(text="检测完成")
+        self.stats_label.config(text=f"有效: {valid} | 无效: {invalid} | 成功率: {success_rate:.1f}%")
+        
+        self.log_message("=" * 50, "INFO")
+        self.log_message("检测完成！", "SUCCESS")
+        self.log_message(f"总计检测: {total} 个频道", "INFO")
+        self.log_message(f"有效频道: {valid} 个", "SUCCESS")
+        self.log_message(f"无效频道: {invalid} 个", "ERROR")
+        self.log_message(f"成功率: {success_rate:.1f}%", "INFO")
+        dedup_summary = ''
+        if self.dedup_stats and self.dedup_stats['duplicates']:
+            dedup_summary = (f"\n重复地址: {self.dedup_stats['duplicates']} 个"
+                             f"（实际检测 {self.dedup_stats['unique']} 个地址）")
+            self.log_message(dedup_summary.strip(), "INFO")
+        if self.tier_stats and self.tier_stats['second_pass']:
+            self.log_message(f"第二轮重新检测: {self.tier_stats['second_pass']} 个频道，"
+                             f"恢复 {self.tier_stats['recovered']} 个", "INFO")
+        self.log_message("=" * 50, "INFO")
+        
+        # 显示完成对话框
+        messagebox.showinfo("检测完成", 
+                           f"检测完成！\n\n"
+                           f"总计: {total} 个频道\n"
+                           f"有效: {valid} 个\n"
+                           f"无效: {invalid} 个\n"
+                           f"成功率: {success_rate:.1f}%"
+                           f"{dedup_summary}")
+        
+    def export_results(self):
+        """导出结果"""
+        if not self.valid_channels and not self.invalid_channels:
+            messagebox.showwarning("警告", "没有检测结果可导出")
+            return
+            
+        export_dir = filedialog.askdirectory(title="选择导出目录")
+        if not export_dir:
+            return
+            
+        exporter = ResultExporter(export_dir, header=self.playlist_header,
+                                  compress=self.compress_report_var.get())
+        try:
+            for result in itertools.chain(self.valid_channels, self.invalid_channels):
+                exporter.add(result)
+            exporter.finalize(self.report_summary())
+            
+            self.log_message(f"结果已导出到: {export_dir}", "SUCCESS")
+            messagebox.showinfo("导出完成", f"结果已成功导出到:\n{export_dir}")
+            
+        except Exception as e:
+            exporter.abort()
+            self.log_message(f"导出失败: {str(e)}", "ERROR")
+            messagebox.showerror("导出失败", f"导出失败:\n{str(e)}")
+            
+    def report_summary(self):
+        """检测报告开头的汇总字段"""
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'total_channels': len(self.channels),
+            'valid_channels': len(self.valid_channels),
+            'invalid_channels': len(self.invalid_channels),
+            'success_rate': len(self.valid_channels) / len(self.channels) * 100 if self.channels else 0,
+            'interrupted': self.interrupted,
+            'dedup_stats': self.dedup_stats,
+            'tier_stats': self.tier_stats,
+            'concurrency_stats': self.concurrency_stats,
+            'metrics': self.metrics.summary() if self.metrics is not None else None
+        }
+            
+    def clear_log(self):
+        """清空日志"""
+        self.log_text.delete(1.0, tk.END)
+        self.log_message("日志已清空", "INFO")
+        
+    def log_message(self, message, level="INFO"):
+        """添加日志消息"""
+        self.append_logs([(message, level)])
+        
+    def append_logs(self, entries):
+        """批量添加日志 [(消息, 级别), ...]：一次插入、一次滚动，日志区只保留最近LOG_MAX_LINES行"""
+        if not entries:
+            return
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        
+        # 按级别着色，全部消息在一次insert调用中插入
+        chunks = []
+        for message, level in entries[-self.LOG_MAX_LINES:]:
+            chunks.extend((f"[{timestamp}] {message}\n", level))
+        self.log_text.insert(tk.END, *chunks)
+        
+        lines = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if lines > self.LOG_MAX_LINES:
+            self.log_text.delete('1.0', f'{lines - self.LOG_MAX_LINES + 1}.0')
+        self.log_text.see(tk.END)
+
+
+def build_arg_parser():
+    """命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="直播源检测工具 - 命令行批量模式，每检测完一个频道输出一行JSON（NDJSON）。"
+                    "不带任何参数运行时启动图形界面。")
+    parser.add_argument('input', nargs='*',
+                        help="直播源文件路径（M3U/TXT/CSV），'-' 表示从标准输入读取；"
+                             "也可以是http(s)地址，指定多个来源时并发读取并合并，保留全部频道，"
+                             "地址相同的只检测一次（--no-dedup 时逐个检测）")
+    parser.add_argument('-o', '--output', default='-',
+                        help="结果输出文件，默认 '-' 输出到标准输出")
+    parser.add_argument('-t', '--timeout', type=int, default=10, help="超时时间(秒)，默认10")
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help="并发数，默认200")
+    parser.add_argument('--per-host', type=int, default=10,
+                        help="同一主机的最大并发连接数（连接keep-alive复用），默认10")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="自适应并发：根据延迟、超时和限流自动调整全局和单主机并发，-c/--per-host 为上限")
+    parser.add_argument('--breaker', type=int, default=5,
+                        help="同一主机连续失败多少次后熔断，跳过该主机剩余频道，0表示不熔断，默认5")
+    parser.add_argument('-m', '--method', choices=CHECK_METHODS, default="HEAD", help="检测方法，默认HEAD")
+    parser.add_argument('--sample-kb', type=int, default=0,
+                        help="测速：每个有效频道最多下载多少KB计算下载速度，默认0不测速")
+    parser.add_argument('--no-retry', action='store_true',
+                        help="不重试：只用 -t/--timeout 检测一轮。默认先用短超时检测全部频道，"
+                             "超时和暂时失败的频道最后再用完整超时检测一轮")
+    parser.add_argument('--fast-timeout', type=int, default=None,
+                        help="第一轮的超时时间(秒)，默认为超时时间的三分之一（至少2秒）")
+    parser.add_argument('--retry-delay', type=float, default=RETRY_DELAY,
+                        help=f"第一轮结束后等待多少秒开始第二轮，默认{RETRY_DELAY}")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="不去重：默认规范化后地址相同的频道只检测一次，结果复制给每个频道")
+    parser.add_argument('--strip-param', action='append', default=[], metavar='NAME',
+                        help="去重时忽略的查询参数（如鉴权token），可重复指定；"
+                             "'tokens' 表示常见的鉴权参数 " + ','.join(TOKEN_QUERY_PARAMS))
+    parser.add_argument('--db', default=None,
+                        help=f"检测结果库(SQLite)路径，记录每次检测结果和历史，默认 {os.path.basename(RESULT_DB_PATH)}（仅在开启增量检测或有效优先时使用）")
+    parser.add_argument('--prefer-valid', action='store_true',
+                        help="上次检测有效的频道优先检测（读取检测结果库），尽早得到可用的播放列表")
+    parser.add_argument('--priority-group', action='append', default=[], metavar='GROUP',
+                        help="优先检测的分组，可重复指定，按指定的顺序检测")
+    parser.add_argument('--no-interleave', action='store_true',
+                        help="按文件顺序检测：默认按主机轮转，避免连续的大量请求集中在同一主机上")
+    parser.add_argument('--incremental', action='store_true',
+                        help="增量检测：近期检测过且状态稳定的频道沿用上次结果，只检测新增、过期或状态反复的频道")
+    parser.add_argument('--max-age', type=float, default=INCREMENTAL_MAX_AGE / 3600,
+                        help="增量检测时结果的有效期(小时)，默认6")
+    parser.add_argument('--source-cache', default=SOURCE_CACHE_PATH,
+                        help=f"远程直播源缓存(SQLite)路径，上游未更新时不重新下载，默认 {os.path.basename(SOURCE_CACHE_PATH)}")
+    parser.add_argument('--journal', default=None,
+                        help="进度日志路径：已完成的结果分批写入，检测被中断后可用 --resume 继续，全部完成后自动删除")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"从进度日志继续上次被中断的检测，只检测还没有结果的频道"
+                             f"（未指定 --journal 时使用 {os.path.basename(JOURNAL_PATH)}）")
+    parser.add_argument('--valid-only', action='store_true', help="只输出有效频道")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="工作进程数：大于1时按主机把频道分成多个分片，由多个进程并行检测，默认1（单进程）")
+    parser.add_argument('--shards', type=int, default=None,
+                        help="分片数，默认等于工作进程数；有其他机器参与时可以设得更多，由空闲的进程领取")
+    parser.add_argument('--coordinator', type=address_arg, default=None, metavar='HOST:PORT',
+                        help="启动分片协调器监听该地址，其他机器上用 --worker 连接后一起检测（--workers 0 时本机只做协调）")
+    parser.add_argument('--worker', type=address_arg, default=None, metavar='HOST:PORT',
+                        help="作为工作进程连接协调器检测分给它的分片（不需要指定直播源），--workers 指定本机启动的进程数")
+    parser.add_argument('--authkey', default=os.environ.get(SHARD_AUTHKEY_ENV),
+                        help=f"协调器认证密钥，协调器和工作进程必须一致，默认读取环境变量 {SHARD_AUTHKEY_ENV}")
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="检测过程中在该端口提供Prometheus格式的运行指标（http://127.0.0.1:PORT/metrics）")
+    parser.add_argument('--metrics-file', default=None,
+                        help="检测过程中定期把Prometheus格式的运行指标写入该文件（可供node_exporter的textfile采集器读取）")
+    parser.add_argument('--metrics-interval', type=float, default=10, help="写入指标文件的间隔(秒)，默认10")
+    parser.add_argument('--export-dir', default=None, metavar='DIR',
+                        help="边检测边导出有效/无效频道CSV、有效频道M3U和检测报告到该目录，结束时一次性生成正式文件")
+    parser.add_argument('--gzip-report', action='store_true', help="检测报告以gzip压缩保存(.json.gz)")
+    parser.add_argument('--serve', type=address_arg, default=None, metavar='HOST:PORT',
+                        help="常驻监控：持续按周期重新检测，在该地址提供当前的有效频道M3U/CSV/JSON、"
+                             "各频道状态和运行指标（单进程检测，--export-dir 指定时同步更新该目录中的有效频道文件）")
+    parser.add_argument('--interval', type=float, default=MONITOR_INTERVAL / 60,
+                        help="常驻监控时每个频道重新检测的周期(分钟)，检测错开分布在整个周期内，默认60")
+    return parser
+
+
+def address_arg(text):
+    """argparse用：解析 主机:端口"""
+    try:
+        return parse_address(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def run_worker_cli(args):
+    """命令行工作进程模式：启动 --workers 个进程连接协调器，协调器关闭后退出"""
+    if not args.authkey:
+        print(f"错误：需要用 --authkey 或环境变量 {SHARD_AUTHKEY_ENV} 指定与协调器相同的认证密钥", file=sys.stderr)
+        return 2
+    host, port = args.worker
+    authkey = args.authkey.encode('utf-8')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_shard_worker, args=(args.worker, authkey, True), daemon=True)
+                 for _ in range(max(1, args.workers) - 1)]
+    print(f"连接协调器 {host}:{port}，本机 {len(processes) + 1} 个工作进程", file=sys.stderr)
+    for process in processes:
+        process.start()
+    try:
+        run_shard_worker(args.worker, authkey)
+    except KeyboardInterrupt:
+        print("\n工作进程被用户中断", file=sys.stderr)
+    except (OSError, multiprocessing.AuthenticationError) as e:
+        print(f"连接协调器失败: {str(e)}", file=sys.stderr)
+        return 2
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(1)
+    print("协调器已关闭，工作进程退出", file=sys.stderr)
+    return 0
+
+
+def _load_cli_sources(args, strip_params):
+    """命令行多源模式：并发读取全部来源并合并，逐个来源输出统计到标准错误，返回 (频道列表, M3U文件头)"""
+    cache = SourceCache(args.source_cache)
+    try:
+        channels, header, reports = asyncio.run(load_sources(args.input, cache, strip_params=strip_params))
+    finally:
+        cache.close()
+    for report in reports:
+        if report['status'] == 'failed':
+            print(f"读取失败: {report['source']} - {report['error']}", file=sys.stderr)
+        else:
+            print(f"{report['source']}: {SOURCE_STATUS_NAMES[report['status']]}，{FORMAT_NAMES[report['format']]}格式 "
+                  f"{report['count']} 个频道，其中新地址 {report['added']} 个", file=sys.stderr)
+    print(f"合并 {len(reports)} 个来源，共 {len(channels)} 个频道", file=sys.stderr)
+    return channels, header
+
+
+def _cli_strip_params(args):
+    """--strip-param 指定的参数名，'tokens' 展开为常见的鉴权参数"""
+    strip_params = []
+    for name in args.strip_param:
+        strip_params.extend(TOKEN_QUERY_PARAMS if name == 'tokens' else [name])
+    return strip_params
+
+
+def _cli_engine_options(args, strip_params, store=None, journal=None):
+    """命令行参数对应的ProbeEngine参数"""
+    return dict(timeout=args.timeout, method=args.method,
+                retry=not args.no_retry, first_pass_timeout=args.fast_timeout,
+                retry_delay=args.retry_delay, concurrency=args.concurrency,
+                per_host_limit=args.per_host, breaker_threshold=args.breaker,
+                sample_size=args.sample_kb * 1024, store=store, dedup=not args.no_dedup,
+                strip_params=strip_params, adaptive=args.adaptive, journal=journal, metrics=Metrics(),
+                interleave=not args.no_interleave, priority_groups=args.priority_group,
+                prefer_valid=args.prefer_valid)
+
+
+def run_monitor_cli(args):
+    """命令行常驻监控模式：读入全部频道后持续检测，通过HTTP提供当前结果，Ctrl+C退出"""
+    strip_params = _cli_strip_params(args)
+    header = None
+    try:
+        if len(args.input) == 1 and not is_remote_source(args.input[0]):
+            with open_playlist(args.input[0]) as playlist:
+                parser = PlaylistParser(playlist)
+                channels = list(parser)
+                header = parser.header
+            print(f"检测到{FORMAT_NAMES[parser.format]}格式，共 {len(channels)} 个频道", file=sys.stderr)
+        else:
+            channels, header = _load_cli_sources(args, strip_params)
+    except Exception as e:
+        print(f"加载文件失败: {str(e)}", file=sys.stderr)
+        return 2
+    if args.export_dir:
+        os.makedirs(args.export_dir, exist_ok=True)
+
+    store = None
+    if args.db or args.prefer_valid:
+        store = ResultStore(args.db or RESULT_DB_PATH)
+    monitor = ChannelMonitor(channels, interval=args.interval * 60, header=header, export_dir=args.export_dir,
+                             **_cli_engine_options(args, strip_params, store))
+    host, port = args.serve
+    try:
+        port = monitor.serve(host or '0.0.0.0', port)
+    except OSError as e:
+        print(f"启动HTTP服务失败: {str(e)}", file=sys.stderr)
+        if store is not None:
+            store.close()
+        return 2
+    base = f"http://{host or '127.0.0.1'}:{port}"
+    print(f"常驻监控已启动: {base}/playlist.m3u（另有 /valid.csv、/valid.json、/status.json、/metrics），"
+          f"每 {args.interval:g} 分钟重新检测一轮", file=sys.stderr)
+    try:
+        asyncio.run(monitor.run(lambda message: print(message, file=sys.stderr)))
+    except KeyboardInterrupt:
+        print("\n监控已停止", file=sys.stderr)
+    finally:
+        monitor.close()
+        if store is not None:
+            store.close()
+    return 0
+
+
+def run_cli(args):
+    """命令行批量检测：边读取边检测，结果逐行写出，内存占用不随文件大小增长
+
+    指定多个来源或远程地址时先并发读取并合并，再检测合并后的频道列表。
+    """
+    strip_params = _cli_strip_params(args)
+    if args.coordinator is not None and not args.authkey:
+        print(f"错误：启动协调器需要用 --authkey 或环境变量 {SHARD_AUTHKEY_ENV} 设置认证密钥", file=sys.stderr)
+        return 2
+
+    playlist = None
+    try:
+        if len(args.input) == 1 and not is_remote_source(args.input[0]):
+            playlist = open_playlist(args.input[0])
+            parser = PlaylistParser(playlist)
+            print(f"检测到{FORMAT_NAMES[parser.format]}格式，边读取边检测", file=sys.stderr)
+            channels = iter(parser)
+            header = parser.header
+        else:
+            channels, header = _load_cli_sources(args, strip_params)
+    except Exception as e:
+        print(f"加载文件失败: {str(e)}", file=sys.stderr)
+        return 2
+
+    if args.output == '-':
+        sys.stdout.reconfigure(encoding='utf-8')
+        out = sys.stdout
+    else:
+        out = open(args.output, 'w', encoding='utf-8')
+
+    counts = {'valid': 0, 'invalid': 0}
+    exporter = None
+    if args.export_dir:
+        os.makedirs(args.export_dir, exist_ok=True)
+        exporter = ResultExporter(args.export_dir, header=header, compress=args.gzip_report)
+
+    def on_result(result):
+        counts[result['status']] += 1
+        if exporter is not None:
+            exporter.add(result)
+        if args.valid_only and result['status'] != 'valid':
+            return
+        out.write(json.dumps(result_record(result), ensure_ascii=False) + '\n')
+        out.flush()
+
+    store = None
+    if args.db or args.incremental or args.prefer_valid:
+        store = ResultStore(args.db or RESULT_DB_PATH,
+                            max_age=args.max_age * 3600 if args.incremental else 0)
+
+    journal = None
+    if args.journal or args.resume:
+        journal = ResultJournal(args.journal or JOURNAL_PATH)
+        if args.resume:
+            print(f"进度日志中有 {journal.load()} 个已完成的结果", file=sys.stderr)
+        else:
+            journal.reset()
+
+    options = _cli_engine_options(args, strip_params, store, journal)
+    metrics_exporter = None
+    if args.metrics_port is not None or args.metrics_file:
+        try:
+            metrics_exporter = MetricsExporter(options['metrics'], port=args.metrics_port,
+                                               path=args.metrics_file, interval=args.metrics_interval).start()
+        except OSError as e:
+            print(f"启动指标导出失败: {str(e)}", file=sys.stderr)
+        else:
+            if args.metrics_port is not None:
+                print(f"运行指标: http://127.0.0.1:{metrics_exporter.port}/metrics", file=sys.stderr)
+    if args.workers > 1 or args.coordinator is not None:
+        engine = ShardedProbeEngine(workers=args.workers, shards=args.shards, coordinator=args.coordinator,
+                                    authkey=args.authkey, **options)
+    else:
+        engine = ProbeEngine(**options)
+    finished = False
+    try:
+        asyncio.run(engine.run(channels, on_result,
+                               lambda message: print(message, file=sys.stderr)))
+        finished = True
+    except KeyboardInterrupt:
+        print("\n检测被用户中断", file=sys.stderr)
+        if journal is not None:
+            print(f"已完成的结果保存在 {journal.path}，可用 --resume 继续", file=sys.stderr)
+    finally:
+        if journal is not None:
+            if finished:
+                journal.discard()
+            else:
+                journal.close()
+        if exporter is not None:
+            total = counts['valid'] + counts['invalid']
+            try:
+                exporter.finalize({
+                    'timestamp': datetime.now().isoformat(),
+                    'total_channels': total,
+                    'valid_channels': counts['valid'],
+                    'invalid_channels': counts['invalid'],
+                    'success_rate': counts['valid'] / total * 100 if total else 0,
+                    'interrupted': not finished,
+                    'dedup_stats': engine.dedup_stats,
+                    'tier_stats': engine.tier_stats,
+                    'concurrency_stats': engine.concurrency_stats,
+                    'metrics': options['metrics'].summary()
+                })
+                print(f"{'已完成部分的' if not finished else ''}结果已导出到: {args.export_dir}", file=sys.stderr)
+            except OSError as e:
+                exporter.abort()
+                print(f"导出失败: {str(e)}", file=sys.stderr)
+        if metrics_exporter is not None:
+            try:
+                metrics_exporter.close()
+            except OSError as e:
+                print(f"写入指标文件失败: {str(e)}", file=sys.stderr)
+        if playlist is not None:
+            playlist.close()
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.close()
+
+    if not finished:
+        return 130
+    if playlist is not None:
+        print(f"共读取 {parser.count} 个频道", file=sys.stderr)
+    total = counts['valid'] + counts['invalid']
+    success_rate = (counts['valid'] / total * 100) if total > 0 else 0
+    print(f"检测完成: 总计 {total} | 有效 {counts['valid']} | 无效 {counts['invalid']} | "
+          f"成功率 {success_rate:.1f}%", file=sys.stderr)
+    if engine.dedup_stats['duplicates']:
+        print(f"重复地址: {engine.dedup_stats['duplicates']} 个 | "
+              f"实际检测 {engine.dedup_stats['unique']} 个地址", file=sys.stderr)
+    if engine.tier_stats['second_pass']:
+        print(f"第二轮重新检测: {engine.tier_stats['second_pass']} 个 | "
+              f"恢复 {engine.tier_stats['recovered']} 个", file=sys.stderr)
+    brief = options['metrics'].describe()
+    if brief:
+        print(brief, file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    """主函数：带参数时运行命令行模式，否则启动图形界面"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv:
+        parser = build_arg_parser()
+        args = parser.parse_args(argv)
+        if args.worker is not None:
+            return run_worker_cli(args)
+        if not args.input:
+            parser.error("需要指定直播源文件或地址")
+        if args.serve is not None:
+            return run_monitor_cli(args)
+        return run_cli(args)
+        
+    if tk is None:
+        print("错误：tkinter不可用，无法启动图形界面")
+        return 1
+        
+    root = tk.Tk()
+    app = StreamChecker(root)
+    
+    try:
+        root.mainloop()
+    except KeyboardInterrupt:
+        print("\n程序被用户中断")
+    except Exception as e:
+        print(f"程序出错: {str(e)}")
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为exe后分片检测的工作进程需要
+    sys.exit(main())
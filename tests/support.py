@@ -0,0 +1,60 @@
+"""测试共用：在后台线程中运行benchmark.py的模拟IPTV源站，以及用频道列表运行检测引擎"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import FakeOrigin
+from stream_checker import Channel
+
+
+class OriginThread:
+    """在后台线程的事件循环中运行FakeOrigin，ports为各模拟主机的端口"""
+
+    def __init__(self, **options):
+        self.origin = FakeOrigin(**options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.ports = asyncio.run_coroutine_threadsafe(self.origin.start(), self.loop).result(5)
+
+    def url(self, path, host=0):
+        return f'http://127.0.0.1:{self.ports[host]}{path}'
+
+    async def _cancel_handlers(self):
+        """取消还在处理请求的连接（例如客户端已超时放弃的慢响应），避免关闭事件循环时留下未完成的任务"""
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.origin.close(), self.loop).result(5)
+        asyncio.run_coroutine_threadsafe(self._cancel_handlers(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+
+def closed_port():
+    """一个当前没有程序监听的本机端口（连接会被拒绝）"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def channels(*urls, group='未分类'):
+    """按地址生成频道列表，名称为 c0、c1……"""
+    return [Channel(f'c{i}', url, group) for i, url in enumerate(urls)]
+
+
+def run_engine(engine, channel_list, on_status=None):
+    """运行检测引擎，返回按到达顺序排列的结果列表"""
+    results = []
+    asyncio.run(engine.run(channel_list, results.append, on_status))
+    return results
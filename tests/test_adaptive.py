@@ -0,0 +1,76 @@
+"""自适应并发测试：AIMD上限的升降，以及检测引擎输出的调整轨迹"""
+import asyncio
+import unittest
+
+from support import OriginThread, channels, run_engine
+
+from stream_checker import AdaptiveLimit, ProbeEngine
+
+
+def window(limit, count, latency=0.01, congested=0):
+    """记录一个窗口的请求：count个，其中congested个为拥塞信号"""
+    for i in range(count):
+        limit.record(None if i < congested else latency, congested=i < congested)
+
+
+class AdaptiveLimitTest(unittest.TestCase):
+    def test_slow_start_then_additive_increase(self):
+        limit = AdaptiveLimit(2, 64, min_window=4)
+        window(limit, 4)
+        self.assertEqual(limit.limit, 4)
+        window(limit, 4)
+        self.assertEqual(limit.limit, 8)
+        # 拥塞比例超过阈值：乘以0.7，之后每个窗口只加1
+        window(limit, 8, congested=4)
+        self.assertEqual((limit.limit, limit.decreases), (5, 1))
+        window(limit, 5)
+        self.assertEqual(limit.limit, 6)
+        self.assertEqual(limit.summary(), {'limit': 6, 'min': 2, 'max': 8, 'decreases': 1})
+        self.assertEqual([point[1] for point in limit.history], [2, 4, 8, 5, 6])
+
+    def test_latency_increase_decreases_limit(self):
+        limit = AdaptiveLimit(8, 64, min_window=8)
+        window(limit, 8, latency=0.01)
+        self.assertEqual(limit.limit, 16)
+        window(limit, 16, latency=0.05)
+        self.assertEqual(limit.limit, 11)
+
+    def test_bounds(self):
+        limit = AdaptiveLimit(4, 6, min_limit=3, min_window=1)
+        window(limit, 4)
+        self.assertEqual(limit.limit, 6)
+        for _ in range(5):
+            window(limit, limit.limit, congested=limit.limit)
+        self.assertEqual(limit.limit, 3)
+
+    def test_acquire_waits_for_limit(self):
+        async def run():
+            limit = AdaptiveLimit(2, 4)
+            await limit.acquire()
+            await limit.acquire()
+            waiter = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            limit.release()
+            await asyncio.sleep(0)
+            self.assertTrue(waiter.done())
+            self.assertEqual(limit.in_use, 2)
+        asyncio.run(run())
+
+
+class AdaptiveEngineTest(unittest.TestCase):
+    def test_concurrency_stats(self):
+        origin = OriginThread(hosts=2, latency=5)
+        self.addCleanup(origin.close)
+        urls = [origin.url(f'/ok/{i}', i % 2) for i in range(60)]
+        engine = ProbeEngine(timeout=3, retry=False, adaptive=True, concurrency=32, per_host_limit=8)
+        results = run_engine(engine, channels(*urls))
+        self.assertEqual({r['status'] for r in results}, {'valid'})
+        stats = engine.concurrency_stats
+        self.assertLessEqual(stats['global']['max'], 32)
+        self.assertEqual(stats['global']['trajectory'][0], [0.0, 16])
+        self.assertEqual(len(stats['hosts']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
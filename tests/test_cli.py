@@ -0,0 +1,126 @@
+"""命令行模式测试：在子进程中运行，检查断点续检和Ctrl+C中断时的输出"""
+import glob
+import gzip
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from support import OriginThread, closed_port
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stream_checker.py')
+
+
+def _restore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+class CliTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.origin = OriginThread(hosts=1, latency=5)
+        self.addCleanup(self.origin.close)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write_playlist(self, urls):
+        path = self.path('playlist.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f'c{i},{url}\n' for i, url in enumerate(urls))
+        return path
+
+    def start(self, *args):
+        return subprocess.Popen([sys.executable, SCRIPT, *args, '-o', '-'], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, encoding='utf-8',
+                                preexec_fn=_restore_sigint)
+
+    def interrupt_after(self, process, count):
+        """读到count行结果后发送SIGINT，返回 (已输出的记录, 返回码)"""
+        records = [json.loads(process.stdout.readline()) for _ in range(count)]
+        process.send_signal(signal.SIGINT)
+        stdout, stderr = process.communicate(timeout=30)
+        records += [json.loads(line) for line in stdout.splitlines()]
+        return records, process.returncode
+
+    def run_cli(self, *args):
+        process = self.start(*args)
+        stdout, stderr = process.communicate(timeout=60)
+        return [json.loads(line) for line in stdout.splitlines()], process.returncode
+
+
+@unittest.skipIf(sys.platform == 'win32', '需要向子进程发送SIGINT')
+class ResumeTest(CliTestCase):
+    def test_resume_skips_journaled(self):
+        journal = self.path('journal.ndjson')
+        # 前3个频道很快完成，第4个一直没有响应，在它完成前中断
+        urls = [self.origin.url(f'/ok/{i}') for i in range(3)] + [self.origin.url('/timeout/3')]
+        playlist = self.write_playlist(urls)
+        process = self.start(playlist, '--journal', journal, '-t', '30', '--no-retry', '-c', '1')
+        records, code = self.interrupt_after(process, 3)
+        self.assertEqual(code, 130)
+        self.assertEqual([r['name'] for r in records], ['c0', 'c1', 'c2'])
+        with open(journal, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        # 源站关闭后续检：日志中的频道沿用记录的结果（仍为有效），只有剩下的频道真正检测
+        self.origin.close()
+        records, code = self.run_cli(playlist, '--journal', journal, '--resume', '-t', '3', '--no-retry')
+        self.assertEqual(code, 0)
+        statuses = {r['name']: r['status'] for r in records}
+        self.assertEqual(statuses, {'c0': 'valid', 'c1': 'valid', 'c2': 'valid', 'c3': 'invalid'})
+        # 全部完成后删除日志
+        self.assertFalse(os.path.exists(journal))
+
+    def test_journal_removed_after_completion(self):
+        journal = self.path('journal.ndjson')
+        playlist = self.write_playlist([self.origin.url('/ok/1'), f'http://127.0.0.1:{closed_port()}/x'])
+        records, code = self.run_cli(playlist, '--journal', journal, '-t', '3', '--no-retry')
+        self.assertEqual(code, 0)
+        self.assertEqual(len(records), 2)
+        self.assertFalse(os.path.exists(journal))
+
+
+@unittest.skipIf(sys.platform == 'win32', '需要向子进程发送SIGINT')
+class ExportTest(CliTestCase):
+    def report(self, export_dir):
+        self.assertEqual(glob.glob(os.path.join(export_dir, '*.part')), [])
+        paths = glob.glob(os.path.join(export_dir, '检测报告_*'))
+        self.assertEqual(len(paths), 1)
+        opener = gzip.open if paths[0].endswith('.gz') else open
+        with opener(paths[0], 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_interrupted_report(self):
+        export_dir = self.path('export')
+        urls = [self.origin.url('/ok/1'), self.origin.url('/404/2'), self.origin.url('/timeout/3')]
+        process = self.start(self.write_playlist(urls), '--export-dir', export_dir, '--gzip-report',
+                             '-t', '30', '--no-retry', '-c', '1')
+        records, code = self.interrupt_after(process, 2)
+        self.assertEqual(code, 130)
+        # 临时文件改名为正式文件，报告标记为中断，只包含已完成的频道
+        report = self.report(export_dir)
+        self.assertIs(report['interrupted'], True)
+        self.assertEqual(report['total_channels'], 2)
+        self.assertEqual([r['name'] for r in report['valid_list']], ['c0'])
+        self.assertEqual([r['name'] for r in report['invalid_list']], ['c1'])
+        with open(glob.glob(os.path.join(export_dir, '检测结果_*.ndjson'))[0], encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_completed_report(self):
+        export_dir = self.path('export')
+        records, code = self.run_cli(self.write_playlist([self.origin.url('/ok/1')]),
+                                     '--export-dir', export_dir, '-t', '3')
+        self.assertEqual(code, 0)
+        report = self.report(export_dir)
+        self.assertIs(report['interrupted'], False)
+        self.assertEqual(report['valid_channels'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""检测引擎测试：用本机模拟源站和小播放列表检查可观察的检测结果"""
+import unittest
+
+from support import OriginThread, channels, closed_port, run_engine
+
+from stream_checker import ProbeEngine
+
+
+class EngineTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.origin = OriginThread(hosts=2, latency=5, slow_latency=1500)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.origin.close()
+
+
+class BreakerTest(EngineTestCase):
+    def test_dead_host_short_circuits(self):
+        dead = closed_port()
+        urls = [f'http://127.0.0.1:{dead}/ok/{i}' for i in range(6)] + [self.origin.url('/ok/1')]
+        engine = ProbeEngine(timeout=3, retry=False, concurrency=1, per_host_limit=1, breaker_threshold=2)
+        results = {r['url']: r for r in run_engine(engine, channels(*urls))}
+        errors = [results[url]['error'] for url in urls[:6]]
+        # 前两次真正连接失败，之后的频道直接判定主机不可达
+        self.assertFalse(any('主机不可达' in error for error in errors[:2]))
+        self.assertTrue(all('主机不可达' in error for error in errors[2:]))
+        self.assertEqual(results[urls[-1]]['status'], 'valid')
+        self.assertEqual(engine.health.open_hosts, [('http', '127.0.0.1', dead)])
+
+    def test_breaker_disabled(self):
+        dead = closed_port()
+        urls = [f'http://127.0.0.1:{dead}/ok/{i}' for i in range(4)]
+        engine = ProbeEngine(timeout=3, retry=False, concurrency=1, breaker_threshold=0)
+        results = run_engine(engine, channels(*urls))
+        self.assertEqual(len(results), 4)
+        self.assertFalse(any('主机不可达' in r['error'] for r in results))
+
+
+class DedupTest(EngineTestCase):
+    def test_fan_out(self):
+        a, b = self.origin.url('/ok/1'), self.origin.url('/404/2')
+        # 规范化后相同（协议大小写、#片段）的地址也算重复
+        urls = [a, b, a.replace('http:', 'HTTP:') + '#frag', a]
+        engine = ProbeEngine(timeout=3, retry=False)
+        results = {r['name']: r for r in run_engine(engine, channels(*urls))}
+        self.assertEqual(engine.dedup_stats, {'total': 4, 'unique': 2, 'duplicates': 2})
+        self.assertEqual(len(results), 4)
+        # 重复地址的频道各自得到结果，检测字段与第一次检测相同
+        self.assertEqual({results[name]['status'] for name in ('c0', 'c2', 'c3')}, {'valid'})
+        self.assertEqual(results['c3']['response_time'], results['c0']['response_time'])
+        self.assertEqual((results['c1']['status'], results['c1']['status_code']), ('invalid', 404))
+
+    def test_no_dedup(self):
+        a = self.origin.url('/ok/1')
+        engine = ProbeEngine(timeout=3, retry=False, dedup=False)
+        self.assertEqual(len(run_engine(engine, channels(a, a, a))), 3)
+        self.assertEqual(engine.dedup_stats['duplicates'], 0)
+
+    def test_window_evicts_old_results(self):
+        a, b, c = (self.origin.url(f'/ok/{i}') for i in range(3))
+        # 并发为1时第4个频道取出时c还在检测，窗口为1时a的结果已被b挤出，要重新检测
+        engine = ProbeEngine(timeout=3, retry=False, concurrency=1, dedup_window=1)
+        self.assertEqual(len(run_engine(engine, channels(a, b, c, a))), 4)
+        self.assertEqual(engine.dedup_stats, {'total': 4, 'unique': 4, 'duplicates': 0})
+        engine = ProbeEngine(timeout=3, retry=False, concurrency=1)
+        run_engine(engine, channels(a, b, c, a))
+        self.assertEqual(engine.dedup_stats, {'total': 4, 'unique': 3, 'duplicates': 1})
+
+
+class TwoPassTest(EngineTestCase):
+    def test_deferred_channel_recovered(self):
+        urls = [self.origin.url('/ok/1'), self.origin.url('/slow/2'), self.origin.url('/404/3')]
+        # 源站1.5秒才响应：第一轮1秒超时暂缓，第二轮用完整的3秒超时恢复；404不是暂时性失败，不进入第二轮
+        engine = ProbeEngine(timeout=3, first_pass_timeout=1, retry_delay=0)
+        statuses = []
+        results = {r['name']: r for r in run_engine(engine, channels(*urls), statuses.append)}
+        self.assertEqual({name: r['tier'] for name, r in results.items()}, {'c0': 1, 'c1': 2, 'c2': 1})
+        self.assertEqual(results['c1']['status'], 'valid')
+        self.assertEqual(results['c2']['status_code'], 404)
+        self.assertEqual(engine.tier_stats, {'first_pass': 2, 'deferred': 1, 'second_pass': 1, 'recovered': 1})
+        self.assertIn('第二轮检测完成: 1/1 个频道恢复正常', statuses)
+
+    def test_single_pass_without_retry(self):
+        engine = ProbeEngine(timeout=1, retry=False)
+        results = run_engine(engine, channels(self.origin.url('/slow/4')))
+        self.assertEqual((results[0]['status'], results[0]['tier']), ('invalid', 1))
+        self.assertEqual(engine.tier_stats['deferred'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""HTTP客户端测试：在本机启动测试服务器，检查chunked解码、keep-alive复用、重定向、HEAD和代理"""
+import asyncio
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stream_checker
+from stream_checker import ConnectionPool, http_request, normalize_url
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=()):
+        self.server.requests.append((self.command, self.path, self.client_address[1], dict(self.headers)))
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self.path == '/chunked':
+            self.server.requests.append((self.command, self.path, self.client_address[1], dict(self.headers)))
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (b'hello ', b'chunked ', b'world'):
+                self.wfile.write(b'%x;ext=1\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\nX-Trailer: 1\r\n\r\n')
+        elif self.path == '/redirect':
+            self._send(302, headers=[('Location', '/ok')])
+        elif self.path == '/loop':
+            self._send(302, headers=[('Location', '/loop')])
+        elif self.path == '/rtsp':
+            host = self.headers['Host'].split(':')[0]
+            self._send(302, headers=[('Location', f'rtsp://{host}:{self.server.server_address[1]}/live')])
+        else:
+            self._send(200, b'ok:' + self.path.encode('utf-8'))
+
+    def do_CONNECT(self):
+        self._send(403)
+
+
+class HttpClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        cls.server.requests = []
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+        environ = {name: value for name, value in os.environ.items() if not name.lower().endswith('_proxy')}
+        patcher = mock.patch.dict(os.environ, environ, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, stream_checker, '_proxies', None)
+        stream_checker._proxies = None
+
+    def fetch(self, method, paths, pool=True, **kwargs):
+        """依次请求各路径，返回 [(状态码, 响应体)]"""
+        async def run():
+            connection_pool = ConnectionPool() if pool else None
+            results = []
+            try:
+                for path in paths:
+                    url = path if '://' in path else self.base + path
+                    response = await http_request(method, url, connection_pool, timeout=5, **kwargs)
+                    try:
+                        results.append((response.status_code, await response.read()))
+                    finally:
+                        response.close()
+            finally:
+                if connection_pool is not None:
+                    connection_pool.close()
+            return results
+        return asyncio.run(run())
+
+    def test_chunked_body(self):
+        self.assertEqual(self.fetch('GET', ['/chunked', '/ok']),
+                         [(200, b'hello chunked world'), (200, b'ok:/ok')])
+        # 读完chunked响应（含trailer）后连接可以继续复用
+        self.assertEqual(len({port for _, _, port, _ in self.server.requests}), 1)
+
+    def test_chunked_partial_read(self):
+        async def run():
+            response = await http_request('GET', self.base + '/chunked', timeout=5)
+            try:
+                return await response.read(4), await response.read()
+            finally:
+                response.close()
+        self.assertEqual(asyncio.run(run()), (b'hell', b'o chunked world'))
+
+    def test_keep_alive_reuse(self):
+        self.assertEqual(self.fetch('GET', ['/a', '/b', '/c']),
+                         [(200, b'ok:/a'), (200, b'ok:/b'), (200, b'ok:/c')])
+        self.assertEqual(len({port for _, _, port, _ in self.server.requests}), 1)
+
+    def test_no_pool_closes_connection(self):
+        self.fetch('GET', ['/a', '/b'], pool=False)
+        self.assertEqual(len({port for _, _, port, _ in self.server.requests}), 2)
+        self.assertEqual(self.server.requests[0][3].get('Connection'), 'close')
+
+    def test_redirect(self):
+        self.assertEqual(self.fetch('GET', ['/redirect']), [(200, b'ok:/ok')])
+        self.assertEqual([path for _, path, _, _ in self.server.requests], ['/redirect', '/ok'])
+        self.assertEqual(self.fetch('GET', ['/redirect'], allow_redirects=False)[0][0], 302)
+
+    def test_redirect_limit(self):
+        with self.assertRaises(ConnectionError):
+            self.fetch('GET', ['/loop'])
+        self.assertEqual(len(self.server.requests), stream_checker.MAX_REDIRECTS + 1)
+
+    def test_redirect_to_other_scheme(self):
+        # 不能用HTTP请求去连接rtsp://等其他协议的地址
+        with self.assertRaisesRegex(ValueError, '重定向到不支持的协议: rtsp'):
+            self.fetch('GET', ['/rtsp'])
+        self.assertEqual([path for _, path, _, _ in self.server.requests], ['/rtsp'])
+        with self.assertRaisesRegex(ValueError, '不支持的协议: rtsp'):
+            self.fetch('GET', ['rtsp://127.0.0.1/live'])
+
+    def test_head_has_no_body(self):
+        # HEAD响应带Content-Length但没有响应体，不能阻塞读取，也不能影响下一个请求
+        self.assertEqual(self.fetch('HEAD', ['/a', '/b']), [(200, b''), (200, b'')])
+        self.assertEqual(self.fetch('GET', ['/a']), [(200, b'ok:/a')])
+        self.assertEqual(len({port for _, _, port, _ in self.server.requests[:2]}), 1)
+
+    def test_http_proxy(self):
+        os.environ['HTTP_PROXY'] = 'http://user:p%40ss@' + self.base.split('://', 1)[1]
+        self.assertEqual(self.fetch('GET', ['http://stream.invalid:8080/live?id=1']),
+                         [(200, b'ok:http://stream.invalid:8080/live?id=1')])
+        headers = self.server.requests[0][3]
+        self.assertEqual(headers['Host'], 'stream.invalid:8080')
+        self.assertEqual(headers['Proxy-Authorization'], 'Basic dXNlcjpwQHNz')
+
+    def test_no_proxy(self):
+        os.environ['HTTP_PROXY'] = 'http://127.0.0.1:9'
+        os.environ['NO_PROXY'] = '127.0.0.1'
+        self.assertEqual(self.fetch('GET', ['/a']), [(200, b'ok:/a')])
+
+    @unittest.skipUnless(hasattr(asyncio.StreamWriter, 'start_tls'), '需要Python 3.11+')
+    def test_https_proxy_tunnel_refused(self):
+        os.environ['HTTPS_PROXY'] = self.base
+        with self.assertRaisesRegex(ConnectionError, '403'):
+            self.fetch('GET', ['https://stream.invalid/live'])
+        self.assertEqual(self.server.requests[0][:2], ('CONNECT', 'stream.invalid:443'))
+
+
+class NormalizeUrlTest(unittest.TestCase):
+    def test_case_and_default_port(self):
+        self.assertEqual(normalize_url('HTTP://Example.COM:80/Live.m3u8'), 'http://example.com/Live.m3u8')
+        self.assertEqual(normalize_url('https://example.com:443'), 'https://example.com/')
+        self.assertEqual(normalize_url('https://example.com:8443/a'), 'https://example.com:8443/a')
+        self.assertEqual(normalize_url('rtsp://Cam.local:554/s'), 'rtsp://cam.local/s')
+
+    def test_fragment_and_dot_segments(self):
+        self.assertEqual(normalize_url(' http://h/a/./b/../c.ts#frag '), 'http://h/a/c.ts')
+
+    def test_userinfo_kept(self):
+        self.assertEqual(normalize_url('http://User:Pw@HOST:80/x'), 'http://User:Pw@host/x')
+
+    def test_strip_params(self):
+        url = 'http://h/live.m3u8?id=5&Token=abc&&t=1'
+        self.assertEqual(normalize_url(url), 'http://h/live.m3u8?id=5&Token=abc&&t=1')
+        self.assertEqual(normalize_url(url, strip_params=('token', 't')), 'http://h/live.m3u8?id=5')
+
+
+if __name__ == '__main__':
+    unittest.main()
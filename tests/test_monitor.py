@@ -0,0 +1,77 @@
+"""常驻监控测试：各批共用检测引擎，HTTP接口的ETag/304"""
+import asyncio
+import http.client
+import json
+import threading
+import time
+import unittest
+
+from support import OriginThread, channels, closed_port
+
+from stream_checker import ChannelMonitor
+
+
+class MonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.origin = OriginThread(hosts=1, latency=5)
+        self.addCleanup(self.origin.close)
+        dead = closed_port()
+        self.urls = [self.origin.url('/ok/1'), self.origin.url('/404/2'),
+                     f'http://127.0.0.1:{dead}/a', f'http://127.0.0.1:{dead}/b']
+        self.monitor = ChannelMonitor(channels(*self.urls), interval=1, timeout=3, retry=False,
+                                      breaker_threshold=2, concurrency=1)
+        self.addCleanup(self.monitor.close)
+        self.port = self.monitor.serve()
+
+    def run_rounds(self, rounds):
+        """在后台线程中运行监控，完成rounds轮后停止"""
+        thread = threading.Thread(target=asyncio.run, args=(self.monitor.run(),), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 20
+        while self.monitor.round < rounds and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.monitor.stop()
+        thread.join(5)
+        self.assertGreaterEqual(self.monitor.round, rounds)
+
+    def get(self, path, etag=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            connection.request('GET', path, headers={'If-None-Match': etag} if etag else {})
+            response = connection.getresponse()
+            return response.status, response.getheader('ETag'), response.read()
+        finally:
+            connection.close()
+
+    def test_engine_reused_across_rounds(self):
+        engine = self.monitor.engine
+        self.run_rounds(2)
+        self.assertIs(self.monitor.engine, engine)
+        # 第一轮两次连接失败后熔断，熔断状态保留到之后的轮次，不再逐个连接
+        status, etag, body = self.get('/status.json')
+        errors = [record['error'] for record in json.loads(body)['channels'] if record['url'] in self.urls[2:]]
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all('主机不可达' in error for error in errors))
+
+    def test_etag(self):
+        self.run_rounds(1)
+        status, playlist_etag, body = self.get('/playlist.m3u')
+        self.assertEqual(status, 200)
+        self.assertIn(self.urls[0].encode(), body)
+        self.assertNotIn(self.urls[1].encode(), body)
+        self.assertEqual(self.get('/playlist.m3u', playlist_etag)[:2], (304, playlist_etag))
+        status_etag = self.get('/status.json')[1]
+
+        # 再检测一轮，状态没有变化：播放列表版本不变，状态接口（含检测时间）有新版本
+        self.run_rounds(2)
+        self.assertEqual(self.get('/playlist.m3u', playlist_etag)[0], 304)
+        status, etag, body = self.get('/status.json', status_etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(etag, status_etag)
+        summary = json.loads(body)
+        self.assertEqual((summary['valid_channels'], summary['invalid_channels']), (1, 3))
+        self.assertEqual(self.get('/missing')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
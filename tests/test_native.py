@@ -0,0 +1,155 @@
+"""原生协议探测测试：在本机启动RTSP、RTMP服务器和UDP发送端，检查RTSP/RTMP/UDP/RTP地址的检测结果"""
+import asyncio
+import socket
+import unittest
+
+from support import channels
+
+from stream_checker import RTMP_HANDSHAKE_SIZE, ProbeEngine
+
+SDP = b'v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=live\r\nm=video 0 RTP/AVP 96\r\n'
+TS_PACKET = b'\x47' + bytes(187)
+
+
+class RtspServer:
+    """按路径应答的RTSP服务器：/live 有媒体流，/empty 描述中没有媒体流，/auth DESCRIBE需要认证，其他404"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        method, target = (await reader.readline()).decode('latin-1').split()[:2]
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        path = target.split('/', 3)[-1]
+        self.requests.append((method, path))
+        body = b''
+        if method == 'OPTIONS':
+            status, headers = '200 OK', ['Public: OPTIONS, DESCRIBE, SETUP, PLAY']
+        elif path == 'auth':
+            status, headers = '401 Unauthorized', ['WWW-Authenticate: Digest realm="cam", nonce="1"']
+        elif path in ('live', 'empty'):
+            status, headers = '200 OK', ['Content-Type: application/sdp']
+            body = SDP if path == 'live' else SDP.split(b'm=')[0]
+        else:
+            status, headers = '404 Not Found', []
+        head = [f'RTSP/1.0 {status}', 'CSeq: 1', *headers, f'Content-Length: {len(body)}']
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        writer.close()
+
+
+async def rtmp_server(version=3):
+    """完成RTMP握手的服务器，S0为version"""
+    async def handle(reader, writer):
+        c0c1 = await reader.readexactly(1 + RTMP_HANDSHAKE_SIZE)
+        writer.write(bytes([version]) + bytes(RTMP_HANDSHAKE_SIZE) + c0c1[1:])
+        await writer.drain()
+        try:
+            await reader.readexactly(RTMP_HANDSHAKE_SIZE)
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def probe(*urls):
+    """在当前事件循环中用检测引擎检测urls，返回 {名称: 结果}"""
+    results = []
+    await ProbeEngine(timeout=2, retry=False).run(channels(*urls), results.append)
+    return {r['name']: r for r in results}
+
+
+class RtspTest(unittest.TestCase):
+    def check(self, *paths):
+        rtsp = RtspServer()
+
+        async def run():
+            port = await rtsp.start()
+            try:
+                return await probe(*(f'rtsp://127.0.0.1:{port}/{path}' for path in paths))
+            finally:
+                rtsp.server.close()
+                await rtsp.server.wait_closed()
+        return asyncio.run(run()), rtsp.requests
+
+    def test_describe(self):
+        results, requests = self.check('live', 'missing', 'empty')
+        self.assertEqual((results['c0']['status'], results['c0']['status_code']), ('valid', 200))
+        self.assertEqual((results['c1']['status'], results['c1']['error']), ('invalid', 'RTSP 404'))
+        self.assertEqual(results['c2']['error'], 'RTSP描述中没有媒体流')
+        self.assertEqual(sorted(requests), [('DESCRIBE', 'empty'), ('DESCRIBE', 'live'), ('DESCRIBE', 'missing')])
+
+    def test_options_fallback(self):
+        # DESCRIBE需要认证时改发OPTIONS，服务器正常应答即为有效
+        results, requests = self.check('auth')
+        self.assertEqual((results['c0']['status'], results['c0']['status_code']), ('valid', 200))
+        self.assertEqual(requests, [('DESCRIBE', 'auth'), ('OPTIONS', 'auth')])
+
+
+class RtmpTest(unittest.TestCase):
+    def check(self, version):
+        async def run():
+            server, port = await rtmp_server(version)
+            try:
+                return (await probe(f'rtmp://127.0.0.1:{port}/live/stream'))['c0']
+            finally:
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def test_handshake(self):
+        result = self.check(3)
+        self.assertEqual((result['status'], result['status_code']), ('valid', 200))
+
+    def test_wrong_version(self):
+        result = self.check(6)
+        self.assertEqual((result['status'], result['error']), ('invalid', 'RTMP握手失败: 服务器版本 6'))
+
+
+class DatagramTest(unittest.TestCase):
+    def check(self, scheme, payload):
+        port = free_udp_port()
+
+        async def sender():
+            # 检测开始监听后才能收到，反复发送直到检测结束
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                while True:
+                    sock.sendto(payload, ('127.0.0.1', port))
+                    await asyncio.sleep(0.05)
+
+        async def run():
+            task = asyncio.ensure_future(sender())
+            try:
+                return (await probe(f'{scheme}://127.0.0.1:{port}'))['c0']
+            finally:
+                task.cancel()
+        return asyncio.run(run())
+
+    def test_udp_ts(self):
+        result = self.check('udp', TS_PACKET * 7)
+        self.assertEqual((result['status'], result['status_code']), ('valid', 200))
+
+    def test_rtp(self):
+        header = bytes([0x80, 33]) + (1).to_bytes(2, 'big') + bytes(8)
+        self.assertEqual(self.check('rtp', header + TS_PACKET * 7)['status'], 'valid')
+        self.assertEqual(self.check('rtp', TS_PACKET)['error'], '收到的不是RTP数据包')
+
+    def test_udp_not_ts(self):
+        self.assertEqual(self.check('udp', b'hello')['error'], '收到的数据不是MPEG-TS流')
+
+
+if __name__ == '__main__':
+    unittest.main()
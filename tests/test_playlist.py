@@ -0,0 +1,72 @@
+"""直播源解析测试：M3U解析后再导出应与原文一致"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_checker import DEFAULT_GROUP, PlaylistParser
+
+PLAYLIST = '''#EXTM3U x-tvg-url="http://epg.example/e.xml"
+#EXTINF:-1 tvg-id="cctv1" tvg-logo="http://logo.example/1.png" group-title="央视,频道",CCTV-1 综合
+http://a.example/cctv1.m3u8
+#EXTINF:-1 tvg-id=cctv2 catchup=append tvg-name="CCTV 2",CCTV-2
+#EXTVLCOPT:http-user-agent=Mozilla/5.0
+http://a.example/cctv2.m3u8
+#EXTINF:0 tvg-chno=3,Three
+http://a.example/3.m3u8
+#EXTINF:-1,Plain
+#EXTGRP:Music
+http://a.example/plain.m3u8
+#EXTINF:abc,Odd Duration
+http://a.example/odd.m3u8
+'''
+
+
+def parse(text):
+    parser = PlaylistParser(text.splitlines(True))
+    return parser, list(parser)
+
+
+class ExtinfRoundTripTest(unittest.TestCase):
+    def test_round_trip(self):
+        parser, channels = parse(PLAYLIST)
+        exported = parser.header + '\n' + ''.join(channel.to_m3u() for channel in channels)
+        self.assertEqual(exported, PLAYLIST)
+        # 导出的结果再解析一次，内容不变
+        parser, again = parse(exported)
+        self.assertEqual([c.to_m3u() for c in again], [c.to_m3u() for c in channels])
+
+    def test_header_before_iteration(self):
+        # 流式检测时导出器在解析开始前创建，文件头必须在创建解析器后就能取得
+        parser = PlaylistParser(PLAYLIST.splitlines(True))
+        self.assertEqual(parser.header, '#EXTM3U x-tvg-url="http://epg.example/e.xml"')
+
+    def test_attributes_without_duration(self):
+        _, (channel,) = parse('#EXTINF:tvg-id="x" group-title="News",Name\nhttp://h/x\n')
+        self.assertEqual(channel.duration, '-1')
+        self.assertEqual(channel.group, 'News')
+        self.assertEqual(channel.attributes, [('tvg-id', 'x'), ('group-title', 'News')])
+        self.assertEqual(channel.extinf(), '#EXTINF:-1 tvg-id="x" group-title="News",Name')
+
+    def test_fields(self):
+        _, channels = parse(PLAYLIST)
+        self.assertEqual([c.group for c in channels], ['央视,频道', DEFAULT_GROUP, DEFAULT_GROUP, 'Music', DEFAULT_GROUP])
+        self.assertEqual([c.duration for c in channels], ['-1', '-1', '0', '-1', 'abc'])
+        self.assertEqual(channels[1].attributes, [('tvg-id', 'cctv2'), ('catchup', 'append'), ('tvg-name', 'CCTV 2')])
+        self.assertEqual(channels[1].directives, ('#EXTVLCOPT:http-user-agent=Mozilla/5.0',))
+
+    def test_extra_attrs(self):
+        _, channels = parse(PLAYLIST)
+        self.assertEqual(channels[1].extinf({'tvg-name': 'New', 'response-time': '12'}),
+                         '#EXTINF:-1 tvg-id=cctv2 catchup=append tvg-name="New" response-time="12",CCTV-2')
+        self.assertEqual(channels[3].extinf({'response-time': '5'}), '#EXTINF:-1 response-time="5",Plain')
+
+    def test_group_title_added(self):
+        _, (channel,) = parse('名称,http://h/x\n')
+        channel.group = 'Sports'
+        self.assertEqual(channel.extinf(), '#EXTINF:-1 group-title="Sports",名称')
+
+
+if __name__ == '__main__':
+    unittest.main()
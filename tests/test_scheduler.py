@@ -0,0 +1,85 @@
+"""调度测试：按主机轮转、单主机并发上限，以及分组优先和上次有效优先的检测顺序"""
+import asyncio
+import unittest
+
+from support import OriginThread, channels, run_engine
+
+from stream_checker import HostScheduler, ProbeEngine, normalize_url
+
+
+def drain(scheduler):
+    """不限并发地取出全部频道，返回名称顺序"""
+    async def run():
+        names = []
+        while True:
+            channel = await scheduler.next()
+            if channel is None:
+                return names
+            names.append(channel['name'])
+    return asyncio.run(run())
+
+
+class HostSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        # 前三个频道在主机a上，后两个在主机b上
+        self.channels = channels('http://a/1', 'http://a/2', 'http://a/3', 'http://b/1', 'http://b/2')
+
+    def test_round_robin(self):
+        self.assertEqual(drain(HostScheduler(self.channels)), ['c0', 'c3', 'c1', 'c4', 'c2'])
+        self.assertEqual(drain(HostScheduler(self.channels, interleave=False)), ['c0', 'c1', 'c2', 'c3', 'c4'])
+
+    def test_window_limits_read_ahead(self):
+        # 迭代器只预读2个频道，轮转范围限于窗口内
+        scheduler = HostScheduler(iter(self.channels), window=2)
+        self.assertEqual(drain(scheduler), ['c0', 'c1', 'c2', 'c3', 'c4'])
+
+    def test_per_host_limit(self):
+        async def run():
+            scheduler = HostScheduler(self.channels, per_host_limit=1)
+            first = await scheduler.next()
+            scheduler.started(first)
+            second = await scheduler.next()
+            scheduler.started(second)
+            # 两个主机都有一个进行中的检测，下一个频道要等其中之一结束
+            waiter = asyncio.ensure_future(scheduler.next())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            scheduler.done(second)
+            third = await asyncio.wait_for(waiter, 1)
+            return [channel['name'] for channel in (first, second, third)]
+        self.assertEqual(asyncio.run(run()), ['c0', 'c3', 'c4'])
+
+    def test_priority_before_round_robin(self):
+        priority = {'c1': 0, 'c4': 0}
+        scheduler = HostScheduler(self.channels, priority=lambda channel: priority.get(channel['name'], 1))
+        self.assertEqual(drain(scheduler), ['c1', 'c4', 'c0', 'c3', 'c2'])
+
+
+class PriorityEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.origin = OriginThread(hosts=1, latency=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.origin.close()
+
+    def order(self, channel_list, **options):
+        engine = ProbeEngine(timeout=3, retry=False, concurrency=1, **options)
+        return [r['name'] for r in run_engine(engine, channel_list)]
+
+    def test_priority_groups(self):
+        channel_list = channels(*(self.origin.url(f'/ok/{i}') for i in range(4)))
+        for channel, group in zip(channel_list, ('体育', '新闻', '央视', '新闻')):
+            channel.group = group
+        self.assertEqual(self.order(channel_list, priority_groups=('央视', '新闻')), ['c2', 'c1', 'c3', 'c0'])
+
+    def test_prefer_valid(self):
+        urls = [self.origin.url(f'/ok/{i}') for i in range(3)]
+        prior = {normalize_url(urls[0]): 'invalid', normalize_url(urls[2]): 'valid'}
+        # 上次有效的先检测，没有记录的其次，上次无效的最后
+        self.assertEqual(self.order(channels(*urls), prefer_valid=True, prior_status=prior), ['c2', 'c1', 'c0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
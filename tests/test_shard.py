@@ -0,0 +1,49 @@
+"""多进程分片检测测试：与单进程检测结果一致，自适应并发统计按分片给出"""
+import unittest
+
+from support import OriginThread, channels, closed_port, run_engine
+
+from stream_checker import ProbeEngine, ShardedProbeEngine
+
+
+class ShardTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.origin = OriginThread(hosts=3, latency=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.origin.close()
+
+    def test_same_results_as_single_process(self):
+        urls = []
+        for host in range(3):
+            urls += [self.origin.url(f'/ok/{host}', host), self.origin.url(f'/404/{host}', host),
+                     self.origin.url(f'/redirect/1/{host}', host), self.origin.url(f'/hls/{host}/index.m3u8', host)]
+        urls += [f'http://127.0.0.1:{closed_port()}/x', urls[0]]
+        channel_list = channels(*urls)
+
+        def outcome(engine):
+            return {r['name']: (r['status'], r.get('status_code')) for r in run_engine(engine, channel_list)}
+
+        single = outcome(ProbeEngine(timeout=3, retry=False))
+        sharded_engine = ShardedProbeEngine(workers=2, timeout=3, retry=False)
+        self.assertEqual(outcome(sharded_engine), single)
+        self.assertEqual(len(single), len(urls))
+        self.assertEqual(sharded_engine.dedup_stats, {'total': len(urls), 'unique': len(urls) - 1, 'duplicates': 1})
+
+    def test_merge_concurrency(self):
+        def shard(limit, low, high, decreases, host):
+            return {'global': {'limit': limit, 'min': low, 'max': high, 'decreases': decreases,
+                               'trajectory': [[0.0, 8]]},
+                    'hosts': {host: {'limit': 4}}}
+
+        merged = ShardedProbeEngine._merge_concurrency({1: shard(6, 4, 12, 2, 'b'), 0: shard(10, 8, 16, 0, 'a')})
+        # 最低/最高上限不相加，只有最终上限和降低次数给出合计
+        self.assertEqual(merged['global'], {'final_limit_sum': 16, 'decreases_sum': 2})
+        self.assertEqual([(s['shard'], s['min'], s['max']) for s in merged['shards']], [(1, 8, 16), (2, 4, 12)])
+        self.assertEqual(sorted(merged['hosts']), ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""结果库测试：增量检测沿用稳定结果，地址格式错误的频道不影响整轮检测"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import OriginThread, channels, run_engine
+
+from stream_checker import ProbeEngine, ResultStore
+
+
+class IncrementalTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.origin = OriginThread(hosts=1, latency=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.origin.close()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'results.db')
+
+    def run_once(self, channel_list):
+        store = ResultStore(self.path, max_age=3600, stable_runs=3)
+        try:
+            results = run_engine(ProbeEngine(timeout=3, retry=False, store=store), channel_list)
+        finally:
+            store.close()
+        return {r['name']: r for r in results}, store.skipped
+
+    def test_stable_results_reused(self):
+        channel_list = channels(self.origin.url('/ok/1'), self.origin.url('/404/2'), 'http://[::1/bad')
+        for run in range(3):
+            results, skipped = self.run_once(channel_list)
+            self.assertEqual(skipped, 0, f'第{run + 1}轮')
+            self.assertFalse(any(r.get('cached') for r in results.values()))
+        # 连续3次状态一致，第4轮直接沿用；格式错误的地址每轮都照常判定为无效
+        results, skipped = self.run_once(channel_list)
+        self.assertEqual(skipped, 2)
+        self.assertTrue(results['c0']['cached'])
+        self.assertEqual(results['c0']['status'], 'valid')
+        self.assertEqual((results['c1']['status'], results['c1']['status_code']), ('invalid', 404))
+        self.assertEqual(results['c2']['status'], 'invalid')
+        self.assertNotIn('cached', results['c2'])
+
+    def test_unstable_results_rechecked(self):
+        url = self.origin.url('/ok/3')
+        store = ResultStore(self.path, max_age=3600, stable_runs=3)
+        for status in ('valid', 'invalid', 'valid', 'valid', 'valid'):
+            # 状态反复变化过两次，不再视为稳定
+            store.record({'name': 'x', 'url': url, 'group': '未分类', 'status': status})
+            store.flush()
+        store.close()
+        results, skipped = self.run_once(channels(url))
+        self.assertEqual(skipped, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()